@@ -0,0 +1,14 @@
+"""
+Gunicorn configuration of ASGI deployment: uvicorn workers serving cookee.asgi, with async variants of listing and
+detail views. Use it instead of the WSGI web process of Procfile:
+
+    web: gunicorn cookee.asgi:application -c cookee/gunicorn_asgi.py --log-file -
+"""
+import os
+
+# Database calls of async views run in the default executor of worker event loop, min(32, CPUs + 4) threads, each
+# with its own database connection.
+os.environ.setdefault('ASYNC_VIEWS', 'True')
+
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 
 from pathlib import Path
 import os
+import dj_database_url
 import django_on_heroku
 from dotenv import load_dotenv
 load_dotenv()
@@ -27,6 +28,10 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = os.getenv('SECRET_KEY')
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = (os.getenv('DEBUG') == 'True')
+# Run shopping lists and .pdf files creation in `manage.py run_workers` processes.
+BACKGROUND_JOBS = (os.getenv('BACKGROUND_JOBS') == 'True')
+# Serve listing and detail pages with async views, for ASGI workers (gunicorn -c cookee/gunicorn_asgi.py).
+ASYNC_VIEWS = (os.getenv('ASYNC_VIEWS') == 'True')
 ALLOWED_HOSTS = ['127.0.0.1', '.herokuapp.com', 'cookee.herokuapp.com']
 
 
@@ -44,11 +49,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'main_app.middleware.RequestInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main_app.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -94,6 +101,25 @@ DATABASES = {
     }
 }
 
+# Read replica: set REPLICA_DATABASE_URL, e.g. to a Heroku follower database, to send reads of read-only views and
+# background .pdf files rendering to it. Sessions which wrote stay on primary for REPLICA_STICKINESS seconds.
+
+DATABASE_ROUTERS = ['main_app.routers.ReplicaRouter']
+
+REPLICA_STICKINESS = int(os.getenv('REPLICA_STICKINESS', 5))
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Only rendered fragments and .pdf files are cached. Their versions and page validators are read from the database,
+# so a per-process cache, e.g. the default LocMemCache, never serves stale data with many workers, only hits less.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'cookee'),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -140,9 +166,82 @@ MEDIA_URL = os.getenv('MEDIA_URL', default='media/')
 
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
+# Listing views keyset pagination
+
+LIST_PAGE_SIZE = int(os.getenv('LIST_PAGE_SIZE', 50))
+
+LIST_MAX_PAGE_SIZE = 200
+
+PRODUCT_SEARCH_LIMIT = 20
+
+# Cached recipe rows, product rows and plan day blocks, invalidated by versions bumped by signals
+
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv('FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24))
+
+# Conditional GET: ETags of pages change with the release, so pages rendered by previous code are not reused
+
+ETAG_VERSION = os.getenv('HEROKU_RELEASE_VERSION', '')
+
+# Request instrumentation: Server-Timing header, JSON log line and query budgets per url name
+
+SERVER_TIMING = (os.getenv('SERVER_TIMING', 'True') == 'True')
+
+QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', 30))
+
+# Writes bump fragment versions stored in the database and first reads create them, which delete and plan pages count.
+# Pages read fragment versions from the database, creating missing ones on first read, and writes bump them.
+QUERY_BUDGETS = {
+    'products': 12,
+    'recipes': 10,
+    'plans': 10,
+    'persons': 10,
+    'plan-details': 22,
+    'recipe-details': 20,
+    'shopping-list': 20,
+    'shopping-list-details': 20,
+}
+
+N_PLUS_ONE_THRESHOLD = 5
+
+N_PLUS_ONE_TOP = 3
+
+# Benchmarks: directory of saved JSON baselines and allowed relative regression
+
+BENCHMARK_DIR = Path(os.getenv('BENCHMARK_DIR', BASE_DIR / 'benchmarks'))
+
+BENCHMARK_THRESHOLD = float(os.getenv('BENCHMARK_THRESHOLD', 0.25))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'main_app.middleware': {
+            'handlers': ['console'],
+            'level': os.getenv('INSTRUMENTATION_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-django_on_heroku.settings(locals())
+django_on_heroku.settings(locals(), logging=False)
+# WhiteNoise middleware added by django_on_heroku is sync only and would put async views on the sync path under ASGI.
+MIDDLEWARE = [
+    'main_app.middleware.AsyncWhiteNoiseMiddleware' if middleware == 'whitenoise.middleware.WhiteNoiseMiddleware'
+    else middleware for middleware in MIDDLEWARE
+]
+# Added after django_on_heroku, which replaces DATABASES['default'] with the one from DATABASE_URL.
+if os.getenv('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = dj_database_url.parse(os.getenv('REPLICA_DATABASE_URL'),
+                                                 conn_max_age=DATABASES['default'].get('CONN_MAX_AGE', 0))
+    # Test databases are not created for the replica, its connections use the primary test database.
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
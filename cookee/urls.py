@@ -13,12 +13,23 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
+from main_app import async_views
 from main_app.views import HomeView, LoginView, LogoutView, AddUserView, ProductsView, RecipesView, PlansView,\
     PersonsView, RecipeCreate, ProductCreate, PersonCreate, PlanCreate, ProductDelete, RecipeDelete, MealDelete,\
     PlanDelete, PersonDelete, ProductUpdate, RecipeUpdate, PersonUpdate, PlanUpdate, PlanDetailsView,\
-    RecipeDetailsView, ShoppingListCreate, ShoppingListPdf, PlanDayCaloriesCompletion
+    RecipeDetailsView, ShoppingListCreate, ShoppingListPdf, PlanDayCaloriesCompletion, JobStatusView, JobDownloadView,\
+    ProductSearchView, RecipeSearchView, PlanAutoFill, PlanBalance, ShoppingListDetails
+
+
+def read_view(view_class, async_variant):
+    """
+    Choose async variant of read view when ASYNC_VIEWS setting is on, e.g. when served by ASGI workers.
+    """
+    return async_variant if settings.ASYNC_VIEWS else view_class.as_view()
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -26,10 +37,12 @@ urlpatterns = [
     path('login', LoginView.as_view(), name='login'),
     path('logout', LogoutView.as_view(), name='logout'),
     path('add_user', AddUserView.as_view(), name='add-user'),
-    path('products', ProductsView.as_view(), name='products'),
-    path('recipes', RecipesView.as_view(), name='recipes'),
-    path('plans', PlansView.as_view(), name='plans'),
-    path('persons', PersonsView.as_view(), name='persons'),
+    path('products', read_view(ProductsView, async_views.products), name='products'),
+    path('products/search', ProductSearchView.as_view(), name='product-search'),
+    path('recipes', read_view(RecipesView, async_views.recipes), name='recipes'),
+    path('recipes/search', RecipeSearchView.as_view(), name='recipe-search'),
+    path('plans', read_view(PlansView, async_views.plans), name='plans'),
+    path('persons', read_view(PersonsView, async_views.persons), name='persons'),
     path('add_recipe', RecipeCreate.as_view(), name='add-recipe'),
     path('add_product', ProductCreate.as_view(), name='add-product'),
     path('add_person', PersonCreate.as_view(), name='add-person'),
@@ -43,10 +56,17 @@ urlpatterns = [
     path('edit_recipe/<int:recipe_id>', RecipeUpdate.as_view(), name='edit-recipe'),
     path('edit_person/<int:person_id>', PersonUpdate.as_view(), name='edit-person'),
     path('edit_plan/<int:plan_id>', PlanUpdate.as_view(), name='edit-plan'),
-    path('plan_details/<int:plan_id>', PlanDetailsView.as_view(), name='plan-details'),
-    path('recipe_details/<int:recipe_id>', RecipeDetailsView.as_view(), name='recipe-details'),
+    path('plan_details/<int:plan_id>', read_view(PlanDetailsView, async_views.plan_details), name='plan-details'),
+    path('plan_details/<int:plan_id>/auto_fill', PlanAutoFill.as_view(), name='plan-auto-fill'),
+    path('plan_details/<int:plan_id>/balance', PlanBalance.as_view(), name='plan-balance'),
+    path('recipe_details/<int:recipe_id>', read_view(RecipeDetailsView, async_views.recipe_details),
+         name='recipe-details'),
     path('shopping_list/plan/<int:plan_id>', ShoppingListCreate.as_view(), name='shopping-list'),
+    path('shopping_list/<int:shopping_list_id>', ShoppingListDetails.as_view(), name='shopping-list-details'),
     path('shopping_list/pdf_create', ShoppingListPdf.as_view(), name='shopping-list-pdf'),
+    path('shopping_list/pdf/<int:shopping_list_id>', ShoppingListPdf.as_view(), name='shopping-list-pdf-file'),
     path('fill_calories/<int:plan_id>/<int:plan_day>/<int:day_meal>', PlanDayCaloriesCompletion.as_view(),
          name='fill-calories'),
+    path('jobs/<int:job_id>', JobStatusView.as_view(), name='job-status'),
+    path('jobs/<int:job_id>/download', JobDownloadView.as_view(), name='job-download'),
 ]
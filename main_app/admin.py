@@ -25,7 +25,9 @@ class PlanAdmin(admin.ModelAdmin):
 
 
 class MealAdmin(admin.ModelAdmin):
-    pass
+    list_display = ('plan', 'plan_day', 'meal', 'recipes', 'meal_portions')
+    list_select_related = ('plan', 'recipes')
+    raw_id_fields = ('plan', 'recipes')
 
 
 class ProductsQuantitiesAdmin(admin.ModelAdmin):
@@ -0,0 +1,68 @@
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from main_app.middleware import current_metrics, instrumented_connections
+from main_app.views import ProductsView, RecipesView, PlansView, PersonsView, PlanDetailsView, RecipeDetailsView
+
+
+def database_sync_to_async(function):
+    """
+    Run function using the database in a thread of the executor pool, so concurrent requests do not wait for one
+    another. Django 3.2 has no async ORM and runs thread sensitive calls of all requests in one shared thread. The
+    call still blocks its pool thread, so at most pool size requests of a worker use the database at once.
+    Connections which failed or exceeded CONN_MAX_AGE are closed before and after the call, as request_started and
+    request_finished signals do for sync views, and queries are recorded in metrics of the current request.
+    :param function: Function using the database.
+    :return: Coroutine function.
+    """
+    @wraps(function)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            with instrumented_connections(current_metrics.get()):
+                return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def async_view(view_class, **initkwargs):
+    """
+    Create async variant of class-based view. GET and HEAD requests, including authentication, validators and
+    template rendering, run in a pool thread with database_sync_to_async, other methods run as Django runs sync views.
+    The view is not async all the way down: each request holds a thread of the worker executor pool, min(32, CPUs + 4)
+    threads, as a sync worker thread would. It pays off only when requests wait for database round trips.
+    :param view_class: View class.
+    :param initkwargs: View class as_view() keyword arguments.
+    :return: Async view function.
+    """
+    view = view_class.as_view(**initkwargs)
+
+    def read(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render) and not response.is_rendered:
+            metrics = getattr(request, 'metrics', None)
+            if metrics is None:
+                response.render()
+            else:
+                with metrics.measure_render():
+                    response.render()
+        return response
+
+    read = database_sync_to_async(read)
+    write = sync_to_async(view, thread_sensitive=True)
+
+    @wraps(view)
+    async def async_view_function(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            return await read(request, *args, **kwargs)
+        return await write(request, *args, **kwargs)
+    return async_view_function
+
+
+products = async_view(ProductsView)
+recipes = async_view(RecipesView)
+plans = async_view(PlansView)
+persons = async_view(PersonsView)
+plan_details = async_view(PlanDetailsView)
+recipe_details = async_view(RecipeDetailsView)
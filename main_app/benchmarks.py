@@ -0,0 +1,183 @@
+import http.cookiejar
+import statistics
+import time
+import tracemalloc
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from main_app.functions import calculate_days_calories
+from main_app.models import Plan
+
+SCALES = {
+    'small': {'categories': 10, 'products': 200, 'recipes': 500, 'users': 20, 'plan_length': 7},
+    'medium': {'categories': 20, 'products': 2000, 'recipes': 5000, 'users': 200, 'plan_length': 14},
+    'large': {'categories': 50, 'products': 10000, 'recipes': 50000, 'users': 2000, 'plan_length': 28},
+}
+# Wall time differences below this many milliseconds are treated as noise, not regressions.
+WALL_MS_NOISE = 2.0
+
+
+def benchmark_subjects(prefix):
+    """
+    Choose objects the benchmarks run on: the generated plan with the most meals, its user and one of its meals.
+    :param prefix: Prefix of generate_dataset command run.
+    :return: Dictionary with Plan, User and Meal model objects.
+    """
+    plan = Plan.objects.filter(user__username__startswith=f'{prefix}_user_').annotate(meals_count=Count('meal')). \
+        filter(meals_count__gt=0).select_related('user').order_by('-meals_count', 'pk').first()
+    if plan is None:
+        raise ValueError(f'No plan with meals generated with prefix "{prefix}"')
+    meal = plan.meal_set.order_by('plan_day', 'meal').first()
+    return {'plan': plan, 'user': plan.user, 'meal': meal}
+
+
+def benchmark_scenarios(client, subjects):
+    """
+    Create benchmarked operations. Every operation is safe to repeat.
+    :param client: Django Client object with logged-in plan user.
+    :param subjects: Dictionary returned by benchmark_subjects.
+    :return: Dictionary with benchmark name as key and function without arguments as value.
+    """
+    plan, meal = subjects['plan'], subjects['meal']
+    plan_details = reverse('plan-details', args=[plan.pk])
+    meal_data = {'plan_day': meal.plan_day, 'meal': meal.meal, 'recipes': meal.recipes_id, 'meal_portions': '1.0'}
+    return {
+        'recipes_view': lambda: client.get(reverse('recipes')),
+        'plan_details_get': lambda: client.get(plan_details),
+        'plan_details_post': lambda: client.post(plan_details, meal_data),
+        'shopping_list_create': lambda: client.get(reverse('shopping-list', args=[plan.pk])),
+        'shopping_list_pdf': lambda: client.get(reverse('shopping-list-pdf')).getvalue(),
+        'plan_day_calories_completion': lambda: client.get(
+            reverse('fill-calories', args=[plan.pk, meal.plan_day, meal.meal])),
+        'calculate_days_calories': lambda: calculate_days_calories(Plan.objects.get(pk=plan.pk)),
+    }
+
+
+def measure(function, repeat):
+    """
+    Measure one operation. Cache is cleared before every run, so cached pages and documents are measured cold.
+    Queries and peak memory are measured in a separate run, because memory tracing slows the code down, followed by
+    one untimed warm-up run.
+    :param function: Function without arguments.
+    :param repeat: Number of timed runs.
+    :return: Dictionary with median 'wall_ms', 'queries' count and 'peak_kb' of allocated memory.
+    """
+    cache.clear()
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            function()
+        query_count = len(queries)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    function()
+    times = []
+    for _ in range(repeat):
+        cache.clear()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {'wall_ms': round(statistics.median(times) * 1000, 2), 'queries': query_count,
+            'peak_kb': round(peak / 1024, 1)}
+
+
+def run_benchmarks(prefix, repeat=5):
+    """
+    Run all benchmarks on data generated by generate_dataset command.
+    :param prefix: Prefix of generate_dataset command run.
+    :param repeat: Number of timed runs of every benchmark.
+    :return: Dictionary with benchmark name as key and measure() result as value.
+    """
+    subjects = benchmark_subjects(prefix)
+    client = Client()
+    client.force_login(subjects['user'])
+    return {name: measure(function, repeat) for name, function in benchmark_scenarios(client, subjects).items()}
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Compare benchmark results with saved baseline. Wall time and peak memory regress when they grow by more than
+    threshold, query count regresses when it grows at all.
+    :param results: Dictionary returned by run_benchmarks.
+    :param baseline: Dictionary returned by run_benchmarks in a previous run.
+    :param threshold: Allowed relative growth, e.g. 0.25 for 25%.
+    :return: List of regression descriptions.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result['queries'] > base['queries']:
+            regressions.append(f'{name}: {result["queries"]} queries, baseline {base["queries"]}')
+        if result['wall_ms'] > base['wall_ms'] * (1 + threshold) + WALL_MS_NOISE:
+            regressions.append(f'{name}: {result["wall_ms"]} ms, baseline {base["wall_ms"]} ms')
+        if result['peak_kb'] > base['peak_kb'] * (1 + threshold):
+            regressions.append(f'{name}: {result["peak_kb"]} kB peak memory, baseline {base["peak_kb"]} kB')
+    return regressions
+
+
+def login_opener(base_url, username, password):
+    """
+    Log user in to running server.
+    :param base_url: Server url, e.g. http://127.0.0.1:8000.
+    :param username: User username.
+    :param password: User password.
+    :return: urllib opener with session cookie of logged-in user.
+    """
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    opener.open(f'{base_url}/login').read()
+    token = next((cookie.value for cookie in jar if cookie.name == 'csrftoken'), '')
+    data = urllib.parse.urlencode({'username': username, 'password': password, 'csrfmiddlewaretoken': token})
+    opener.open(urllib.request.Request(f'{base_url}/login', data.encode(),
+                                       headers={'Referer': f'{base_url}/login'})).read()
+    if not any(cookie.name == 'sessionid' for cookie in jar):
+        raise ValueError(f'Login of "{username}" to {base_url} failed')
+    return opener
+
+
+def load_test(base_url, paths, concurrency, requests, username, password, timeout=30):
+    """
+    Send requests to running server from concurrency threads at once, as logged-in user, cycling through paths.
+    :param base_url: Server url, e.g. http://127.0.0.1:8000.
+    :param paths: List of requested paths.
+    :param concurrency: Number of requests sent at once.
+    :param requests: Total number of requests.
+    :param username: User username.
+    :param password: User password.
+    :param timeout: Request timeout in seconds.
+    :return: Dictionary with 'requests_per_s', latency percentiles 'p50_ms', 'p95_ms', 'p99_ms' and 'errors' count.
+    """
+    opener = login_opener(base_url, username, password)
+
+    def fetch(index):
+        start = time.perf_counter()
+        try:
+            with opener.open(base_url + paths[index % len(paths)], timeout=timeout) as response:
+                response.read()
+                ok = response.status == 200
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(fetch, range(requests)))
+    wall_time = time.perf_counter() - start
+    percentiles = statistics.quantiles([latency for latency, _ in results], n=100)
+    return {
+        'requests_per_s': round(requests / wall_time, 1),
+        'p50_ms': round(percentiles[49] * 1000, 1),
+        'p95_ms': round(percentiles[94] * 1000, 1),
+        'p99_ms': round(percentiles[98] * 1000, 1),
+        'errors': sum(not ok for _, ok in results),
+    }
@@ -0,0 +1,137 @@
+import hashlib
+from django.conf import settings
+from django.db.models import Max, Count, OuterRef, Subquery
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from main_app.fragments import bump_versions, fragment_versions
+from main_app.models import Plan, Meal
+from main_app.pagination import keyset_page_queryset
+
+USER_VERSION = 'user'
+CATEGORIES_VERSION = 'categories'
+
+
+def bump_user_version(user_id):
+    """
+    Invalidate pages of user which show data without modification timestamp, e.g. Persons model objects.
+    :param user_id: User model object primary key.
+    """
+    bump_versions(USER_VERSION, [user_id])
+
+
+def bump_table_version(kind):
+    """
+    Invalidate pages listing objects of whole table, e.g. ProductCategory model objects.
+    :param kind: Table version kind, e.g. CATEGORIES_VERSION.
+    """
+    bump_versions(kind, [0])
+
+
+def table_version(kind):
+    """
+    Get current version of objects of whole table, stored in the database.
+    :param kind: Table version kind, e.g. CATEGORIES_VERSION.
+    """
+    return fragment_versions(kind, [0])[0]
+
+
+def bump_categories_version():
+    """
+    Invalidate pages which show ProductCategory model objects.
+    """
+    bump_table_version(CATEGORIES_VERSION)
+
+
+def categories_version():
+    """
+    Get current version of ProductCategory model objects.
+    """
+    return table_version(CATEGORIES_VERSION)
+
+
+def queryset_validator(queryset, *versions):
+    """
+    Compute validator of page showing queryset objects with one aggregate query. Objects count changes when an object
+    is deleted, which the latest date_modified does not show.
+    :param queryset: QuerySet of model with date_modified field.
+    :param versions: Other validator parts, e.g. categories_version().
+    :return: Tuple of the latest date_modified and list of validator parts.
+    """
+    result = queryset.order_by().aggregate(modified=Max('date_modified'), count=Count('pk'))
+    return result['modified'], [result['count'], *versions]
+
+
+def page_validator(queryset, request, *versions):
+    """
+    Compute validator of page of queryset objects listed by keyset_paginate from primary keys and date_modified of
+    the page objects, read with one query using the primary key index, so it does not scan large tables. Objects
+    deleted from the page or moved to it change the primary keys, which the latest date_modified does not show, so no
+    last modified datetime is returned.
+    :param queryset: QuerySet of model with date_modified field.
+    :param request: Django request object.
+    :param versions: Other validator parts, e.g. categories_version().
+    :return: Tuple of None and list of validator parts.
+    """
+    rows = keyset_page_queryset(queryset.values_list('pk', 'date_modified'), request)
+    digest = hashlib.md5(':'.join(f'{pk}@{modified.isoformat()}' for pk, modified in rows).encode()).hexdigest()
+    return None, [digest, *versions]
+
+
+def plan_validator(plan_id):
+    """
+    Get plan date_modified, set whenever its meals, persons or summaries change, and the latest modification of its
+    meals recipes with one query.
+    :param plan_id: Plan model object primary key.
+    :return: Page validator or None if plan does not exist.
+    """
+    recipes_modified = Meal.objects.filter(plan=OuterRef('pk')).order_by().values('plan'). \
+        annotate(modified=Max('recipes__date_modified')).values('modified')
+    row = Plan.objects.filter(pk=plan_id).annotate(recipes_modified=Subquery(recipes_modified)). \
+        values_list('date_modified', 'recipes_modified').first()
+    if row is None:
+        return None
+    return max(filter(None, row)), []
+
+
+class ConditionalGetMixin:
+    """
+    Answer GET requests with 304 Not Modified when the page validator did not change, without running the view.
+    The ETag is built from the validator, logged-in user, their last login, as the page holds a CSRF token rotated
+    on login, and user version. Views define get_validator(request, *args, **kwargs).
+    """
+
+    def get_validator(self, request, *args, **kwargs):
+        """
+        Compute page validator with at most one query, without calculating the page. Pages are not conditional
+        unless views override it.
+        :param request: Django request object.
+        :return: Tuple of last modified datetime or None and list of other validator parts, or None when the page is
+        not conditional.
+        """
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Wrap view with django condition decorator using computed validator. Responses are private and revalidated on
+        every request, so browsers never show a stale page.
+        """
+        validator = None
+        if request.method in ('GET', 'HEAD'):
+            validator = self.get_validator(request, *args, **kwargs)
+        if validator is None:
+            return super().dispatch(request, *args, **kwargs)
+        modified, versions = validator
+        user = request.user
+        user_parts = [None]
+        if user.is_authenticated:
+            user_parts = [user.pk, user.last_login and user.last_login.isoformat(),
+                          fragment_versions(USER_VERSION, [user.pk])[user.pk]]
+            if modified and user.last_login:
+                modified = max(modified, user.last_login)
+        parts = [settings.ETAG_VERSION, *user_parts, modified and modified.isoformat(), *versions]
+        etag = hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+        response = condition(etag_func=lambda *args, **kwargs: etag,
+                             last_modified_func=lambda *args, **kwargs: modified)(super().dispatch)(
+            request, *args, **kwargs)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
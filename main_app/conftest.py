@@ -1,9 +1,11 @@
 import pytest
 from django.test import Client
+from django.db import connections, DEFAULT_DB_ALIAS
 from random import randint, sample
 from main_app.utils import three_new_products_create, new_user_create, three_new_persons_create
 
 from main_app.models import Recipe, Plan
+from main_app.routers import REPLICA_DB_ALIAS
 
 from django.contrib.auth.models import User
 
@@ -86,3 +88,26 @@ def new_user_login(client):
     return user
 
 
+@pytest.fixture
+def replica_database(tmp_path):
+    """
+    Add replica database alias using SQLite file standing in for the replica of SQLite test database.
+    :param tmp_path: Pytest temporary directory.
+    :return: Function copying committed primary data to the replica, like replication does.
+    """
+    databases = connections.configure_settings({
+        DEFAULT_DB_ALIAS: connections.databases[DEFAULT_DB_ALIAS],
+        REPLICA_DB_ALIAS: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(tmp_path / 'replica.sqlite3')},
+    })
+    connections.databases[REPLICA_DB_ALIAS] = databases[REPLICA_DB_ALIAS]
+
+    def replicate():
+        connections[DEFAULT_DB_ALIAS].ensure_connection()
+        connections[REPLICA_DB_ALIAS].ensure_connection()
+        connections[DEFAULT_DB_ALIAS].connection.backup(connections[REPLICA_DB_ALIAS].connection)
+
+    replicate()
+    yield replicate
+    connections[REPLICA_DB_ALIAS].close()
+    del connections[REPLICA_DB_ALIAS]
+    del connections.databases[REPLICA_DB_ALIAS]
@@ -1,5 +1,7 @@
 from django import forms
 from .models import ProductCategory, Product, Recipe, Plan, Meal, ProductsQuantities, Persons
+from .widgets import RemoteSelect, RemoteSelectMultiple
+from .functions import BALANCE_STRATEGIES
 
 
 class LoginForm(forms.Form):
@@ -49,7 +51,7 @@ class RecipeForm(forms.ModelForm):
         model = Recipe
         exclude = ['add_date', 'edit_date']
         widgets = {
-            'products': forms.CheckboxSelectMultiple,
+            'products': RemoteSelectMultiple('product-search', 'product_name'),
         }
         localized_fields = '__all__'
 
@@ -73,12 +75,22 @@ class MealForm(forms.ModelForm):
     """
     class Meta:
         model = Meal
-        exclude = ['plan_name', 'user']
+        exclude = ['plan', 'user']
+        widgets = {
+            'recipes': RemoteSelect('recipe-search', 'recipe_name'),
+        }
 
     plan_day = forms.IntegerField(min_value=1, label='Dzień planu')
     localized_fields = '__all__'
 
 
+class PlanBalanceForm(forms.Form):
+    """
+    Create whole plan calories balancing form.
+    """
+    strategy = forms.ChoiceField(choices=BALANCE_STRATEGIES, label='Rozłóż brakujące kalorie')
+
+
 class QuantitiesForm(forms.ModelForm):
     """
     Create form for ProductQuantities model.
@@ -86,6 +98,9 @@ class QuantitiesForm(forms.ModelForm):
     class Meta:
         model = ProductsQuantities
         exclude = ['recipe_id']
+        widgets = {
+            'product_id': RemoteSelect('product-search', 'product_name'),
+        }
 
     field_order = ['product_id', 'product_quantity']
     localized_fields = '__all__'
@@ -0,0 +1,117 @@
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from main_app.routers import reading_replica
+
+RECIPE_ROW = 'recipe_row'
+PRODUCT_ROW = 'product_row'
+PLAN_DAY = 'plan_day'
+
+
+def version_key(kind, key):
+    """
+    Create key of fragment version.
+    :param kind: Fragment kind, e.g. RECIPE_ROW.
+    :param key: Object key, e.g. Recipe model object primary key.
+    :return: FragmentVersion model object key.
+    """
+    return f'{kind}:{key}'
+
+
+def bump_versions(kind, keys):
+    """
+    Give fragments of objects new random versions, so fragments cached under old versions are not used anymore.
+    Versions are stored in the database. Inside a transaction, bumps are collected on the connection and written with
+    one UPDATE after the transaction commits, or before the next version read of the transaction, so a write
+    invalidating many rows, e.g. product deletion cascading to its ProductsQuantities, costs one query. A fragment
+    rendered by a concurrent request from data read before the commit is not reused either. Versions never read have
+    no row, as no fragment is cached under them, and are created on first read.
+    :param kind: Fragment kind.
+    :param keys: Iterable of object keys.
+    """
+    version_keys = [version_key(kind, key) for key in keys]
+    if not version_keys:
+        return
+    connection = transaction.get_connection()
+    pending = getattr(connection, 'pending_fragment_versions', None)
+    if pending is None:
+        pending = connection.pending_fragment_versions = set()
+    pending.update(version_keys)
+    if connection.in_atomic_block:
+        # Registered with every bump, as callbacks of a rolled back transaction are dropped. Flushing is idempotent.
+        transaction.on_commit(flush_versions)
+    else:
+        flush_versions()
+
+
+def flush_versions():
+    """
+    Write fragment versions bumped on the current connection with one UPDATE. Keys left by a rolled back transaction
+    are bumped too, which only costs fragments rendering.
+    """
+    # Imported here, main_app.models uses bump_versions.
+    from main_app.models import FragmentVersion
+    connection = transaction.get_connection()
+    pending = getattr(connection, 'pending_fragment_versions', None)
+    connection.pending_fragment_versions = None
+    if pending:
+        FragmentVersion.objects.filter(key__in=pending).update(version=uuid.uuid4().hex)
+
+
+def fragment_versions(kind, keys):
+    """
+    Get current fragment versions of objects with one query, after writing versions bumped by the current
+    transaction. Missing versions, of objects never read before, are
+    created with random values by one bulk_create(ignore_conflicts=True) on primary. A request losing the race with a
+    concurrent one creating the same version caches its fragments under its own version, which nobody reads again.
+    Reading from the replica, missing versions are not created, as its fragments are not cached anyway.
+    :param kind: Fragment kind.
+    :param keys: List of object keys.
+    :return: Dictionary with object key as key and version as value.
+    """
+    from main_app.models import FragmentVersion
+    flush_versions()
+    version_keys = {version_key(kind, key): key for key in keys}
+    stored = dict(FragmentVersion.objects.filter(key__in=version_keys).values_list('key', 'version'))
+    missing = {stored_key: uuid.uuid4().hex for stored_key in version_keys if stored_key not in stored}
+    if missing and not reading_replica():
+        FragmentVersion.objects.bulk_create([FragmentVersion(key=stored_key, version=version)
+                                             for stored_key, version in missing.items()], ignore_conflicts=True)
+    stored.update(missing)
+    return {key: stored[stored_key] for stored_key, key in version_keys.items()}
+
+
+def cached_fragments(kind, objects, template_name, name, key=lambda obj: obj.pk, prepare=None, context=None):
+    """
+    Render template fragment of every object, reusing fragments cached under current object version. Cache is read
+    and written with one get_many and one set_many call, so it works with every cache backend. Versions are read
+    from the database, so a fragment cached by any worker process is not reused after a change. Fragments rendered
+    from the replica are not cached, as the replica may not have the data of the current version yet.
+    :param kind: Fragment kind.
+    :param objects: List of objects.
+    :param template_name: Fragment template rendered with object in context.
+    :param name: Object variable name in fragment template.
+    :param key: Function returning object key.
+    :param prepare: Function called with list of objects which fragments are rendered, e.g. to prefetch relations
+    used only by the fragment.
+    :param context: Additional fragment template context.
+    :return: List of rendered fragments in objects order.
+    """
+    keys = [key(obj) for obj in objects]
+    versions = fragment_versions(kind, keys)
+    fragment_keys = [f'fragment:{kind}:{obj_key}:{versions[obj_key]}' for obj_key in keys]
+    fragments = cache.get_many(fragment_keys)
+    missing = [(fragment_key, obj) for fragment_key, obj in zip(fragment_keys, objects)
+               if fragment_key not in fragments]
+    if missing:
+        if prepare is not None:
+            prepare([obj for _, obj in missing])
+        rendered = {fragment_key: render_to_string(template_name, {**(context or {}), name: obj})
+                    for fragment_key, obj in missing}
+        if not reading_replica():
+            cache.set_many(rendered, settings.FRAGMENT_CACHE_TIMEOUT)
+        fragments.update(rendered)
+    return [mark_safe(fragments[fragment_key]) for fragment_key in fragment_keys]
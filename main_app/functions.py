@@ -1,14 +1,180 @@
+import hashlib
+from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import F, Sum, Value, ExpressionWrapper
+from main_app.models import Plan, Meal, PlanDaySummary, ShoppingList, ShoppingListProducts, NUTRIENTS, NUTRITION_FIELD
+
+BALANCE_PROPORTIONAL = 'proportional'
+BALANCE_EVEN = 'even'
+BALANCE_STRATEGIES = (
+    (BALANCE_PROPORTIONAL, 'Proporcjonalnie do kalorii posiłków'),
+    (BALANCE_EVEN, 'Po równo między posiłki'),
+)
+MIN_MEAL_PORTIONS = Decimal('0.1')
+MAX_MEAL_PORTIONS = Decimal('99.9')
+
+
+def calculate_days_nutrition(plan):
+    """
+    Get days calories and macronutrients amount for selected Plan model object from its PlanDaySummary model objects,
+    with one query reading a row per planned day.
+    :param plan: Plan model object.
+    :return: List of dictionaries with nutrients amount for every plan_day, index 0 is plan_day 1.
+    """
+    rows = PlanDaySummary.objects.filter(plan=plan, plan_day__range=(1, plan.plan_length)). \
+        values('plan_day', *NUTRIENTS)
+    days_nutrition = [{nutrient: Decimal(0) for nutrient in NUTRIENTS} for _ in range(plan.plan_length)]
+    for row in rows:
+        days_nutrition[row['plan_day'] - 1] = {nutrient: row[nutrient] for nutrient in NUTRIENTS}
+    return days_nutrition
+
+
 def calculate_days_calories(plan):
     """
     Calculate days calories amount for selected Plan model object.
     :param plan: Plan model object.
     :return: List of calories amount for every plan_day
     """
-    days_calories_list = []
-    for day in range(1, plan.plan_length + 1):
-        day_meals = plan.meal_set.filter(plan_day=day)
-        day_calories = 0
-        for meal in day_meals:
-            day_calories += float(meal.meal_portions) * float(meal.recipes.portion_calories)
-        days_calories_list.append(round(day_calories, 2))
-    return days_calories_list
+    return [float(day['calories']) for day in calculate_days_nutrition(plan)]
+
+
+def meal_nutrition(recipe, meal_portions):
+    """
+    Calculate nutrients amount of a meal.
+    :param recipe: Recipe model object.
+    :param meal_portions: Meal portions amount.
+    :return: Dictionary with nutrients amount for every nutrient in NUTRIENTS.
+    """
+    return {nutrient: getattr(recipe, f'portion_{nutrient}') * meal_portions for nutrient in NUTRIENTS}
+
+
+def upsert_meal(plan_id, user, plan_day, meal, recipe, meal_portions):
+    """
+    Create or update Meal model object in selected plan slot, if it does not exceed the plan_day calories limit.
+    Plan day budget is calculated once with the Plan row locked, then updated incrementally by the changed meal.
+    The meal is written with MealQuerySet.upsert(), which relies on the unique plan slot constraint.
+    :param plan_id: Plan model object primary key.
+    :param user: User model object owning the meal.
+    :param plan_day: Meal plan_day.
+    :param meal: Meal meal parameter, one of MEALS.
+    :param recipe: Recipe model object.
+    :param meal_portions: Meal portions amount.
+    :return: Tuple of Plan model object, days nutrition list and error message or None if meal was saved.
+    """
+    with transaction.atomic():
+        plan = Plan.objects.select_for_update().get(pk=plan_id)
+        days_nutrition = calculate_days_nutrition(plan)
+        if not 1 <= plan_day <= plan.plan_length:
+            return plan, days_nutrition, 'Nieprawidłowy dzień planu'
+        meal_object = Meal.objects.filter(plan=plan, plan_day=plan_day, meal=meal).select_related('recipes').first()
+        calories_left = plan.plan_calories - days_nutrition[plan_day - 1]['calories']
+        meal_calories = recipe.portion_calories * meal_portions
+        if meal_object:
+            if not (calories_left > meal_calories or meal_calories < meal_object.meal_calories):
+                return plan, days_nutrition, 'Przekroczono limit kalorii'
+            removed = meal_nutrition(meal_object.recipes, meal_object.meal_portions)
+        else:
+            if not calories_left > meal_calories:
+                return plan, days_nutrition, 'Przekroczono limit kalorii'
+            removed = {}
+        Meal.objects.upsert(plan, plan_day, meal, recipe, meal_portions, user)
+    added = meal_nutrition(recipe, meal_portions)
+    day_nutrition = days_nutrition[plan_day - 1]
+    for nutrient in NUTRIENTS:
+        day_nutrition[nutrient] = round(day_nutrition[nutrient] - removed.get(nutrient, 0) + added[nutrient], 2)
+    return plan, days_nutrition, None
+
+
+def balance_plan(plan_id, strategy=BALANCE_PROPORTIONAL):
+    """
+    Change portions of Plan model object meals, so every plan day with meals hits plan_calories. Day gaps are
+    calculated at once from one query, portions are rounded to 0.1 and written with one bulk update inside one
+    transaction with the Plan row locked.
+    :param plan_id: Plan model object primary key.
+    :param strategy: BALANCE_PROPORTIONAL to scale all day meals by the same factor, so every meal gets part of the gap
+    proportional to its calories, or BALANCE_EVEN to split the gap calories evenly between day meals. Days which
+    meals have no portions are split evenly with both strategies.
+    :return: List of updated Meal model objects.
+    """
+    with transaction.atomic():
+        plan = Plan.objects.select_for_update().get(pk=plan_id)
+        target = Decimal(plan.plan_calories)
+        days = {}
+        for meal in plan.meal_set.select_related('recipes'). \
+                filter(plan_day__range=(1, plan.plan_length), recipes__portion_calories__gt=0). \
+                only('plan', 'plan_day', 'meal_portions', 'recipes__portion_calories'):
+            days.setdefault(meal.plan_day, []).append(meal)
+        updated = []
+        now = timezone.now()
+        for day_meals in days.values():
+            day_calories = sum(meal.meal_calories for meal in day_meals)
+            gap = target - day_calories
+            for meal in day_meals:
+                # Day of meals with no portions has no calories to scale, its gap is split evenly.
+                if strategy == BALANCE_EVEN or day_calories == 0:
+                    portions = meal.meal_portions + gap / len(day_meals) / meal.recipes.portion_calories
+                else:
+                    portions = meal.meal_portions * target / day_calories
+                portions = min(max(portions.quantize(Decimal('0.1')), MIN_MEAL_PORTIONS), MAX_MEAL_PORTIONS)
+                if portions != meal.meal_portions:
+                    meal.meal_portions = portions
+                    meal.date_modified = now
+                    updated.append(meal)
+        # bulk_update runs MealQuerySet.update, which refreshes summaries of updated plan days.
+        Meal.objects.bulk_update(updated, ['meal_portions', 'date_modified'])
+    return updated
+
+
+def calculate_plan_products_quantities(plan):
+    """
+    Calculate total quantity of every product needed for selected Plan model object meals, with one query grouped
+    by product.
+    :param plan: Plan model object.
+    :return: Dictionary with Product model object primary key as key and product quantity as value.
+    """
+    # Decimal factor keeps the division non-integer on SQLite, where whole decimals are stored as integers.
+    quantity = ExpressionWrapper(F('recipes__productsquantities__product_quantity') * Value(Decimal('1.0')) *
+                                 F('meal_portions') / F('recipes__portions'), output_field=NUTRITION_FIELD)
+    rows = Meal.objects.filter(plan=plan, recipes__portions__gt=0,
+                               recipes__productsquantities__isnull=False). \
+        values('recipes__productsquantities__product_id').annotate(quantity=Sum(quantity)).order_by()
+    return {row['recipes__productsquantities__product_id']: row['quantity'] for row in rows}
+
+
+def shopping_list_fingerprint(plan, products_quantities):
+    """
+    Calculate fingerprint of shopping list content for selected Plan model object.
+    :param plan: Plan model object.
+    :param products_quantities: Dictionary returned by calculate_plan_products_quantities.
+    :return: Hex digest of plan name and products quantities rounded to stored precision.
+    """
+    content = [plan.plan_name]
+    for product_id, quantity in sorted(products_quantities.items()):
+        content.append(f'{product_id}:{Decimal(quantity).quantize(Decimal("0.1"))}')
+    return hashlib.sha256('\n'.join(content).encode()).hexdigest()
+
+
+def create_shopping_list(plan):
+    """
+    Get or create ShoppingList model object for selected Plan model object. ShoppingList is addressed by fingerprint
+    of its content, so ShoppingListProducts model objects are written, in one bulk insert, only when plan meals
+    content changed since last created shopping list. Reused list gets current date_created, so it is the latest list
+    of the user, downloaded by ShoppingListPdf view without chosen list.
+    :param plan: Plan model object.
+    :return: ShoppingList model object.
+    """
+    products_quantities = calculate_plan_products_quantities(plan)
+    fingerprint = shopping_list_fingerprint(plan, products_quantities)
+    with transaction.atomic():
+        shopping_list, created = ShoppingList.objects.get_or_create(
+            plan=plan, fingerprint=fingerprint, defaults={'name': f'Lista zakupów plan {plan.plan_name}'})
+        if created:
+            ShoppingListProducts.objects.bulk_create([
+                ShoppingListProducts(shopping_list=shopping_list, product_id=product_id, product_quantity=quantity)
+                for product_id, quantity in products_quantities.items()
+            ])
+        else:
+            shopping_list.date_created = timezone.now()
+            ShoppingList.objects.filter(pk=shopping_list.pk).update(date_created=shopping_list.date_created)
+    return shopping_list
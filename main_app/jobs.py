@@ -0,0 +1,129 @@
+import logging
+import time
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Q
+from main_app.models import Job, Plan
+from main_app.functions import create_shopping_list
+from main_app.pdf import shopping_list_pdf
+from main_app.routers import replica_reads
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_job(kind, user, plan=None, shopping_list=None):
+    """
+    Create queued Job model object.
+    :param kind: Job kind, one of Job.KINDS.
+    :param user: User model object that requested the job.
+    :param plan: Plan model object the job is run for.
+    :param shopping_list: ShoppingList model object the job is run for.
+    :return: Created Job model object.
+    """
+    return Job.objects.create(kind=kind, user=user, plan=plan, shopping_list=shopping_list)
+
+
+def enqueue_plan_job(kind, user, plan, done_after=None):
+    """
+    Get queued or running Job model object of the same kind, user and plan, or one done after done_after, e.g. the
+    latest change of the plan, so its result is still current. Create a queued job otherwise. The plan row is locked
+    with select_for_update, so concurrent requests create one job.
+    :param kind: Job kind, one of Job.KINDS.
+    :param user: User model object that requested the job.
+    :param plan: Plan model object the job is run for.
+    :param done_after: Datetime after which done jobs are reused or None to never reuse done jobs.
+    :return: Existing or created Job model object.
+    """
+    with transaction.atomic():
+        list(Plan.objects.select_for_update().filter(pk=plan.pk).values_list('pk', flat=True))
+        reused = Q(status__in=[Job.QUEUED, Job.RUNNING])
+        if done_after is not None:
+            reused |= Q(status=Job.DONE, date_modified__gte=done_after)
+        job = Job.objects.filter(reused, kind=kind, user=user, plan=plan).order_by('-date_created').first()
+        if job is None:
+            job = enqueue_job(kind, user, plan=plan)
+    return job
+
+
+def claim_job():
+    """
+    Mark the oldest queued Job model object as running. Locked rows are skipped and the status change is conditional,
+    so concurrent workers never claim the same job.
+    :return: Claimed Job model object or None if queue is empty.
+    """
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(status=Job.QUEUED). \
+            order_by('date_created').first()
+        if job is None:
+            return None
+        claimed = Job.objects.filter(pk=job.pk, status=Job.QUEUED). \
+            update(status=Job.RUNNING, date_modified=timezone.now())
+    if not claimed:
+        return None
+    job.status = Job.RUNNING
+    return job
+
+
+def run_job(job):
+    """
+    Run claimed Job model object and save its result, or its error if the job failed. The .pdf file is rendered from
+    the replica, if the shopping list is already replicated.
+    :param job: Job model object.
+    :return: Finished Job model object.
+    """
+    try:
+        if job.shopping_list is None:
+            job.shopping_list = create_shopping_list(job.plan)
+        if job.kind == Job.SHOPPING_LIST_PDF:
+            with replica_reads(job.shopping_list):
+                job.result = shopping_list_pdf(job.shopping_list)
+        job.status = Job.DONE
+    except Exception as error:
+        logger.exception('Job %s failed', job.pk)
+        job.status = Job.FAILED
+        job.error = str(error)
+    job.save()
+    return job
+
+
+def run_next_job():
+    """
+    Claim and run the oldest queued Job model object.
+    :return: Finished Job model object or None if queue is empty.
+    """
+    job = claim_job()
+    if job is None:
+        return None
+    return run_job(job)
+
+
+def requeue_stale_jobs(timeout):
+    """
+    Put back to queue jobs left running by a worker that stopped.
+    :param timeout: Seconds after which running job is considered stale.
+    :return: Number of requeued jobs.
+    """
+    stale_date = timezone.now() - timedelta(seconds=timeout)
+    return Job.objects.filter(status=Job.RUNNING, date_modified__lt=stale_date).update(status=Job.QUEUED)
+
+
+def work(poll_interval=1.0, once=False, stale_timeout=None):
+    """
+    Run queued jobs in a loop, sleeping when the queue is empty. Jobs left running by a worker that stopped are put
+    back to queue every stale_timeout seconds, so they do not wait for workers restart.
+    :param poll_interval: Seconds to sleep when the queue is empty.
+    :param once: Stop when the queue is empty.
+    :param stale_timeout: Seconds after which running job is considered stale or None to not requeue jobs.
+    """
+    requeued_at = time.monotonic()
+    while True:
+        if stale_timeout is not None and time.monotonic() - requeued_at >= stale_timeout:
+            requeued = requeue_stale_jobs(stale_timeout)
+            if requeued:
+                logger.warning('Requeued %s stale jobs', requeued)
+            requeued_at = time.monotonic()
+        if run_next_job() is None:
+            if once:
+                return
+            time.sleep(poll_interval)
@@ -0,0 +1,71 @@
+import json
+import logging
+import platform
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment, override_settings
+from main_app.benchmarks import SCALES, run_benchmarks, compare_results
+from main_app.models import ProductCategory
+
+PREFIX = 'bench'
+
+
+class Command(BaseCommand):
+    """
+    Run benchmarks of the hot paths on synthetic data in a test database, compare them with saved JSON baseline and
+    fail when they regress.
+    """
+    help = 'Benchmark views and functions on generated data of chosen scale, save or compare JSON baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=SCALES, default='small', help='Size of generated dataset.')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs of every benchmark.')
+        parser.add_argument('--threshold', type=float, default=settings.BENCHMARK_THRESHOLD,
+                            help='Allowed relative regression of wall time and peak memory.')
+        parser.add_argument('--save', action='store_true', help='Save results as the scale baseline.')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Keep the test database and its generated data between runs.')
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        baseline_path = settings.BENCHMARK_DIR / f'{scale}.json'
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            if not ProductCategory.objects.filter(category_name__startswith=f'{PREFIX} ').exists():
+                call_command('generate_dataset', prefix=PREFIX, stdout=self.stdout, **SCALES[scale])
+            # Per request JSON log lines would flood the output, budget warnings are still shown.
+            request_logger = logging.getLogger('main_app.middleware')
+            level = request_logger.level
+            request_logger.setLevel(logging.WARNING)
+            try:
+                with override_settings(BACKGROUND_JOBS=False):
+                    results = run_benchmarks(PREFIX, options['repeat'])
+            finally:
+                request_logger.setLevel(level)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+        for name, result in results.items():
+            self.stdout.write(f'{name:<30} {result["wall_ms"]:>10.2f} ms {result["queries"]:>5} queries '
+                              f'{result["peak_kb"]:>10.1f} kB')
+        if options['save']:
+            settings.BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps({
+                'scale': scale,
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'results': results,
+            }, indent=2))
+            self.stdout.write(f'Saved baseline {baseline_path}')
+            return
+        if not baseline_path.exists():
+            self.stdout.write(f'No baseline {baseline_path}, run with --save to create it')
+            return
+        regressions = compare_results(results, json.loads(baseline_path.read_text())['results'],
+                                      options['threshold'])
+        if regressions:
+            raise CommandError('Benchmarks regressed:\n' + '\n'.join(regressions))
+        self.stdout.write(f'No regressions against {baseline_path}')
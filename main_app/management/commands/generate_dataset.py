@@ -0,0 +1,160 @@
+import random
+import time
+from decimal import Decimal
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from main_app.models import ProductCategory, Product, Recipe, ProductsQuantities, Persons, Plan, Meal, \
+    PlanDaySummary, MEALS
+from main_app.search import normalize_search_text
+from main_app.conditional import bump_categories_version
+
+PRODUCT_WORDS = ['Chleb', 'Ser', 'Mleko', 'Jogurt', 'Masło', 'Jajka', 'Kurczak', 'Wołowina', 'Wieprzowina', 'Łosoś',
+                 'Dorsz', 'Ryż', 'Makaron', 'Kasza', 'Płatki', 'Ziemniaki', 'Marchew', 'Cebula', 'Pomidor', 'Ogórek',
+                 'Papryka', 'Jabłko', 'Banan', 'Gruszka', 'Śliwka', 'Fasola', 'Soczewica', 'Orzechy', 'Oliwa', 'Miód']
+PRODUCT_KINDS = ['świeży', 'suszony', 'wędzony', 'gotowany', 'pełnoziarnisty', 'light', 'ekologiczny', 'mrożony']
+CATEGORY_WORDS = ['Nabiał', 'Pieczywo', 'Mięso', 'Ryby', 'Warzywa', 'Owoce', 'Zboża', 'Strączki', 'Tłuszcze',
+                  'Słodycze']
+DEFAULT_PASSWORD = 'cookee_password'
+
+
+def batches(objects, batch_size):
+    """
+    Split iterable into lists of batch_size length, without materializing the whole iterable.
+    :param objects: Iterable.
+    :param batch_size: Length of batches.
+    :return: Generator of lists.
+    """
+    iterator = iter(objects)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    """
+    Populate database with deterministic synthetic data: categories, products, recipes with ingredients, users,
+    persons, plans and meals, inserted with bulk_create in batches.
+    """
+    help = 'Generate synthetic dataset for load reproduction and benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20, help='Number of product categories.')
+        parser.add_argument('--products', type=int, default=2000, help='Number of products.')
+        parser.add_argument('--recipes', type=int, default=5000, help='Number of recipes.')
+        parser.add_argument('--min-ingredients', type=int, default=3, help='Minimal number of recipe ingredients.')
+        parser.add_argument('--max-ingredients', type=int, default=12, help='Maximal number of recipe ingredients.')
+        parser.add_argument('--users', type=int, default=100, help='Number of users.')
+        parser.add_argument('--persons', type=int, default=3, help='Number of persons of every user.')
+        parser.add_argument('--plans', type=int, default=2, help='Number of plans of every user.')
+        parser.add_argument('--plan-length', type=int, default=14, help='Maximal plan length in days.')
+        parser.add_argument('--fill', type=float, default=0.8, help='Part of plan slots filled with meals.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, the same seed gives the same data.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Number of rows inserted in one query.')
+        parser.add_argument('--prefix', default='gen', help='Prefix of generated names, unique for every run.')
+
+    def stage(self, name, start):
+        """
+        Write stage duration.
+        """
+        self.stdout.write(f'{name}: {time.perf_counter() - start:.1f}s')
+        return time.perf_counter()
+
+    def insert(self, model, objects, batch_size):
+        """
+        Insert model objects with bulk_create in batches.
+        :return: Number of inserted objects.
+        """
+        count = 0
+        for batch in batches(objects, batch_size):
+            model.objects.bulk_create(batch)
+            count += len(batch)
+        return count
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if ProductCategory.objects.filter(category_name__startswith=f'{prefix} ').exists():
+            raise CommandError(f'Dataset with prefix "{prefix}" already exists, use another --prefix.')
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        start = time.perf_counter()
+
+        self.insert(ProductCategory, (
+            ProductCategory(category_name=f'{prefix} {CATEGORY_WORDS[index % len(CATEGORY_WORDS)]} {index}')
+            for index in range(options['categories'])
+        ), batch_size)
+        category_ids = list(ProductCategory.objects.filter(category_name__startswith=f'{prefix} ').
+                            order_by('pk').values_list('pk', flat=True))
+
+        def products():
+            for index in range(options['products']):
+                name = f'{rng.choice(PRODUCT_WORDS)} {rng.choice(PRODUCT_KINDS)} {index}'
+                proteins = rng.uniform(0, 35)
+                carbohydrates = rng.uniform(0, min(85, 100 - proteins))
+                fats = rng.uniform(0, min(45, 100 - proteins - carbohydrates))
+                yield Product(product_name=name, search_name=normalize_search_text(name),
+                              proteins=round(Decimal(proteins), 2), carbohydrates=round(Decimal(carbohydrates), 2),
+                              fats=round(Decimal(fats), 2), category_id=rng.choice(category_ids))
+        self.insert(Product, products(), batch_size)
+        product_ids = list(Product.objects.filter(category_id__in=category_ids).order_by('pk').
+                           values_list('pk', flat=True))
+        start = self.stage(f'{len(product_ids)} products', start)
+
+        self.insert(Recipe, (
+            Recipe(recipe_name=f'{prefix} Przepis {index}', description=f'Sposób przygotowania {index}',
+                   preparation_time=rng.randint(5, 120), portions=rng.choice([1, 2, 4, 6]))
+            for index in range(options['recipes'])
+        ), batch_size)
+        recipe_ids = list(Recipe.objects.filter(recipe_name__startswith=f'{prefix} ').order_by('pk').
+                          values_list('pk', flat=True))
+        ingredients = self.insert(ProductsQuantities, (
+            ProductsQuantities(recipe_id_id=recipe_id, product_id_id=product_id,
+                               product_quantity=Decimal(rng.randint(50, 5000)) / 10)
+            for recipe_id in recipe_ids
+            for product_id in rng.sample(product_ids, min(len(product_ids), rng.randint(
+                options['min_ingredients'], options['max_ingredients'])))
+        ), batch_size)
+        for batch in batches(recipe_ids, batch_size):
+            Recipe.objects.filter(pk__in=batch).refresh_nutrition()
+        start = self.stage(f'{len(recipe_ids)} recipes, {ingredients} ingredients', start)
+
+        password = make_password(DEFAULT_PASSWORD)
+        self.insert(User, (User(username=f'{prefix}_user_{index}', password=password)
+                           for index in range(options['users'])), batch_size)
+        user_ids = list(User.objects.filter(username__startswith=f'{prefix}_user_').order_by('pk').
+                        values_list('pk', flat=True))
+        self.insert(Persons, (Persons(name=f'Osoba {index}', calories=rng.randrange(1500, 3500, 100), user_id=user_id)
+                              for user_id in user_ids for index in range(options['persons'])), batch_size)
+        user_persons = {}
+        for person_id, user_id in Persons.objects.filter(user_id__in=user_ids).order_by('pk'). \
+                values_list('pk', 'user_id'):
+            user_persons.setdefault(user_id, []).append(person_id)
+        self.insert(Plan, (Plan(plan_name=f'Plan {index}', user_id=user_id,
+                                plan_length=rng.randint(1, options['plan_length']))
+                           for user_id in user_ids for index in range(options['plans'])), batch_size)
+        plans = list(Plan.objects.filter(user_id__in=user_ids).order_by('pk').values_list('pk', 'user_id',
+                                                                                          'plan_length'))
+        self.insert(Plan.persons.through, (
+            Plan.persons.through(plan_id=plan_id, persons_id=person_id)
+            for plan_id, user_id, _ in plans
+            for person_id in rng.sample(user_persons[user_id], rng.randint(1, len(user_persons[user_id])))
+        ), batch_size)
+        start = self.stage(f'{len(user_ids)} users, {len(plans)} plans', start)
+
+        meals = self.insert(Meal, (
+            Meal(plan_id=plan_id, plan_day=plan_day, meal=meal, recipes_id=rng.choice(recipe_ids), user_id=user_id,
+                 meal_portions=Decimal(rng.randint(5, 30)) / 10)
+            for plan_id, user_id, plan_length in plans
+            for plan_day in range(1, plan_length + 1)
+            for meal, _ in MEALS
+            if rng.random() < options['fill']
+        ), batch_size)
+        for batch in batches([plan_id for plan_id, _, _ in plans], max(1, batch_size // 50)):
+            PlanDaySummary.objects.rebuild(batch)
+        # bulk_create skips signals which invalidate categories version.
+        bump_categories_version()
+        self.stage(f'{meals} meals', start)
+        self.stdout.write(f'Generated dataset "{prefix}", users password: {DEFAULT_PASSWORD}')
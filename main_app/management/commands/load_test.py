@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from main_app.benchmarks import load_test
+from main_app.management.commands.generate_dataset import DEFAULT_PASSWORD
+
+
+class Command(BaseCommand):
+    """
+    Load test running servers with concurrent requests of logged-in user and compare their throughput and latency,
+    e.g. gunicorn sync workers serving cookee.wsgi with uvicorn workers serving cookee.asgi.
+    """
+    help = 'Send concurrent requests to running servers and compare their throughput and latency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', nargs='+', required=True,
+                            help='Urls of compared servers, e.g. http://127.0.0.1:8000 http://127.0.0.1:8001.')
+        parser.add_argument('--paths', nargs='+', default=['/products', '/recipes', '/plans', '/persons'],
+                            help='Requested paths.')
+        parser.add_argument('--concurrency', type=int, default=32, help='Number of requests sent at once.')
+        parser.add_argument('--requests', type=int, default=1000, help='Number of requests sent to every server.')
+        parser.add_argument('--username', default='gen_user_0', help='Username of user logged in to servers.')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD, help='Password of user logged in to servers.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 2:
+            raise CommandError('Send at least 2 requests.')
+        baseline = None
+        for url in options['url']:
+            try:
+                result = load_test(url.rstrip('/'), options['paths'], options['concurrency'], options['requests'],
+                                   options['username'], options['password'])
+            except ValueError as error:
+                raise CommandError(str(error))
+            baseline = baseline or result['requests_per_s']
+            self.stdout.write(f'{url:<30} {result["requests_per_s"]:>8.1f} req/s '
+                              f'({result["requests_per_s"] / baseline:.2f}x) p50 {result["p50_ms"]:>7.1f} ms '
+                              f'p95 {result["p95_ms"]:>7.1f} ms p99 {result["p99_ms"]:>7.1f} ms '
+                              f'errors {result["errors"]}')
@@ -0,0 +1,78 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from main_app.models import Recipe, PlanDaySummary, NUTRIENTS
+from main_app.nutrition import recipes_nutrition, plan_days_nutrition, to_decimal
+
+TOLERANCE = Decimal('0.01')
+
+
+def recipe_nutrition_mismatches(recipes=None):
+    """
+    Compare stored nutrition of recipes with nutrition calculated from their ingredients by the vectorized kernel.
+    :param recipes: Recipe model QuerySet, all recipes by default.
+    :return: List of tuples with Recipe model object primary key, field name, stored and calculated value.
+    """
+    recipes = Recipe.objects.all() if recipes is None else recipes
+    fields = [*NUTRIENTS, *[f'portion_{nutrient}' for nutrient in NUTRIENTS]]
+    calculated = recipes_nutrition(recipes)
+    stored = recipes.order_by('pk').values_list(*fields)
+    mismatches = []
+    for index, values in enumerate(stored):
+        for field, value in zip(fields, values):
+            expected = to_decimal(calculated[field][index])
+            if abs(value - expected) > TOLERANCE:
+                mismatches.append((int(calculated['recipe_ids'][index]), field, value, expected))
+    return mismatches
+
+
+def plan_day_summary_mismatches():
+    """
+    Compare PlanDaySummary model objects with plan days nutrition calculated by the vectorized kernel.
+    :return: List of tuples with (Plan model object primary key, plan_day), field name, stored and calculated value.
+    """
+    calculated = plan_days_nutrition()
+    mismatches = []
+    for summary in PlanDaySummary.objects.values('plan_id', 'plan_day', 'meals_count', *NUTRIENTS):
+        slot = (summary['plan_id'], summary['plan_day'])
+        expected = calculated.pop(slot, {'meals_count': 0, **{nutrient: Decimal(0) for nutrient in NUTRIENTS}})
+        for field, value in expected.items():
+            if abs(summary[field] - value) > (TOLERANCE if field != 'meals_count' else 0):
+                mismatches.append((slot, field, summary[field], value))
+    for slot, expected in calculated.items():
+        mismatches.append((slot, 'meals_count', 0, expected['meals_count']))
+    return mismatches
+
+
+class Command(BaseCommand):
+    """
+    Recalculate stored calories and macronutrients of Recipe model objects.
+    """
+    help = 'Recalculate stored recipes nutrition in primary key batches, or verify it with --verify, which fails ' \
+           'when mismatches are found.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of recipes updated in one query.')
+        parser.add_argument('--verify', action='store_true',
+                            help='Only compare stored recipes nutrition and plan day summaries with nutrition '
+                                 'calculated from ingredients.')
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            mismatches = recipe_nutrition_mismatches()
+            for pk, field, stored, calculated in mismatches:
+                self.stdout.write(f'Recipe {pk} {field}: stored {stored}, calculated {calculated}')
+            summary_mismatches = plan_day_summary_mismatches()
+            for (plan_id, plan_day), field, stored, calculated in summary_mismatches:
+                self.stdout.write(f'Plan {plan_id} day {plan_day} {field}: stored {stored}, calculated {calculated}')
+            found = len(mismatches) + len(summary_mismatches)
+            if found:
+                raise CommandError(f'Found {found} mismatches')
+            self.stdout.write('Found 0 mismatches')
+            return
+        batch_size = options['batch_size']
+        last_pk = Recipe.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        updated = 0
+        for start in range(0, last_pk, batch_size):
+            updated += Recipe.objects.filter(pk__gt=start, pk__lte=start + batch_size).refresh_nutrition()
+        self.stdout.write(f'Updated {updated} recipes')
@@ -0,0 +1,49 @@
+import multiprocessing
+from django.core.management.base import BaseCommand
+from django.db import connections
+from main_app.jobs import work, requeue_stale_jobs
+
+
+def worker_process(poll_interval, once, stale_timeout):
+    """
+    Run jobs loop in a worker process with its own database connections.
+    :param poll_interval: Seconds to sleep when the queue is empty.
+    :param once: Stop when the queue is empty.
+    :param stale_timeout: Seconds after which running job is put back to queue.
+    """
+    connections.close_all()
+    work(poll_interval=poll_interval, once=once, stale_timeout=stale_timeout)
+
+
+class Command(BaseCommand):
+    """
+    Run pool of worker processes executing queued Job model objects.
+    """
+    help = 'Run pool of worker processes executing queued background jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Number of worker processes.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--stale-timeout', type=int, default=600,
+                            help='Seconds after which running job is put back to queue, on start and periodically.')
+        parser.add_argument('--once', action='store_true', help='Stop when the queue is empty.')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(options['stale_timeout'])
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale jobs')
+        connections.close_all()
+        worker_args = (options['poll_interval'], options['once'], options['stale_timeout'])
+        processes = [multiprocessing.Process(target=worker_process, args=worker_args)
+                     for _ in range(options['workers'])]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'Started {len(processes)} workers')
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+                process.join()
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.urls import Resolver404, resolve
+from whitenoise.middleware import WhiteNoiseMiddleware
+from main_app.routers import RequestWrites, current_writes, replica_configured, replica_reads_enabled
+
+logger = logging.getLogger(__name__)
+
+# Metrics of the request handled in the current context, read by database calls of async views running in other
+# threads than the middleware.
+current_metrics = ContextVar('current_metrics', default=None)
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+def query_shape(sql):
+    """
+    Normalize parametrized SQL query, so queries differing only by parameters and IN list length are equal.
+    :param sql: SQL query with parameter placeholders.
+    :return: Normalized SQL query.
+    """
+    return WHITESPACE.sub(' ', IN_LIST.sub('IN (...)', sql)).strip()
+
+
+class RequestMetrics:
+    """
+    Collect queries and template render time of one request. Used as database connection execute wrapper.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.queries_time = 0.0
+        self.render_time = 0.0
+        self.render_queries = 0
+        self.rendering = False
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Execute query, measuring its time and recording its shape.
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries_time += time.perf_counter() - start
+            self.queries += 1
+            self.render_queries += self.rendering
+            self.shapes[query_shape(sql)] += 1
+
+    def repeated_queries(self):
+        """
+        Find query shapes executed at least N_PLUS_ONE_THRESHOLD setting times, most probably by a loop over objects
+        loading their relations one by one.
+        :return: List of (query shape, count) tuples, the most repeated first.
+        """
+        return [(shape, count) for shape, count in self.shapes.most_common(settings.N_PLUS_ONE_TOP)
+                if count >= settings.N_PLUS_ONE_THRESHOLD]
+
+    @contextmanager
+    def measure_render(self):
+        """
+        Measure time and queries of template rendering inside the block.
+        """
+        start = time.perf_counter()
+        self.rendering = True
+        try:
+            yield
+        finally:
+            self.rendering = False
+            self.render_time += time.perf_counter() - start
+
+
+@contextmanager
+def instrumented_connections(metrics):
+    """
+    Record queries of all database connections of the current thread in metrics inside the block.
+    :param metrics: RequestMetrics object or None to record nothing.
+    """
+    with ExitStack() as stack:
+        if metrics is not None:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+        yield
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Measure wall time, number and time of SQL queries, template render time and repeated query shapes of every
+    request. Metrics are added as Server-Timing header, logged as one JSON line and checked against view query budget
+    from QUERY_BUDGETS setting (QUERY_BUDGET by default), logging a warning when the budget is exceeded.
+    Under ASGI the middleware runs asynchronously, so async views are not forced to the sync path, and queries are
+    recorded by database calls of async views through current_metrics.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marks the instance as coroutine function for Django handler, as MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = request.metrics = RequestMetrics()
+        start = time.perf_counter()
+        with instrumented_connections(metrics):
+            response = self.get_response(request)
+        return self.finish(request, response, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics = request.metrics = RequestMetrics()
+        start = time.perf_counter()
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, time.perf_counter() - start)
+
+    def finish(self, request, response, wall_time):
+        """
+        Add Server-Timing header to response, log request metrics and check view query budget.
+        :param request: Django request object with metrics.
+        :param response: Django response object.
+        :param wall_time: Request wall time in seconds.
+        :return: Response.
+        """
+        metrics = request.metrics
+        view_name = request.resolver_match.view_name if request.resolver_match else None
+        repeated = metrics.repeated_queries()
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'total;dur={wall_time * 1000:.1f}',
+                f'db;dur={metrics.queries_time * 1000:.1f};desc="{metrics.queries} queries"',
+                f'render;dur={metrics.render_time * 1000:.1f};desc="{metrics.render_queries} queries"',
+            ])
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            'wall_ms': round(wall_time * 1000, 1),
+            'queries': metrics.queries,
+            'queries_ms': round(metrics.queries_time * 1000, 1),
+            'render_ms': round(metrics.render_time * 1000, 1),
+            'render_queries': metrics.render_queries,
+            'repeated_queries': [{'sql': shape, 'count': count} for shape, count in repeated],
+        }))
+        budget = settings.QUERY_BUDGETS.get(view_name, settings.QUERY_BUDGET)
+        if metrics.queries > budget:
+            logger.warning('Query budget of %s exceeded: %s queries, budget %s, repeated queries: %s',
+                           view_name or request.path, metrics.queries, budget,
+                           '; '.join(f'{count}x {shape}' for shape, count in repeated) or 'none')
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        Wrap template response render to measure its time and queries run by lazy querysets and model properties
+        used in templates. Under ASGI the response is rendered in another thread, which connections are recorded
+        during rendering.
+        """
+        metrics = request.metrics
+        render = response.render
+
+        def timed_render():
+            with metrics.measure_render(), instrumented_connections(current_metrics.get()):
+                return render()
+
+        response.render = timed_render
+        return response
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise middleware which can run asynchronously. WhiteNoise 5 middleware is sync only, so under ASGI Django
+    would run all middleware after it and the views in one thread shared by all requests. Static files are looked up
+    in memory, without blocking the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        response = self.process_request(request)
+        if response is None:
+            response = await self.get_response(request)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Send reads of GET and HEAD requests of read-only views, which set replica_reads attribute, to the replica
+    database, when it is configured. Requests which write keep their session on primary for REPLICA_STICKINESS
+    seconds, so users see their own writes, e.g. on the page they are redirected to, before they reach the replica.
+    Goes after SessionMiddleware and runs asynchronously under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+    session_key = 'primary_reads_until'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        writes = RequestWrites()
+        tokens = current_writes.set(writes), replica_reads_enabled.set(self.use_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            current_writes.reset(tokens[0])
+            replica_reads_enabled.reset(tokens[1])
+        return self.finish(request, response, writes)
+
+    async def __acall__(self, request):
+        writes = RequestWrites()
+        tokens = current_writes.set(writes), replica_reads_enabled.set(self.use_replica(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_writes.reset(tokens[0])
+            replica_reads_enabled.reset(tokens[1])
+        return self.finish(request, response, writes)
+
+    def use_replica(self, request):
+        """
+        Check if reads of request go to the replica. The session is read only when the replica is configured.
+        :param request: Django request object.
+        :return: True if request is GET or HEAD request of read-only view outside stickiness window of its session.
+        """
+        if request.method not in ('GET', 'HEAD') or not replica_configured():
+            return False
+        try:
+            view = resolve(request.path_info).func
+        except Resolver404:
+            return False
+        if not getattr(getattr(view, 'view_class', None), 'replica_reads', False):
+            return False
+        session = getattr(request, 'session', None)
+        return session is None or session.get(self.session_key, 0) < time.time()
+
+    def finish(self, request, response, writes):
+        """
+        Keep session of request which wrote, or could write, on primary for REPLICA_STICKINESS seconds.
+        :param request: Django request object.
+        :param response: Django response object.
+        :param writes: RequestWrites object of request.
+        :return: Response.
+        """
+        session = getattr(request, 'session', None)
+        if session is not None and replica_configured() and \
+                (writes.written or request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')):
+            session[self.session_key] = time.time() + settings.REPLICA_STICKINESS
+        return response
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.9 on 2026-10-18 10:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0010_alter_productsquantities_product_quantity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoppinglist',
+            name='fingerprint',
+            field=models.CharField(default='', editable=False, max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglist',
+            constraint=models.UniqueConstraint(condition=models.Q(('fingerprint', ''), _negated=True), fields=('plan', 'fingerprint'), name='unique_shopping_list_plan_fingerprint'),
+        ),
+    ]
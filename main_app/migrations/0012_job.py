@@ -0,0 +1,35 @@
+# Generated by Django 3.2.9 on 2026-10-18 10:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main_app', '0011_shoppinglist_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('shopping_list', 'Lista zakupów'), ('shopping_list_pdf', 'Lista zakupów pdf')], max_length=20)),
+                ('status', models.CharField(choices=[('queued', 'W kolejce'), ('running', 'W trakcie'), ('done', 'Gotowe'), ('failed', 'Błąd')], default='queued', max_length=10)),
+                ('result', models.BinaryField(null=True)),
+                ('error', models.TextField(blank=True, default='')),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+                ('plan', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='main_app.plan')),
+                ('shopping_list', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='main_app.shoppinglist')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'date_created'], name='job_status_created_idx'),
+        ),
+    ]
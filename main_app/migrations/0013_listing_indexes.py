@@ -0,0 +1,30 @@
+# Generated by Django 3.2.9 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0012_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='product_name',
+            field=models.CharField(db_index=True, max_length=100, verbose_name='Nazwa produktu'),
+        ),
+        migrations.AddIndex(
+            model_name='persons',
+            index=models.Index(fields=['user', 'id'], name='persons_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='plan',
+            index=models.Index(fields=['user', 'id'], name='plan_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'id'], name='product_category_id_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.9 on 2026-10-18 10:21
+
+import re
+from django.db import migrations, models
+from text_unidecode import unidecode
+
+
+def normalize_search_text(text):
+    return re.sub(r'\s+', ' ', unidecode(text or '')).strip().lower()
+
+
+def fill_search_name(apps, schema_editor):
+    Product = apps.get_model('main_app', 'Product')
+    products = []
+    for product in Product.objects.only('id', 'product_name').iterator(chunk_size=2000):
+        product.search_name = normalize_search_text(product.product_name)
+        products.append(product)
+        if len(products) == 2000:
+            Product.objects.bulk_update(products, ['search_name'])
+            products = []
+    Product.objects.bulk_update(products, ['search_name'])
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS product_search_name_trgm_idx '
+                          'ON main_app_product USING gin (search_name gin_trgm_ops)')
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS product_search_name_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0013_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_name',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=200),
+        ),
+        migrations.RunPython(fill_search_name, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 3.2.9 on 2026-10-18 10:25
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, Sum, Value, ExpressionWrapper, OuterRef, Subquery
+from django.db.models.functions import Coalesce, NullIf
+
+
+def fill_recipe_nutrition(apps, schema_editor):
+    Recipe = apps.get_model('main_app', 'Recipe')
+    ProductsQuantities = apps.get_model('main_app', 'ProductsQuantities')
+    output_field = models.DecimalField(max_digits=14, decimal_places=4)
+    quantity = F('product_quantity') / Value(Decimal('100.0'))
+    proteins = F('product_id__proteins')
+    carbohydrates = F('product_id__carbohydrates')
+    fats = F('product_id__fats')
+    expressions = {
+        'calories': (proteins * 4 + carbohydrates * 4 + fats * 9) * quantity,
+        'proteins': proteins * quantity,
+        'carbohydrates': carbohydrates * quantity,
+        'fats': fats * quantity,
+    }
+    ingredients = ProductsQuantities.objects.filter(recipe_id=OuterRef('pk')).order_by().values('recipe_id')
+    portions = NullIf(F('portions'), Value(0), output_field=output_field)
+    values = {}
+    for nutrient, expression in expressions.items():
+        total = Coalesce(Subquery(ingredients.annotate(
+            total=Sum(ExpressionWrapper(expression, output_field=output_field))).values('total')[:1]), Value(0),
+            output_field=output_field)
+        values[nutrient] = total
+        values[f'portion_{nutrient}'] = Coalesce(ExpressionWrapper(total / portions, output_field=output_field),
+                                                 Value(0), output_field=output_field)
+    Recipe.objects.update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0014_product_search_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='calories',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Kalorie'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='carbohydrates',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Węglowodany'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='fats',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Tłuszcze'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='portion_calories',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Kalorie w porcji'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='portion_carbohydrates',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Węglowodany w porcji'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='portion_fats',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Tłuszcze w porcji'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='portion_proteins',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Białka w porcji'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='proteins',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Białka'),
+        ),
+        migrations.RunPython(fill_recipe_nutrition, migrations.RunPython.noop),
+    ]
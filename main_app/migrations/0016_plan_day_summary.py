@@ -0,0 +1,58 @@
+# Generated by Django 3.2.9 on 2026-10-18 10:30
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, Sum, Count, ExpressionWrapper
+import django.db.models.deletion
+
+NUTRIENTS = ('calories', 'proteins', 'carbohydrates', 'fats')
+
+
+def fill_plan_day_summaries(apps, schema_editor):
+    Meal = apps.get_model('main_app', 'Meal')
+    PlanDaySummary = apps.get_model('main_app', 'PlanDaySummary')
+    output_field = models.DecimalField(max_digits=14, decimal_places=4)
+    sums = {
+        nutrient: Sum(ExpressionWrapper(F('meal_portions') * F(f'recipes__portion_{nutrient}'),
+                                        output_field=output_field))
+        for nutrient in NUTRIENTS
+    }
+    rows = Meal.objects.filter(plan_name__isnull=False).values('plan_name', 'plan_day'). \
+        annotate(meals_count=Count('pk'), **sums).order_by()
+    summaries = []
+    for row in rows.iterator():
+        summaries.append(PlanDaySummary(plan_id=row['plan_name'], plan_day=row['plan_day'],
+                                        meals_count=row['meals_count'],
+                                        **{nutrient: round(row[nutrient] or Decimal(0), 2) for nutrient in NUTRIENTS}))
+        if len(summaries) == 2000:
+            PlanDaySummary.objects.bulk_create(summaries)
+            summaries = []
+    PlanDaySummary.objects.bulk_create(summaries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0015_recipe_nutrition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlanDaySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plan_day', models.IntegerField(verbose_name='Dzień planu')),
+                ('calories', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Kalorie')),
+                ('proteins', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Białka')),
+                ('carbohydrates', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Węglowodany')),
+                ('fats', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Tłuszcze')),
+                ('meals_count', models.IntegerField(default=0, verbose_name='Liczba posiłków')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main_app.plan')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='plandaysummary',
+            constraint=models.UniqueConstraint(fields=('plan', 'plan_day'), name='unique_plan_day_summary'),
+        ),
+        migrations.RunPython(fill_plan_day_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def copy_meal_plans(apps, schema_editor):
+    # Meal related to more plans is copied for every other plan, meals without plan are unreachable and deleted.
+    Meal = apps.get_model('main_app', 'Meal')
+    Through = Meal.plan_name.through
+    first_plan = Through.objects.filter(meal_id=OuterRef('pk')).order_by('plan_id').values('plan_id')[:1]
+    Meal.objects.update(plan_id=Subquery(first_plan))
+    copies = []
+    for relation in Through.objects.exclude(plan_id=F('meal__plan_id')).select_related('meal'). \
+            order_by('meal_id', 'plan_id').iterator(chunk_size=2000):
+        meal = relation.meal
+        meal.pk = None
+        meal.plan_id = relation.plan_id
+        copies.append(meal)
+        if len(copies) == 2000:
+            Meal.objects.bulk_create(copies)
+            copies = []
+    Meal.objects.bulk_create(copies)
+    Meal.objects.filter(plan__isnull=True).delete()
+
+
+def copy_meal_plans_back(apps, schema_editor):
+    Meal = apps.get_model('main_app', 'Meal')
+    Through = Meal.plan_name.through
+    relations = []
+    for meal_id, plan_id in Meal.objects.filter(plan__isnull=False).values_list('pk', 'plan_id'). \
+            iterator(chunk_size=2000):
+        relations.append(Through(meal_id=meal_id, plan_id=plan_id))
+        if len(relations) == 2000:
+            Through.objects.bulk_create(relations)
+            relations = []
+    Through.objects.bulk_create(relations)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0016_plan_day_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='plan',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='main_app.plan',
+                                    verbose_name='Plan'),
+        ),
+        migrations.RunPython(copy_meal_plans, copy_meal_plans_back),
+        migrations.RemoveField(
+            model_name='meal',
+            name='plan_name',
+        ),
+        migrations.AlterField(
+            model_name='meal',
+            name='plan',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main_app.plan',
+                                    verbose_name='Plan'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['plan', 'plan_day', 'meal'], name='meal_plan_day_meal_idx'),
+        ),
+    ]
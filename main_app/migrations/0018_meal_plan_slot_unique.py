@@ -0,0 +1,52 @@
+# Generated by Django 3.2.9 on 2026-10-18 10:34
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, Sum, Count, ExpressionWrapper
+
+NUTRIENTS = ('calories', 'proteins', 'carbohydrates', 'fats')
+
+
+def delete_duplicate_slot_meals(apps, schema_editor):
+    # The most recently modified meal of every plan slot is kept, summaries of changed plan days are recalculated.
+    Meal = apps.get_model('main_app', 'Meal')
+    PlanDaySummary = apps.get_model('main_app', 'PlanDaySummary')
+    duplicates = Meal.objects.filter(meal__isnull=False).values('plan_id', 'plan_day', 'meal'). \
+        annotate(meals_count=Count('pk')).filter(meals_count__gt=1).order_by()
+    slots = set()
+    for slot in duplicates.iterator():
+        meals = Meal.objects.filter(plan_id=slot['plan_id'], plan_day=slot['plan_day'], meal=slot['meal'])
+        kept = meals.order_by('-date_modified', '-pk').values_list('pk', flat=True)[0]
+        meals.exclude(pk=kept).delete()
+        slots.add((slot['plan_id'], slot['plan_day']))
+    output_field = models.DecimalField(max_digits=14, decimal_places=4)
+    sums = {
+        nutrient: Sum(ExpressionWrapper(F('meal_portions') * F(f'recipes__portion_{nutrient}'),
+                                        output_field=output_field))
+        for nutrient in NUTRIENTS
+    }
+    for plan_id, plan_day in slots:
+        row = Meal.objects.filter(plan_id=plan_id, plan_day=plan_day). \
+            aggregate(meals_count=Count('pk'), **sums)
+        PlanDaySummary.objects.filter(plan_id=plan_id, plan_day=plan_day). \
+            update(meals_count=row['meals_count'],
+                   **{nutrient: round(row[nutrient] or Decimal(0), 2) for nutrient in NUTRIENTS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0017_meal_plan'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_slot_meals, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='meal',
+            name='meal_plan_day_meal_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='meal',
+            constraint=models.UniqueConstraint(fields=('plan', 'plan_day', 'meal'), name='unique_meal_plan_slot'),
+        ),
+    ]
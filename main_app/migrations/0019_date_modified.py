@@ -0,0 +1,26 @@
+# Generated by Django 3.2.9 on 2026-10-18 11:08
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0018_meal_plan_slot_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='date_modified',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='date_modified',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
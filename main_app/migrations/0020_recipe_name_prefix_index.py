@@ -0,0 +1,29 @@
+# Generated by Django 3.2.9 on 2026-10-18 10:30
+
+from django.db import migrations
+
+
+def create_prefix_index(apps, schema_editor):
+    # recipe_name__istartswith is UPPER("recipe_name"::text) LIKE UPPER('prefix%') on PostgreSQL, which plain B-tree
+    # indexes do not serve. Other databases do not use indexes for it at all.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE INDEX IF NOT EXISTS recipe_name_upper_like_idx '
+                          'ON main_app_recipe (UPPER(recipe_name::text) text_pattern_ops)')
+
+
+def drop_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_name_upper_like_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0019_date_modified'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_index, drop_prefix_index),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.9 on 2026-10-18 12:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0020_recipe_name_prefix_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FragmentVersion',
+            fields=[
+                ('key', models.CharField(max_length=200, primary_key=True, serialize=False)),
+                ('version', models.CharField(max_length=32)),
+            ],
+        ),
+    ]
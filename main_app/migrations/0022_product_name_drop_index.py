@@ -0,0 +1,18 @@
+# Generated by Django 3.2.9 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0021_fragment_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='product_name',
+            field=models.CharField(max_length=100, verbose_name='Nazwa produktu'),
+        ),
+    ]
@@ -1,5 +1,12 @@
-from django.db import models
+import threading
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import models, transaction, connections, router, IntegrityError
+from django.utils import timezone
+from django.db.models import F, Func, Sum, Count, Value, ExpressionWrapper, OuterRef, Subquery
+from django.db.models.functions import Coalesce, NullIf
 from django.contrib.auth.models import User
+from main_app.fragments import bump_versions, PLAN_DAY
 
 
 MEALS = (
@@ -31,6 +38,13 @@ class Product(models.Model):
     fats = models.DecimalField(null=True, verbose_name='Tłuszcze', decimal_places=2, max_digits=6)
     category = models.ForeignKey(ProductCategory, on_delete=models.CASCADE, verbose_name='Kategoria')
     add_date = models.DateField(auto_created=True, auto_now=True)
+    date_modified = models.DateTimeField(auto_now=True, db_index=True)
+    search_name = models.CharField(max_length=200, default='', editable=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'id'], name='product_category_id_idx'),
+        ]
 
     @property
     def calories(self):
@@ -40,10 +54,107 @@ class Product(models.Model):
         calories_calculated = self.proteins * 4 + self.carbohydrates * 4 + self.fats * 9
         return round(calories_calculated, 2)
 
+    def delete(self, *args, **kwargs):
+        """
+        Delete product with its recipe ingredients, refreshing nutrition of recipes which used it once.
+        """
+        with deferred_refreshes():
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         return f"{self.product_name}"
 
 
+NUTRITION_FIELD = models.DecimalField(max_digits=14, decimal_places=4)
+NUTRIENTS = ('calories', 'proteins', 'carbohydrates', 'fats')
+HUNDREDTH = Decimal('0.01')
+
+
+def round_nutrition(value):
+    """
+    Round stored nutrient amount to 2 decimal places, half away from zero like PostgreSQL numeric columns.
+    :param value: Decimal object or None.
+    :return: Rounded Decimal object, 0 for None.
+    """
+    return Decimal(value or 0).quantize(HUNDREDTH, rounding=ROUND_HALF_UP)
+
+
+def round_nutrition_expression(expression):
+    """
+    Round nutrient amount expression to 2 decimal places in the database, so every database stores the same value.
+    :param expression: Django expression.
+    :return: ROUND expression.
+    """
+    return Func(expression, Value(2), function='ROUND', output_field=NUTRITION_FIELD)
+
+
+def quantity_nutrition_expressions(prefix=''):
+    """
+    Create expressions of calories and macronutrients carried by a ProductsQuantities row.
+    :param prefix: Lookup path from the queried model to ProductsQuantities model, ending with '__'.
+    :return: Dictionary with expression for every nutrient in NUTRIENTS.
+    """
+    # Decimal divisor keeps the division non-integer on SQLite, where whole decimals are stored as integers.
+    quantity = F(f'{prefix}product_quantity') / Value(Decimal('100.0'))
+    proteins = F(f'{prefix}product_id__proteins')
+    carbohydrates = F(f'{prefix}product_id__carbohydrates')
+    fats = F(f'{prefix}product_id__fats')
+    expressions = {
+        'calories': (proteins * 4 + carbohydrates * 4 + fats * 9) * quantity,
+        'proteins': proteins * quantity,
+        'carbohydrates': carbohydrates * quantity,
+        'fats': fats * quantity,
+    }
+    return {nutrient: ExpressionWrapper(expression, output_field=NUTRITION_FIELD)
+            for nutrient, expression in expressions.items()}
+
+
+class RecipeQuerySet(models.QuerySet):
+    """
+    Recipe model QuerySet.
+    """
+
+    def with_nutrition(self):
+        """
+        Annotate recipes with total and one portion calories and macronutrients, computed with one aggregate over
+        ProductsQuantities joined to Product.
+        :return: QuerySet with total_<nutrient> and per_portion_<nutrient> annotations.
+        """
+        totals = {
+            f'total_{nutrient}': Coalesce(Sum(expression), Value(0), output_field=NUTRITION_FIELD)
+            for nutrient, expression in quantity_nutrition_expressions('productsquantities__').items()
+        }
+        portions = NullIf(F('portions'), Value(0), output_field=NUTRITION_FIELD)
+        per_portion = {
+            f'per_portion_{nutrient}': ExpressionWrapper(F(f'total_{nutrient}') / portions,
+                                                         output_field=NUTRITION_FIELD)
+            for nutrient in NUTRIENTS
+        }
+        return self.annotate(**totals).annotate(**per_portion)
+
+    def refresh_nutrition(self):
+        """
+        Recalculate stored total and one portion calories and macronutrients of recipes with one set-based UPDATE,
+        using correlated aggregate subqueries over ProductsQuantities joined to Product. Recipes date_modified is set,
+        because their ingredients or products changed.
+        :return: Number of updated recipes.
+        """
+        ingredients = ProductsQuantities.objects.filter(recipe_id=OuterRef('pk')).order_by().values('recipe_id')
+        portions = NullIf(F('portions'), Value(0), output_field=NUTRITION_FIELD)
+        values = {'date_modified': timezone.now()}
+        for nutrient, expression in quantity_nutrition_expressions().items():
+            total = Coalesce(Subquery(ingredients.annotate(total=Sum(expression)).values('total')[:1]), Value(0),
+                             output_field=NUTRITION_FIELD)
+            values[nutrient] = round_nutrition_expression(total)
+            values[f'portion_{nutrient}'] = round_nutrition_expression(Coalesce(
+                ExpressionWrapper(total / portions, output_field=NUTRITION_FIELD), Value(0),
+                output_field=NUTRITION_FIELD))
+        with transaction.atomic(using=self.db, savepoint=False):
+            updated = self.update(**values)
+            PlanDaySummary.objects.refresh(Meal.objects.filter(recipes__in=self).values_list('plan', 'plan_day'))
+        return updated
+
+
 class Recipe(models.Model):
     """
     Recipe model.
@@ -55,24 +166,36 @@ class Recipe(models.Model):
     portions = models.DecimalField(default=4, verbose_name='Porcje', decimal_places=1, max_digits=3)
     add_date = models.DateField(auto_created=True, auto_now=True)
     edit_date = models.DateField(auto_now_add=True)
+    date_modified = models.DateTimeField(auto_now=True, db_index=True)
+    calories = models.DecimalField(default=0, verbose_name='Kalorie', decimal_places=2, max_digits=12, editable=False)
+    proteins = models.DecimalField(default=0, verbose_name='Białka', decimal_places=2, max_digits=12, editable=False)
+    carbohydrates = models.DecimalField(default=0, verbose_name='Węglowodany', decimal_places=2, max_digits=12,
+                                        editable=False)
+    fats = models.DecimalField(default=0, verbose_name='Tłuszcze', decimal_places=2, max_digits=12, editable=False)
+    portion_calories = models.DecimalField(default=0, verbose_name='Kalorie w porcji', decimal_places=2,
+                                           max_digits=12, editable=False)
+    portion_proteins = models.DecimalField(default=0, verbose_name='Białka w porcji', decimal_places=2,
+                                           max_digits=12, editable=False)
+    portion_carbohydrates = models.DecimalField(default=0, verbose_name='Węglowodany w porcji', decimal_places=2,
+                                                max_digits=12, editable=False)
+    portion_fats = models.DecimalField(default=0, verbose_name='Tłuszcze w porcji', decimal_places=2,
+                                       max_digits=12, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     @property
     def recipe_calories(self):
         """
-        Calculate recipe calories.
+        Get recipe calories stored by RecipeQuerySet.refresh_nutrition().
         """
-        calories_calculated = 0
-        for product in self.products.all():
-            calories_calculated += product.calories * product.productsquantities_set.\
-                get(product_id=product.id, recipe_id=self.pk).product_quantity / 100
-        return round(calories_calculated, 2)
+        return self.calories
 
-    @property
-    def portion_calories(self):
+    def delete(self, *args, **kwargs):
         """
-        Calculate 1 portion of recipe meal calories.
+        Delete recipe with its ingredients and meals, refreshing summaries of plan days it was planned in once.
         """
-        return round(self.recipe_calories / self.portions, 2)
+        with deferred_refreshes():
+            return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"{self.recipe_name}"
@@ -86,6 +209,11 @@ class Persons(models.Model):
     calories = models.IntegerField(verbose_name='Zapotrzebowanie na kalorie')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='persons_user_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.name}"
 
@@ -100,6 +228,11 @@ class Plan(models.Model):
     persons = models.ManyToManyField(Persons, verbose_name='Osoby')
     date_modified = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='plan_user_id_idx'),
+        ]
+
     @property
     def plan_calories(self):
         """
@@ -110,15 +243,88 @@ class Plan(models.Model):
             result += person.calories
         return result
 
+    def delete(self, *args, **kwargs):
+        """
+        Delete plan with its meals and summaries without refreshing summaries per deleted meal.
+        """
+        with deferred_refreshes():
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         return f"{self.plan_name}"
 
 
+class MealQuerySet(models.QuerySet):
+    """
+    Meal model QuerySet.
+    """
+
+    def update(self, **kwargs):
+        """
+        Update meals and refresh PlanDaySummary model objects of plan days they were and are planned for.
+        :param kwargs: Updated fields values.
+        :return: Number of updated meals.
+        """
+        with transaction.atomic(using=self.db, savepoint=False):
+            meals = list(self.values_list('pk', flat=True))
+            slots = set(Meal.objects.filter(pk__in=meals).values_list('plan', 'plan_day'))
+            updated = super().update(**kwargs)
+            slots |= set(Meal.objects.filter(pk__in=meals).values_list('plan', 'plan_day'))
+            PlanDaySummary.objects.refresh(slots)
+        return updated
+
+    def upsert(self, plan, plan_day, meal, recipe, meal_portions, user):
+        """
+        Plan recipe in plan slot: insert Meal model object or update the meal already planned in the slot. On
+        PostgreSQL and SQLite it is one INSERT ... ON CONFLICT statement, elsewhere update_or_create retried once on
+        unique slot conflict, so concurrent requests never create two meals in one slot.
+        :param plan: Plan model object.
+        :param plan_day: Meal plan_day.
+        :param meal: Meal meal parameter, one of MEALS.
+        :param recipe: Recipe model object.
+        :param meal_portions: Meal portions amount.
+        :param user: User model object creating the meal, kept when existing meal is updated.
+        """
+        # Raw statement is not routed as a write by the queryset itself.
+        db = router.db_for_write(self.model)
+        connection = connections[db]
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            lookup = {'plan': plan, 'plan_day': plan_day, 'meal': meal}
+            defaults = {'recipes': recipe, 'meal_portions': meal_portions, 'user': user}
+            try:
+                with transaction.atomic(using=db):
+                    self.update_or_create(**lookup, defaults=defaults)
+            except IntegrityError:
+                self.update_or_create(**lookup, defaults=defaults)
+            return
+        values = {
+            'plan': plan.pk,
+            'plan_day': plan_day,
+            'meal': meal,
+            'recipes': recipe.pk,
+            'user': user.pk,
+            'meal_portions': meal_portions,
+            'date_modified': timezone.now(),
+        }
+        fields = [self.model._meta.get_field(name) for name in values]
+        quote = connection.ops.quote_name
+        columns = [quote(field.column) for field in fields]
+        updated = ', '.join(f'{column} = EXCLUDED.{column}' for column in columns[3:] if column != quote('user_id'))
+        sql = (f'INSERT INTO {quote(self.model._meta.db_table)} ({", ".join(columns)}) '
+               f'VALUES ({", ".join(["%s"] * len(columns))}) '
+               f'ON CONFLICT ({", ".join(columns[:3])}) DO UPDATE SET {updated}')
+        params = [field.get_db_prep_save(value, connection) for field, value in zip(fields, values.values())]
+        with transaction.atomic(using=db, savepoint=False):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+            PlanDaySummary.objects.refresh([(plan.pk, plan_day)])
+
+
 class Meal(models.Model):
     """
     Meal model.
     """
-    plan_name = models.ManyToManyField(Plan, verbose_name='Nazwa planu')
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE, verbose_name='Plan')
     plan_day = models.IntegerField(verbose_name='Dzień planu')
     meal = models.IntegerField(choices=MEALS, null=True, verbose_name='Posiłek')
     recipes = models.ForeignKey(Recipe, on_delete=models.CASCADE, verbose_name='Przepis')
@@ -126,6 +332,13 @@ class Meal(models.Model):
     meal_portions = models.DecimalField(verbose_name='Porcje', decimal_places=1, max_digits=3)
     date_modified = models.DateTimeField(auto_now=True)
 
+    objects = MealQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['plan', 'plan_day', 'meal'], name='unique_meal_plan_slot'),
+        ]
+
     @property
     def meal_calories(self):
         """
@@ -135,7 +348,137 @@ class Meal(models.Model):
         return result
 
     def __str__(self):
-        return f"{self.plan_name}"
+        return f"{self.plan}"
+
+
+class PlanDaySummaryQuerySet(models.QuerySet):
+    """
+    PlanDaySummary model QuerySet.
+    """
+
+    def summaries(self, meals):
+        """
+        Calculate PlanDaySummary model objects of meals with one query grouped by plan and plan_day.
+        :param meals: Meal model QuerySet.
+        :return: List of not saved PlanDaySummary model objects.
+        """
+        sums = {
+            nutrient: Sum(ExpressionWrapper(F('meal_portions') * F(f'recipes__portion_{nutrient}'),
+                                            output_field=NUTRITION_FIELD))
+            for nutrient in NUTRIENTS
+        }
+        rows = meals.values('plan_id', 'plan_day').annotate(meals_count=Count('pk'), **sums).order_by()
+        return [PlanDaySummary(plan_id=row['plan_id'], plan_day=row['plan_day'], meals_count=row['meals_count'],
+                               **{nutrient: round_nutrition(row[nutrient]) for nutrient in NUTRIENTS})
+                for row in rows]
+
+    def refresh(self, slots):
+        """
+        Recalculate PlanDaySummary model objects of selected plan days with one query grouped by plan and plan_day.
+        All selected plan days of all selected plans are recalculated, so the number of queries does not depend on
+        the number of plans. Plan rows are locked, so concurrent refreshes of the same plan are serialized, and their
+        date_modified is set, because their meals changed. Cached plan day blocks of selected plan days get new
+        versions.
+        :param slots: Iterable of (Plan model object primary key, plan_day) tuples.
+        """
+        slots = set(slots)
+        if not slots:
+            return
+        plan_ids = {plan_id for plan_id, _ in slots}
+        plan_days = {plan_day for _, plan_day in slots}
+        bump_versions(PLAN_DAY, [f'{plan_id}:{plan_day}' for plan_id, plan_day in slots])
+        with transaction.atomic(using=self.db, savepoint=False):
+            plan_ids = list(Plan.objects.select_for_update().filter(pk__in=plan_ids).order_by('pk').
+                            values_list('pk', flat=True))
+            if not plan_ids:
+                return
+            Plan.objects.filter(pk__in=plan_ids).update(date_modified=timezone.now())
+            self.filter(plan_id__in=plan_ids, plan_day__in=plan_days).delete()
+            self.bulk_create(self.summaries(Meal.objects.filter(plan__in=plan_ids, plan_day__in=plan_days)))
+
+    def rebuild(self, plan_ids):
+        """
+        Recalculate all PlanDaySummary model objects of selected plans with one grouped query, e.g. after meals were
+        bulk inserted without signals. Cached plan day blocks of selected plans get new versions.
+        :param plan_ids: List of Plan model objects primary keys.
+        """
+        bump_versions(PLAN_DAY, [f'{plan_id}:{plan_day}' for plan_id, plan_length in
+                                 Plan.objects.filter(pk__in=plan_ids).values_list('pk', 'plan_length')
+                                 for plan_day in range(1, plan_length + 1)])
+        with transaction.atomic(using=self.db, savepoint=False):
+            self.filter(plan_id__in=plan_ids).delete()
+            self.bulk_create(self.summaries(Meal.objects.filter(plan_id__in=plan_ids)))
+
+
+class PlanDaySummary(models.Model):
+    """
+    Plan day summary model. Stores calories and macronutrients of plan day meals, kept current by Meal model signals.
+    """
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE)
+    plan_day = models.IntegerField(verbose_name='Dzień planu')
+    calories = models.DecimalField(default=0, verbose_name='Kalorie', decimal_places=2, max_digits=12)
+    proteins = models.DecimalField(default=0, verbose_name='Białka', decimal_places=2, max_digits=12)
+    carbohydrates = models.DecimalField(default=0, verbose_name='Węglowodany', decimal_places=2, max_digits=12)
+    fats = models.DecimalField(default=0, verbose_name='Tłuszcze', decimal_places=2, max_digits=12)
+    meals_count = models.IntegerField(default=0, verbose_name='Liczba posiłków')
+
+    objects = PlanDaySummaryQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['plan', 'plan_day'], name='unique_plan_day_summary'),
+        ]
+
+    def __str__(self):
+        return f"{self.plan} dzień {self.plan_day}"
+
+
+deferred = threading.local()
+
+
+@contextmanager
+def deferred_refreshes():
+    """
+    Collect recipes and plan days refreshed by signal receivers inside the block and refresh them once at its end.
+    Cascade deletes send a signal for every deleted row, so without deferring they run queries per row.
+    """
+    if getattr(deferred, 'refreshes', None) is not None:
+        yield
+        return
+    deferred.refreshes = {'recipes': set(), 'slots': set()}
+    try:
+        with transaction.atomic(savepoint=False):
+            yield
+            refreshes, deferred.refreshes = deferred.refreshes, None
+            if refreshes['recipes']:
+                Recipe.objects.filter(pk__in=refreshes['recipes']).refresh_nutrition()
+            PlanDaySummary.objects.refresh(refreshes['slots'])
+    finally:
+        deferred.refreshes = None
+
+
+def refresh_recipes_nutrition(recipe_ids):
+    """
+    Refresh stored nutrition of recipes, at the end of deferred_refreshes() block if inside one.
+    :param recipe_ids: Iterable of Recipe model objects primary keys.
+    """
+    refreshes = getattr(deferred, 'refreshes', None)
+    if refreshes is not None:
+        refreshes['recipes'].update(recipe_ids)
+    else:
+        Recipe.objects.filter(pk__in=recipe_ids).refresh_nutrition()
+
+
+def refresh_plan_days(slots):
+    """
+    Refresh PlanDaySummary model objects of plan days, at the end of deferred_refreshes() block if inside one.
+    :param slots: Iterable of (Plan model object primary key, plan_day) tuples.
+    """
+    refreshes = getattr(deferred, 'refreshes', None)
+    if refreshes is not None:
+        refreshes['slots'].update(slots)
+    else:
+        PlanDaySummary.objects.refresh(slots)
 
 
 class ProductsQuantities(models.Model):
@@ -163,6 +506,13 @@ class ShoppingList(models.Model):
     products = models.ManyToManyField(Product, through='ShoppingListProducts')
     date_created = models.DateTimeField(auto_created=True, auto_now=True)
     name = models.CharField(max_length=100)
+    fingerprint = models.CharField(max_length=64, default='', editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['plan', 'fingerprint'], condition=~models.Q(fingerprint=''),
+                                    name='unique_shopping_list_plan_fingerprint'),
+        ]
 
 
 class ShoppingListProducts(models.Model):
@@ -171,4 +521,56 @@ class ShoppingListProducts(models.Model):
     """
     product_quantity = models.DecimalField(default=0, decimal_places=1, max_digits=8)
     shopping_list = models.ForeignKey(ShoppingList, on_delete=models.CASCADE)
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)
\ No newline at end of file
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+
+
+class Job(models.Model):
+    """
+    Background job model.
+    """
+    SHOPPING_LIST = 'shopping_list'
+    SHOPPING_LIST_PDF = 'shopping_list_pdf'
+    KINDS = (
+        (SHOPPING_LIST, 'Lista zakupów'),
+        (SHOPPING_LIST_PDF, 'Lista zakupów pdf'),
+    )
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'W kolejce'),
+        (RUNNING, 'W trakcie'),
+        (DONE, 'Gotowe'),
+        (FAILED, 'Błąd'),
+    )
+    kind = models.CharField(max_length=20, choices=KINDS)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE, null=True)
+    shopping_list = models.ForeignKey(ShoppingList, on_delete=models.CASCADE, null=True)
+    result = models.BinaryField(null=True, editable=False)
+    error = models.TextField(blank=True, default='')
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'date_created'], name='job_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.pk} ({self.get_status_display()})"
+
+
+class FragmentVersion(models.Model):
+    """
+    Fragment version model. Stores current version of cached fragments of one object, e.g. recipe row, or of pages
+    validated by it, in the database, so all worker processes agree on it and it survives restarts and cache
+    evictions, whatever cache backend is used.
+    """
+    key = models.CharField(max_length=200, primary_key=True)
+    version = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"{self.key} {self.version}"
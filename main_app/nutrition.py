@@ -0,0 +1,145 @@
+from decimal import Decimal
+import numpy as np
+from main_app.models import Product, ProductsQuantities, Recipe, Meal, NUTRIENTS
+
+MACRONUTRIENTS = ('proteins', 'carbohydrates', 'fats')
+CALORIES_PER_GRAM = np.array([4, 4, 9], dtype=np.int64)
+
+
+def to_units(values, decimal_places):
+    """
+    Convert decimals to integers of their smallest stored unit, so sums and products stay exact.
+    :param values: Iterable of Decimal objects or None.
+    :param decimal_places: Decimal places of the values field, e.g. 2 for 12.34 converted to 1234.
+    :return: Tuple of int64 array with converted values, None as 0, and bool array marking not None values.
+    """
+    values = list(values)
+    known = np.array([value is not None for value in values], dtype=bool)
+    scale = 10 ** decimal_places
+    units = np.array([int(value * scale) if value is not None else 0 for value in values], dtype=np.int64)
+    return units, known
+
+
+def divide_round(numerator, denominator):
+    """
+    Divide non-negative integer arrays rounding half up, like round_nutrition(). Zero denominator gives 0.
+    :param numerator: int64 array.
+    :param denominator: int64 array or integer.
+    :return: int64 array with rounded quotients.
+    """
+    numerator, denominator = np.broadcast_arrays(np.asarray(numerator, dtype=np.int64),
+                                                 np.asarray(denominator, dtype=np.int64))
+    safe_denominator = np.where(denominator == 0, 1, denominator)
+    quotient, remainder = np.divmod(numerator, safe_denominator)
+    return np.where(denominator == 0, 0, quotient + (2 * remainder >= safe_denominator))
+
+
+def csr_row_sums(indptr, values):
+    """
+    Sum values of every CSR matrix row, exactly for integer values and for empty rows too.
+    :param indptr: CSR row pointers, row i values are values[indptr[i]:indptr[i + 1]].
+    :param values: Array of values in CSR order.
+    :return: Array with sum of every row.
+    """
+    cumulative = np.concatenate([np.zeros(1, dtype=values.dtype), np.cumsum(values)])
+    return cumulative[indptr[1:]] - cumulative[indptr[:-1]]
+
+
+def to_decimal(hundredths):
+    """
+    Convert integer amount of hundredths to Decimal object with 2 decimal places.
+    :param hundredths: Integer, e.g. 1234.
+    :return: Decimal object, e.g. Decimal('12.34').
+    """
+    return Decimal(int(hundredths)).scaleb(-2)
+
+
+def load_product_macros():
+    """
+    Load macronutrients of all Product model objects with one query.
+    :return: Dictionary with sorted 'product_ids' array, 'macros' int64 matrix of hundredths of grams per 100g with
+    a column for every nutrient in MACRONUTRIENTS and 'complete' array marking products with all macronutrients set.
+    """
+    rows = list(Product.objects.order_by('pk').values_list('pk', *MACRONUTRIENTS))
+    product_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    columns = [to_units([row[index] for row in rows], 2) for index in range(1, len(MACRONUTRIENTS) + 1)]
+    macros = np.stack([units for units, _ in columns], axis=1) if rows else np.zeros((0, 3), dtype=np.int64)
+    complete = np.logical_and.reduce([known for _, known in columns]) if rows else np.zeros(0, dtype=bool)
+    return {'product_ids': product_ids, 'macros': macros, 'complete': complete}
+
+
+def load_recipe_quantities(product_ids, recipes=None):
+    """
+    Load recipe x product quantity matrix in CSR format with one query.
+    :param product_ids: Sorted array of Product model objects primary keys, matrix columns.
+    :param recipes: Recipe model QuerySet, all recipes by default.
+    :return: Dictionary with 'recipe_ids' and 'portions' (tenths) arrays for matrix rows and 'indptr', 'indices'
+    (column numbers) and 'data' (tenths of grams) CSR arrays.
+    """
+    recipes = Recipe.objects.all() if recipes is None else recipes
+    recipe_rows = list(recipes.order_by('pk').values_list('pk', 'portions'))
+    recipe_ids = np.array([row[0] for row in recipe_rows], dtype=np.int64)
+    portions, _ = to_units([row[1] for row in recipe_rows], 1)
+    rows = list(ProductsQuantities.objects.filter(recipe_id__in=recipes).order_by('recipe_id', 'pk').
+                values_list('recipe_id', 'product_id', 'product_quantity'))
+    row_recipe_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    indices = np.searchsorted(product_ids, np.array([row[1] for row in rows], dtype=np.int64))
+    data, _ = to_units([row[2] for row in rows], 1)
+    indptr = np.concatenate([np.searchsorted(row_recipe_ids, recipe_ids), [len(rows)]]).astype(np.int64)
+    return {'recipe_ids': recipe_ids, 'portions': portions, 'indptr': indptr, 'indices': indices, 'data': data}
+
+
+def recipes_nutrition(recipes=None):
+    """
+    Calculate total and one portion calories and macronutrients of recipes in one vectorized pass over the CSR
+    quantity matrix. Calculation is exact in integer units and rounded to 2 decimal places like stored Recipe model
+    nutrition fields. Ingredients of products with unknown macronutrient add no calories.
+    :param recipes: Recipe model QuerySet, all recipes by default.
+    :return: Dictionary with 'recipe_ids' array and int64 array of hundredths for every nutrient in NUTRIENTS and
+    for 'portion_<nutrient>'.
+    """
+    products = load_product_macros()
+    quantities = load_recipe_quantities(products['product_ids'], recipes)
+    macros = products['macros'][quantities['indices']]
+    # Hundredths of grams per 100g multiplied by tenths of grams gives units of 1e-5 gram.
+    amounts = macros * quantities['data'][:, None]
+    totals = {nutrient: csr_row_sums(quantities['indptr'], amounts[:, index])
+              for index, nutrient in enumerate(MACRONUTRIENTS)}
+    calories = (amounts @ CALORIES_PER_GRAM) * products['complete'][quantities['indices']]
+    totals = {'calories': csr_row_sums(quantities['indptr'], calories), **totals}
+    result = {'recipe_ids': quantities['recipe_ids']}
+    for nutrient in NUTRIENTS:
+        result[nutrient] = divide_round(totals[nutrient], 1000)
+        result[f'portion_{nutrient}'] = divide_round(totals[nutrient], 100 * quantities['portions'])
+    return result
+
+
+def plan_days_nutrition(meals=None):
+    """
+    Calculate calories and macronutrients of plan days from meal portions and stored recipe one portion nutrition,
+    grouping all meals in one vectorized pass. Rounding is the same as in PlanDaySummary model objects.
+    :param meals: Meal model QuerySet, all meals by default.
+    :return: Dictionary with (Plan model object primary key, plan_day) tuple as key and dictionary with Decimal
+    amount of every nutrient in NUTRIENTS and 'meals_count' as value.
+    """
+    meals = Meal.objects.all() if meals is None else meals
+    rows = list(meals.order_by().values_list('plan_id', 'plan_day', 'meal_portions',
+                                            *[f'recipes__portion_{nutrient}' for nutrient in NUTRIENTS]))
+    if not rows:
+        return {}
+    slots = np.array([row[:2] for row in rows], dtype=np.int64)
+    unique_slots, slot_index = np.unique(slots, axis=0, return_inverse=True)
+    slot_index = slot_index.reshape(-1)
+    meal_portions, _ = to_units([row[2] for row in rows], 1)
+    meals_count = np.bincount(slot_index, minlength=len(unique_slots))
+    sums = {}
+    for offset, nutrient in enumerate(NUTRIENTS, start=3):
+        portion, _ = to_units([row[offset] for row in rows], 2)
+        day_sums = np.zeros(len(unique_slots), dtype=np.int64)
+        np.add.at(day_sums, slot_index, meal_portions * portion)
+        sums[nutrient] = divide_round(day_sums, 10)
+    return {
+        (int(plan_id), int(plan_day)): {'meals_count': int(meals_count[index]),
+                                        **{nutrient: to_decimal(sums[nutrient][index]) for nutrient in NUTRIENTS}}
+        for index, (plan_id, plan_day) in enumerate(unique_slots)
+    }
@@ -0,0 +1,48 @@
+from django.conf import settings
+
+
+def get_page_size(request):
+    """
+    Get requested page size, limited by LIST_MAX_PAGE_SIZE setting.
+    :param request: Django request object.
+    :return: Page size from 'page_size' GET parameter or LIST_PAGE_SIZE setting.
+    """
+    try:
+        page_size = int(request.GET.get('page_size', settings.LIST_PAGE_SIZE))
+    except ValueError:
+        page_size = settings.LIST_PAGE_SIZE
+    return max(1, min(page_size, settings.LIST_MAX_PAGE_SIZE))
+
+
+def keyset_page_queryset(queryset, request):
+    """
+    Get queryset of one page ordered by primary key, starting after primary key from 'after' GET parameter, with one
+    more object showing whether the next page exists.
+    :param queryset: Django QuerySet object.
+    :param request: Django request object.
+    :return: Sliced QuerySet.
+    """
+    after = request.GET.get('after', '')
+    queryset = queryset.order_by('pk')
+    if after.isdigit():
+        queryset = queryset.filter(pk__gt=int(after))
+    return queryset[:get_page_size(request) + 1]
+
+
+def keyset_paginate(queryset, request):
+    """
+    Get one page of queryset ordered by primary key, starting after primary key from 'after' GET parameter.
+    Page is read with one query using primary key index, no matter how deep it is.
+    :param queryset: Django QuerySet object.
+    :param request: Django request object.
+    :return: Dictionary with page objects list and query string of next page or None if it is the last page.
+    """
+    page_size = get_page_size(request)
+    objects = list(keyset_page_queryset(queryset, request))
+    next_page_query = None
+    if len(objects) > page_size:
+        objects = objects[:page_size]
+        query = request.GET.copy()
+        query['after'] = objects[-1].pk
+        next_page_query = query.urlencode()
+    return {'objects': objects, 'next_page_query': next_page_query}
@@ -0,0 +1,100 @@
+import io
+from django.core.cache import cache
+from django.db.models import Max
+from reportlab.pdfgen import canvas
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from main_app.models import ShoppingListProducts
+from main_app.conditional import categories_version
+
+pdfmetrics.registerFont(TTFont('Arial', 'arial.ttf'))
+
+PAGE_HEIGHT = A4[1]
+PAGE_MARGIN = 2 * cm
+FONT_SIZE = 14
+PDF_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def shopping_list_lines(shopping_list):
+    """
+    Create text lines of ShoppingList model object, with products grouped under their categories, using one ordered
+    query.
+    :param shopping_list: ShoppingList model object.
+    :return: List of text lines.
+    """
+    rows = ShoppingListProducts.objects.filter(shopping_list=shopping_list). \
+        order_by('product__category__category_name', 'product__product_name'). \
+        values_list('product__category__category_name', 'product__product_name', 'product_quantity')
+    lines = []
+    current_category = None
+    for category, product_name, product_quantity in rows:
+        if category != current_category:
+            lines.append(category)
+            current_category = category
+        lines.append(f'{product_name}, {product_quantity}g')
+    return lines
+
+
+def new_page_text(pdf_canvas):
+    """
+    Begin text object at the top of current page.
+    :param pdf_canvas: reportlab Canvas object.
+    :return: reportlab PDFTextObject object.
+    """
+    text_object = pdf_canvas.beginText(PAGE_MARGIN, PAGE_HEIGHT - PAGE_MARGIN)
+    text_object.setFont('Arial', FONT_SIZE)
+    return text_object
+
+
+def render_lines_pdf(lines):
+    """
+    Render text lines to A4 .pdf document, continuing on a new page when the bottom margin is reached.
+    :param lines: List of text lines.
+    :return: .pdf document bytes.
+    """
+    buffer = io.BytesIO()
+    pdf_canvas = canvas.Canvas(buffer, pagesize=A4)
+    text_object = new_page_text(pdf_canvas)
+    for line in lines:
+        if text_object.getY() < PAGE_MARGIN:
+            pdf_canvas.drawText(text_object)
+            pdf_canvas.showPage()
+            text_object = new_page_text(pdf_canvas)
+        text_object.textLine(line.rstrip())
+    pdf_canvas.drawText(text_object)
+    pdf_canvas.showPage()
+    pdf_canvas.save()
+    return buffer.getvalue()
+
+
+def shopping_list_pdf_cache_key(shopping_list):
+    """
+    Create cache key of ShoppingList model object .pdf document. Fingerprint covers products and quantities, the
+    latest date_modified of list products, set when a product is renamed or moved to another category, and categories
+    version, stored in the database, cover their names, so renamed products are not served from an old document by
+    any worker.
+    :param shopping_list: ShoppingList model object.
+    :return: Cache key based on shopping list fingerprint, or primary key for lists created without fingerprint.
+    """
+    products_modified = ShoppingListProducts.objects.filter(shopping_list=shopping_list). \
+        aggregate(modified=Max('product__date_modified'))['modified']
+    versions = f'{products_modified and products_modified.isoformat()}:{categories_version()}'
+    if shopping_list.fingerprint:
+        return f'shopping_list_pdf:{shopping_list.fingerprint}:{versions}'
+    return f'shopping_list_pdf:id:{shopping_list.pk}:{versions}'
+
+
+def shopping_list_pdf(shopping_list):
+    """
+    Get .pdf document of ShoppingList model object from cache. Render and cache it if missing.
+    :param shopping_list: ShoppingList model object.
+    :return: .pdf document bytes.
+    """
+    cache_key = shopping_list_pdf_cache_key(shopping_list)
+    pdf_bytes = cache.get(cache_key)
+    if pdf_bytes is None:
+        pdf_bytes = render_lines_pdf(shopping_list_lines(shopping_list))
+        cache.set(cache_key, pdf_bytes, PDF_CACHE_TIMEOUT)
+    return pdf_bytes
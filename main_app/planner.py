@@ -0,0 +1,126 @@
+from decimal import Decimal
+import numpy as np
+from django.db import transaction
+from main_app.models import Recipe, Meal, Plan, PlanDaySummary, MEALS
+
+MEAL_CALORIES_SHARES = {1: 0.25, 2: 0.1, 3: 0.35, 4: 0.1, 5: 0.2}
+MIN_PORTIONS = 0.5
+MAX_PORTIONS = 5.0
+DEFAULT_TOLERANCE = 0.05
+
+
+def choose_recipe(needed_portions, usage, excluded, rng):
+    """
+    Choose recipe for a plan slot. Recipes which need portions within MIN_PORTIONS and MAX_PORTIONS to hit the slot
+    calories and are not excluded by variety rules are preferred, then the least used ones, ties are broken randomly.
+    Rules are relaxed one by one when no recipe meets them: first the previous day rule, then portions limits, then
+    the same day rule.
+    :param needed_portions: Array of portions of every pool recipe needed to hit the slot calories.
+    :param usage: Array with number of slots every pool recipe is already planned in.
+    :param excluded: Tuple of bool arrays marking recipes planned in the same slot of the previous day and recipes
+    planned in the same day.
+    :param rng: NumPy random Generator object.
+    :return: Index of chosen pool recipe.
+    """
+    distance = np.abs(np.clip(needed_portions, MIN_PORTIONS, MAX_PORTIONS) - needed_portions)
+    score = usage + distance + rng.random(len(usage))
+    within_limits = distance == 0
+    previous_day, same_day = excluded
+    for mask in (~previous_day & ~same_day & within_limits, ~same_day & within_limits, ~same_day):
+        if mask.any():
+            return int(np.argmin(np.where(mask, score, np.inf)))
+    return int(np.argmin(score))
+
+
+def generate_plan_meals(target, plan_length, portion_calories, planned=None, seed=None):
+    """
+    Assign pool recipe and portions to every empty plan slot, so every plan day hits the calories target. Day
+    calories left by planned meals are split between empty slots by MEAL_CALORIES_SHARES, every slot gets a recipe
+    not planned in the same day nor in the same slot of the previous day if possible, then portions of the most
+    caloric meal of the day are corrected by the remaining rounding gap.
+    :param target: Plan day calories target.
+    :param plan_length: Plan length in days.
+    :param portion_calories: Array with one portion calories of every pool recipe.
+    :param planned: Dictionary with (plan_day, meal) tuple as key and tuple of pool recipe index or None and meal
+    calories as value, for already planned meals.
+    :param seed: Random seed making the result deterministic.
+    :return: Tuple of list with (plan_day, meal, pool recipe index, portions) tuples and array of days calories.
+    """
+    planned = planned or {}
+    portion_calories = np.asarray(portion_calories, dtype=float)
+    rng = np.random.default_rng(seed)
+    usage = np.zeros(len(portion_calories))
+    previous_day = {}
+    meals = []
+    days_calories = np.zeros(plan_length)
+    for plan_day in range(1, plan_length + 1):
+        used_today = np.zeros(len(portion_calories), dtype=bool)
+        day_meals = {}
+        for (day, meal), (index, calories) in planned.items():
+            if day == plan_day:
+                days_calories[plan_day - 1] += calories
+                if index is not None:
+                    used_today[index] = True
+                    day_meals[meal] = index
+        empty_slots = [meal for meal, _ in MEALS if (plan_day, meal) not in planned]
+        remaining = target - days_calories[plan_day - 1]
+        if remaining > 0 and empty_slots and len(portion_calories):
+            shares = sum(MEAL_CALORIES_SHARES[meal] for meal in empty_slots)
+            day_new_meals = []
+            for meal in empty_slots:
+                needed_portions = remaining * MEAL_CALORIES_SHARES[meal] / shares / portion_calories
+                previous = np.zeros(len(portion_calories), dtype=bool)
+                if meal in previous_day:
+                    previous[previous_day[meal]] = True
+                index = choose_recipe(needed_portions, usage, (previous, used_today), rng)
+                portions = float(np.clip(round(needed_portions[index], 1), MIN_PORTIONS, MAX_PORTIONS))
+                used_today[index] = True
+                usage[index] += 1
+                day_meals[meal] = index
+                day_new_meals.append([meal, index, portions])
+            gap = remaining - sum(portion_calories[index] * portions for _, index, portions in day_new_meals)
+            largest = max(day_new_meals, key=lambda new_meal: portion_calories[new_meal[1]] * new_meal[2])
+            largest[2] = float(np.clip(round(largest[2] + gap / portion_calories[largest[1]], 1), MIN_PORTIONS,
+                                       MAX_PORTIONS))
+            for meal, index, portions in day_new_meals:
+                meals.append((plan_day, meal, index, portions))
+                days_calories[plan_day - 1] += portion_calories[index] * portions
+        previous_day = day_meals
+    return meals, days_calories
+
+
+def fill_plan(plan_id, user, recipes=None, tolerance=DEFAULT_TOLERANCE, seed=None):
+    """
+    Fill every empty slot of Plan model object with a recipe and portions, so every plan day hits plan_calories
+    within tolerance. Recipe calories are read once as a vector, meals are written with one bulk insert and one
+    PlanDaySummary refresh, with the Plan row locked.
+    :param plan_id: Plan model object primary key.
+    :param user: User model object creating the meals.
+    :param recipes: Recipe model QuerySet used as recipe pool, all recipes by default.
+    :param tolerance: Allowed relative difference between plan day calories and plan_calories.
+    :param seed: Random seed making the result deterministic.
+    :return: Tuple of list with created Meal model objects and list of plan days out of tolerance.
+    """
+    recipes = Recipe.objects.all() if recipes is None else recipes
+    pool = list(recipes.filter(portion_calories__gt=0).order_by('pk').values_list('pk', 'portion_calories'))
+    recipe_ids = [recipe_id for recipe_id, _ in pool]
+    positions = {recipe_id: index for index, recipe_id in enumerate(recipe_ids)}
+    portion_calories = np.array([float(calories) for _, calories in pool])
+    with transaction.atomic():
+        plan = Plan.objects.select_for_update().get(pk=plan_id)
+        target = plan.plan_calories
+        planned = {
+            (plan_day, meal): (positions.get(recipe_id), float(meal_portions * calories))
+            for plan_day, meal, recipe_id, meal_portions, calories in plan.meal_set.values_list(
+                'plan_day', 'meal', 'recipes_id', 'meal_portions', 'recipes__portion_calories')
+        }
+        new_meals, days_calories = generate_plan_meals(target, plan.plan_length, portion_calories, planned, seed)
+        meals = Meal.objects.bulk_create([
+            Meal(plan=plan, plan_day=plan_day, meal=meal, recipes_id=recipe_ids[index], user=user,
+                 meal_portions=Decimal(str(portions)))
+            for plan_day, meal, index, portions in new_meals
+        ])
+        PlanDaySummary.objects.refresh({(plan.pk, plan_day) for plan_day, _, _, _ in new_meals})
+    days_out_of_tolerance = [plan_day for plan_day, calories in enumerate(days_calories, start=1)
+                             if abs(calories - target) > target * tolerance]
+    return meals, days_out_of_tolerance
@@ -0,0 +1,91 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+
+# Whether reads of the current context go to the replica, set by ReplicaRoutingMiddleware for read-only views and
+# by background jobs. Context variables are copied to threads of async views, so they read from the same database.
+replica_reads_enabled = ContextVar('replica_reads_enabled', default=False)
+# Object marked by ReplicaRouter when the current request writes, so the middleware keeps its session on primary.
+current_writes = ContextVar('current_writes', default=None)
+
+
+def replica_configured():
+    """
+    Check if replica database is configured in DATABASES setting.
+    """
+    return REPLICA_DB_ALIAS in connections.databases
+
+
+def reading_replica():
+    """
+    Check if reads of the current context go to the replica.
+    """
+    return replica_reads_enabled.get() and replica_configured()
+
+
+@contextmanager
+def replica_reads(instance=None):
+    """
+    Send reads inside the block to the replica, if it is configured. Given instance is looked up on the replica
+    first, and reads stay on primary if it was not replicated yet, e.g. a shopping list created just before.
+    :param instance: Model object read inside the block or None.
+    """
+    enabled = replica_configured()
+    if enabled and instance is not None:
+        enabled = type(instance).objects.using(REPLICA_DB_ALIAS).filter(pk=instance.pk).exists()
+    token = replica_reads_enabled.set(enabled)
+    try:
+        yield
+    finally:
+        replica_reads_enabled.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Send reads inside the block to primary, e.g. reads deciding about writes in a view reading from the replica.
+    """
+    token = replica_reads_enabled.set(False)
+    try:
+        yield
+    finally:
+        replica_reads_enabled.reset(token)
+
+
+class RequestWrites:
+    """
+    Writes of one request, marked by ReplicaRouter.
+    """
+
+    def __init__(self):
+        self.written = False
+
+
+class ReplicaRouter:
+    """
+    Route reads to the replica inside replica_reads() blocks and everything else to primary. Sessions are always
+    read from primary, as they are written by every login. Routers which return None leave the choice to Django, which
+    would write objects read from the replica back to it, so primary is returned explicitly.
+    """
+    primary_apps = {'sessions'}
+
+    def db_for_read(self, model, **hints):
+        if reading_replica() and model._meta.app_label not in self.primary_apps:
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        writes = current_writes.get()
+        if writes is not None:
+            writes.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replica holds a copy of primary data, so objects of both are related.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replica is migrated by replication of primary.
+        return db != REPLICA_DB_ALIAS
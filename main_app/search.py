@@ -0,0 +1,88 @@
+import re
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from text_unidecode import unidecode
+from main_app.models import Product
+
+SEARCH_PREFIX = 'prefix'
+SEARCH_CONTAINS = 'contains'
+
+
+def normalize_search_text(text):
+    """
+    Normalize text for searching: fold accents to ASCII, lowercase it and collapse whitespaces.
+    :param text: Text to normalize, e.g. 'Mięso  mielone'.
+    :return: Normalized text, e.g. 'mieso mielone'.
+    """
+    return re.sub(r'\s+', ' ', unidecode(text or '')).strip().lower()
+
+
+def prefix_condition(queryset, field, prefix):
+    """
+    Create condition of normalized field prefix served by the field index on the queryset database.
+    PostgreSQL LIKE 'prefix%' uses the pattern and trigram indexes, elsewhere a binary range comparison is used.
+    :param queryset: Django QuerySet object.
+    :param field: Name of field with normalized text.
+    :param prefix: Normalized prefix.
+    :return: Q object.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        return Q(**{f'{field}__startswith': prefix})
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\uffff'})
+
+
+def filter_prefix(queryset, field, prefix):
+    """
+    Filter queryset by normalized field prefix in a way served by the field index on every database.
+    :param queryset: Django QuerySet object.
+    :param field: Name of field with normalized text.
+    :param prefix: Normalized prefix.
+    :return: Filtered QuerySet object.
+    """
+    return queryset.filter(prefix_condition(queryset, field, prefix))
+
+
+def search_products(query, limit=None, recipe_id=None, after=None):
+    """
+    Search Product model objects by normalized name. Names starting with the query are ranked first, then, on
+    PostgreSQL, names containing it (for queries of at least 3 characters, served by trigram index). Other databases
+    have no index serving substrings and would scan the whole table, so they search only prefixes. Both groups are
+    ordered by normalized name and paginated with a keyset cursor, so every page is read using the indexes.
+    :param query: Searched text.
+    :param limit: Maximum number of results, limited by PRODUCT_SEARCH_LIMIT setting.
+    :param recipe_id: Recipe model object primary key to search only its products.
+    :param after: Cursor returned with the previous page, tuple of group name, normalized name and primary key of
+    its last product, or None for the first page.
+    :return: Tuple of list of dictionaries with Product model objects id, product_name and category_id and cursor
+    of the next page or None if it is the last page.
+    """
+    limit = min(limit or settings.PRODUCT_SEARCH_LIMIT, settings.PRODUCT_SEARCH_LIMIT)
+    normalized_query = normalize_search_text(query)
+    if not normalized_query:
+        return [], None
+    products = Product.objects.values('id', 'product_name', 'category_id', 'search_name')
+    if recipe_id is not None:
+        products = products.filter(productsquantities__recipe_id=recipe_id)
+    prefix = prefix_condition(products, 'search_name', normalized_query)
+    groups = [(SEARCH_PREFIX, products.filter(prefix))]
+    if len(normalized_query) >= 3 and connections[products.db].vendor == 'postgresql':
+        groups.append((SEARCH_CONTAINS, products.filter(search_name__contains=normalized_query).exclude(prefix)))
+    if after is not None:
+        group_names = [name for name, _ in groups]
+        if after[0] not in group_names:
+            return [], None
+        groups = groups[group_names.index(after[0]):]
+    results = []
+    for name, group in groups:
+        if after is not None and name == after[0]:
+            group = group.filter(Q(search_name__gt=after[1]) | Q(search_name=after[1], id__gt=after[2]))
+        results += [(name, product) for product in group.order_by('search_name', 'id')[:limit + 1 - len(results)]]
+        if len(results) > limit:
+            break
+    next_cursor = None
+    if len(results) > limit:
+        name, product = results[limit - 1]
+        next_cursor = (name, product['search_name'], product['id'])
+    return [{key: value for key, value in product.items() if key != 'search_name'}
+            for _, product in results[:limit]], next_cursor
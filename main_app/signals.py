@@ -0,0 +1,207 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from main_app.models import ProductCategory, Product, Recipe, ProductsQuantities, Persons, Plan, Meal, \
+    refresh_recipes_nutrition, refresh_plan_days
+from main_app.conditional import bump_user_version, bump_categories_version
+from main_app.fragments import bump_versions, RECIPE_ROW, PRODUCT_ROW, PLAN_DAY
+from main_app.search import normalize_search_text
+
+
+@receiver(pre_save, sender=Product)
+def set_product_search_name(sender, instance, **kwargs):
+    """
+    Set Product model object normalized name used by product search.
+    """
+    instance.search_name = normalize_search_text(instance.product_name)
+
+
+@receiver(post_save, sender=Product)
+def refresh_product_recipes_nutrition(sender, instance, created, **kwargs):
+    """
+    Refresh stored nutrition of all recipes using edited Product model object with one UPDATE.
+    """
+    if not created:
+        Recipe.objects.filter(productsquantities__product_id=instance).refresh_nutrition()
+
+
+@receiver(post_save, sender=Recipe)
+def refresh_recipe_nutrition(sender, instance, created, **kwargs):
+    """
+    Refresh stored nutrition of edited Recipe model object, whose one portion nutrition changes with its portions.
+    """
+    if not created:
+        Recipe.objects.filter(pk=instance.pk).refresh_nutrition()
+
+
+@receiver(post_save, sender=ProductsQuantities)
+@receiver(post_delete, sender=ProductsQuantities)
+def refresh_quantity_recipe_nutrition(sender, instance, **kwargs):
+    """
+    Refresh stored nutrition of recipe which ProductsQuantities model object was saved or deleted.
+    """
+    refresh_recipes_nutrition([instance.recipe_id_id])
+
+
+@receiver(m2m_changed, sender=Recipe.products.through)
+def remember_cleared_product_recipes(sender, instance, action, reverse, **kwargs):
+    """
+    Remember recipes of Product model object which recipes are cleared with Product.recipe_set manager, as pk_set
+    of clear actions is None.
+    """
+    if action == 'pre_clear' and reverse:
+        instance.cleared_recipe_ids = list(ProductsQuantities.objects.filter(product_id=instance).
+                                           values_list('recipe_id', flat=True).distinct())
+
+
+def changed_products_recipe_ids(instance, action, reverse, pk_set):
+    """
+    Get primary keys of recipes which products were changed by m2m_changed signal action.
+    :param instance: Recipe model object, or Product model object for reverse actions.
+    :param action: m2m_changed signal action.
+    :param reverse: Whether products were changed with Product.recipe_set manager.
+    :param pk_set: Primary keys of added or removed objects, None for clear actions.
+    :return: List of Recipe model objects primary keys.
+    """
+    if not reverse:
+        return [instance.pk]
+    if action == 'post_clear':
+        return getattr(instance, 'cleared_recipe_ids', [])
+    return list(pk_set or [])
+
+
+@receiver(m2m_changed, sender=Recipe.products.through)
+def refresh_changed_products_recipe_nutrition(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Refresh stored nutrition of recipes which products were added, removed or cleared with Recipe.products or
+    Product.recipe_set manager.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    recipe_ids = changed_products_recipe_ids(instance, action, reverse, pk_set)
+    if recipe_ids:
+        Recipe.objects.filter(pk__in=recipe_ids).refresh_nutrition()
+
+
+@receiver(pre_save, sender=Meal)
+def remember_meal_slot(sender, instance, update_fields=None, **kwargs):
+    """
+    Remember stored plan and plan_day of edited Meal model object, so summary of the day it is moved from is
+    refreshed too.
+    """
+    instance.previous_slot = None
+    if not instance._state.adding and (update_fields is None or {'plan', 'plan_day'} & set(update_fields)):
+        instance.previous_slot = Meal.objects.filter(pk=instance.pk).values_list('plan', 'plan_day').first()
+
+
+@receiver(post_save, sender=Meal)
+def refresh_meal_plan_day_summary(sender, instance, **kwargs):
+    """
+    Refresh PlanDaySummary model objects of saved Meal model object.
+    """
+    slots = {(instance.plan_id, instance.plan_day)}
+    if getattr(instance, 'previous_slot', None):
+        slots.add(instance.previous_slot)
+    refresh_plan_days(slots)
+
+
+@receiver(post_delete, sender=Meal)
+def refresh_deleted_meal_plan_day_summary(sender, instance, **kwargs):
+    """
+    Refresh PlanDaySummary model object of deleted Meal model object plan day.
+    """
+    refresh_plan_days([(instance.plan_id, instance.plan_day)])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def bump_recipe_row_version(sender, instance, **kwargs):
+    """
+    Invalidate cached row of saved or deleted Recipe model object. New recipes get a version too, so a row cached
+    for a deleted recipe with the same primary key is never reused.
+    """
+    bump_versions(RECIPE_ROW, [instance.pk])
+
+
+@receiver(post_save, sender=ProductsQuantities)
+@receiver(post_delete, sender=ProductsQuantities)
+def bump_quantity_recipe_row_version(sender, instance, **kwargs):
+    """
+    Invalidate cached row of recipe which ProductsQuantities model object was saved or deleted.
+    """
+    bump_versions(RECIPE_ROW, [instance.recipe_id_id])
+
+
+@receiver(m2m_changed, sender=Recipe.products.through)
+def bump_changed_products_recipe_row_version(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Invalidate cached rows of recipes which products were added, removed or cleared with Recipe.products or
+    Product.recipe_set manager.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_versions(RECIPE_ROW, changed_products_recipe_ids(instance, action, reverse, pk_set))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_product_row_version(sender, instance, created=False, **kwargs):
+    """
+    Invalidate cached row of saved or deleted Product model object and, for edited product, cached rows of only the
+    recipes which use it. Recipe rows of deleted product are invalidated by its deleted ProductsQuantities.
+    """
+    bump_versions(PRODUCT_ROW, [instance.pk])
+    if kwargs['signal'] is post_save and not created:
+        recipe_ids = list(ProductsQuantities.objects.filter(product_id=instance).
+                          values_list('recipe_id', flat=True).distinct())
+        bump_versions(RECIPE_ROW, recipe_ids)
+
+
+@receiver(post_save, sender=Plan)
+def bump_plan_days_version(sender, instance, **kwargs):
+    """
+    Invalidate cached plan day blocks of saved Plan model object, including blocks cached for a deleted plan with
+    the same primary key.
+    """
+    bump_versions(PLAN_DAY, [f'{instance.pk}:{plan_day}' for plan_day in range(1, instance.plan_length + 1)])
+
+
+@receiver(post_save, sender=Persons)
+@receiver(pre_delete, sender=Persons)
+def touch_person_plans(sender, instance, **kwargs):
+    """
+    Set date_modified of plans of saved or deleted Persons model object, which plan calories depend on. Deleted
+    person is still related to its plans before deletion.
+    """
+    Plan.objects.filter(persons=instance).update(date_modified=timezone.now())
+
+
+@receiver(post_save, sender=Persons)
+@receiver(post_delete, sender=Persons)
+def bump_person_user_version(sender, instance, **kwargs):
+    """
+    Invalidate pages of user owning saved or deleted Persons model object.
+    """
+    bump_user_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Plan.persons.through)
+def touch_changed_persons_plans(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Set date_modified of plans which persons were added or removed with Plan.persons manager.
+    """
+    if action in ('post_add', 'post_remove'):
+        plans = Plan.objects.filter(pk__in=pk_set or []) if reverse else Plan.objects.filter(pk=instance.pk)
+    elif action == 'pre_clear':
+        plans = Plan.objects.filter(persons=instance) if reverse else Plan.objects.filter(pk=instance.pk)
+    else:
+        return
+    plans.update(date_modified=timezone.now())
+
+
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def bump_product_category_version(sender, instance, **kwargs):
+    """
+    Invalidate pages listing product categories.
+    """
+    bump_categories_version()
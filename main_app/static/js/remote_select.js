@@ -0,0 +1,50 @@
+// Fill select[data-remote-url] options on demand from JSON search endpoint.
+// Endpoint returns {"results": [{"id": ..., <data-remote-label>: ...}], "next": <url of next page or null>}.
+document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('select[data-remote-url]').forEach(function (select) {
+        var url = select.dataset.remoteUrl;
+        var label = select.dataset.remoteLabel;
+        var search = document.createElement('input');
+        var more = document.createElement('button');
+        var timeout = null;
+        search.type = 'search';
+        search.placeholder = 'Szukaj';
+        more.type = 'button';
+        more.textContent = 'Więcej';
+        more.hidden = true;
+        select.parentNode.insertBefore(search, select);
+        select.parentNode.insertBefore(more, select.nextSibling);
+
+        function load(pageUrl, append) {
+            fetch(pageUrl, {headers: {'Accept': 'application/json'}})
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    if (!append) {
+                        Array.from(select.options).forEach(function (option) {
+                            if (!option.selected && option.value) {
+                                option.remove();
+                            }
+                        });
+                    }
+                    data.results.forEach(function (result) {
+                        if (!select.querySelector('option[value="' + result.id + '"]')) {
+                            select.add(new Option(result[label], result.id));
+                        }
+                    });
+                    more.hidden = !data.next;
+                    more.dataset.next = data.next || '';
+                });
+        }
+
+        search.addEventListener('input', function () {
+            clearTimeout(timeout);
+            timeout = setTimeout(function () {
+                var separator = url.indexOf('?') === -1 ? '?' : '&';
+                load(url + separator + 'q=' + encodeURIComponent(search.value), false);
+            }, 250);
+        });
+        more.addEventListener('click', function () {
+            load(more.dataset.next, true);
+        });
+    });
+});
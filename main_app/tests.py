@@ -1,14 +1,40 @@
 from random import randint, sample
+import asyncio
+from io import StringIO
+import time
+import json
+import logging
+from decimal import Decimal
+from datetime import timedelta
 from django.contrib.auth.models import User
-from main_app.functions import calculate_days_calories
-from main_app.models import Recipe, Product, ProductCategory, Plan, Meal, ProductsQuantities, ShoppingList, \
-    ShoppingListProducts
+from main_app.functions import calculate_days_calories, calculate_days_nutrition, upsert_meal, \
+    create_shopping_list, balance_plan, BALANCE_EVEN, BALANCE_PROPORTIONAL
+from main_app.models import Recipe, Product, ProductCategory, Plan, Meal, Persons, ProductsQuantities, ShoppingList, \
+    ShoppingListProducts, Job, PlanDaySummary, round_nutrition
+from main_app.jobs import run_next_job, enqueue_job, work
+from main_app.nutrition import recipes_nutrition, plan_days_nutrition, to_decimal
+from main_app.planner import fill_plan
+from main_app.middleware import query_shape, RequestInstrumentationMiddleware
+from main_app import async_views
+from main_app.benchmarks import run_benchmarks, compare_results, benchmark_subjects
+from main_app.fragments import fragment_versions, flush_versions, RECIPE_ROW
+from main_app.conditional import ConditionalGetMixin
+from main_app.routers import ReplicaRouter, replica_reads, reading_replica
 from main_app.forms import RecipeForm
 from django.contrib.auth import authenticate
 from main_app.utils import three_new_persons_create
 import pytest
+from django.db import connection, transaction, IntegrityError
+from django.test import AsyncRequestFactory
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.utils.formats import localize
+from django.utils import timezone
 from faker import Faker
 from django.urls import reverse
+from cookee.urls import urlpatterns
+from django.core.management import call_command, CommandError
 from main_app.models import Persons
 
 faker = Faker('pl_PL')
@@ -114,8 +140,10 @@ def test_plans_view(client, new_three_plans):
     Test PlansView view.
     :param client: Django Client() object.
     :param new_three_plans: Fixture that creates 3 Plan model objects
-    :return: Assert if all created plans shows on the website
+    :return: Assert if all created plans shows on the website to their owner and none to anonymous user
     """
+    assert list(client.get('/plans').context['plans']) == []
+    client.force_login(new_three_plans[0].user)
     response = client.get('/plans')
     assert response.status_code == 200
     plans = response.context['plans']
@@ -128,8 +156,10 @@ def test_persons_view(client, new_three_persons):
     Test PersonsView view.
     :param client: Django Client() object.
     :param new_three_persons: Fixture that creates 3 Persons model objects
-    :return: Assert if all created persons shows on the website
+    :return: Assert if all created persons shows on the website to their owner and none to anonymous user
     """
+    assert list(client.get('/persons').context['persons']) == []
+    client.force_login(new_three_persons[0].user)
     response = client.get('/persons')
     assert response.status_code == 200
     persons = response.context['persons']
@@ -466,13 +496,16 @@ def test_plan_details_view(client, new_three_plans, new_three_recipes):
     plan = Plan.objects.last()
     recipes = Recipe.objects.all()
     recipes_primary_keys = [recipe.pk for recipe in recipes]
-    for day in range(10):
-        meal = Meal.objects.create(plan_day=randint(1, plan.plan_length),
-                                   meal=randint(1, 5),
+    plan.plan_length = max(plan.plan_length, 2)
+    plan.save()
+    slots = [(plan_day, day_meal) for plan_day in range(1, plan.plan_length + 1) for day_meal in range(1, 6)]
+    for plan_day, day_meal in sample(slots, 10):
+        meal = Meal.objects.create(plan=plan,
+                                   plan_day=plan_day,
+                                   meal=day_meal,
                                    user=user,
                                    meal_portions=randint(100, 1000) / 100,
                                    recipes=Recipe.objects.get(pk=sample(recipes_primary_keys, 1)[0]))
-        meal.plan_name.add(plan.pk)
     assert Meal.objects.count() == 10
     days_calories_list = calculate_days_calories(plan)
     get_response = client.get(reverse('plan-details', kwargs={'plan_id': plan.pk}))
@@ -498,7 +531,7 @@ def test_plan_details_view(client, new_three_plans, new_three_recipes):
     post_response = client.post(reverse('plan-details', kwargs={'plan_id': plan.pk}), post_data)
     assert post_response.status_code == 200
     meal_object = Meal.objects.filter(user=user,
-                                      plan_name=plan,
+                                      plan=plan,
                                       plan_day=post_data['plan_day'],
                                       meal=post_data['meal'])
     if Meal.objects.count() == plans_count or Meal.objects.count() == plans_count + 1:
@@ -525,12 +558,12 @@ def test_delete_meal(client, new_three_plans, new_three_recipes):
     client.force_login(user=user)
     plan = Plan.objects.last()
     assert Meal.objects.count() == 0
-    meal = Meal.objects.create(plan_day=randint(1, plan.plan_length),
+    meal = Meal.objects.create(plan=plan,
+                               plan_day=randint(1, plan.plan_length),
                                meal=randint(1, 5),
                                user=user,
                                meal_portions=randint(100, 1000) / 100,
                                recipes=Recipe.objects.last())
-    meal.plan_name.add(plan.pk)
     assert Meal.objects.count() == 1
     response = client.post(reverse('delete-meal', kwargs={'pk': meal.pk}))
     assert response.status_code == 302
@@ -584,13 +617,16 @@ def test_add_shopping_list(client, new_three_plans, new_three_recipes):
     plan = Plan.objects.last()
     recipes = Recipe.objects.all()
     recipes_primary_keys = [recipe.pk for recipe in recipes]
-    for day in range(10):
-        meal = Meal.objects.create(plan_day=randint(1, plan.plan_length),
-                                   meal=randint(1, 5),
+    plan.plan_length = max(plan.plan_length, 2)
+    plan.save()
+    slots = [(plan_day, day_meal) for plan_day in range(1, plan.plan_length + 1) for day_meal in range(1, 6)]
+    for plan_day, day_meal in sample(slots, 10):
+        meal = Meal.objects.create(plan=plan,
+                                   plan_day=plan_day,
+                                   meal=day_meal,
                                    user=user,
                                    meal_portions=randint(100, 1000) / 100,
                                    recipes=Recipe.objects.get(pk=sample(recipes_primary_keys, 1)[0]))
-        meal.plan_name.add(plan.pk)
     assert Meal.objects.count() == 10
     shopping_list_count = ShoppingList.objects.count()
     assert shopping_list_count == 0
@@ -617,7 +653,7 @@ def test_shopping_list_pdf(client, new_three_plans, new_three_recipes):
     :param new_three_recipes: Fixture that creates 3 Recipes model objects
     :return: Assert if ShoppingListProducts model objects are saved to pdf.
     """
-    user = Persons.objects.last().user
+    user = Plan.objects.last().user
     client.force_login(user=user)
     shopping_list = ShoppingList.objects.create(plan=Plan.objects.last())
     products = Product.objects.all()
@@ -626,7 +662,6 @@ def test_shopping_list_pdf(client, new_three_plans, new_three_recipes):
                                             shopping_list=shopping_list,
                                             product=product)
     response = client.get(reverse('shopping-list-pdf'))
-    # print(list(response.streaming_content)[0].decode('UTF-8'))
     assert response.status_code == 200
 
 
@@ -644,13 +679,16 @@ def test_plan_day_calories_completion(client, new_three_plans, new_three_recipes
     plan = Plan.objects.last()
     recipes = Recipe.objects.all()
     recipes_primary_keys = [recipe.pk for recipe in recipes]
-    for day in range(10):
-        meal_instance = Meal.objects.create(plan_day=randint(1, plan.plan_length),
-                                            meal=randint(1, 5),
+    plan.plan_length = max(plan.plan_length, 2)
+    plan.save()
+    slots = [(plan_day, day_meal) for plan_day in range(1, plan.plan_length + 1) for day_meal in range(1, 6)]
+    for plan_day, day_meal in sample(slots, 10):
+        meal_instance = Meal.objects.create(plan=plan,
+                                            plan_day=plan_day,
+                                            meal=day_meal,
                                             user=user,
                                             meal_portions=randint(100, 1000) / 100,
                                             recipes=Recipe.objects.get(pk=sample(recipes_primary_keys, 1)[0]))
-        meal_instance.plan_name.add(plan.pk)
     meals = Meal.objects.all()
     meal = sample(list(meals), 1)[0]
     plan_day = meal.plan_day
@@ -659,8 +697,961 @@ def test_plan_day_calories_completion(client, new_three_plans, new_three_recipes
                                                            'plan_day': plan_day,
                                                            'day_meal': day_meal}))
     assert response.status_code == 302
-    updated_meal = Meal.objects.filter(plan_name=plan, plan_day=plan_day, meal=day_meal)
+    updated_meal = Meal.objects.filter(plan=plan, plan_day=plan_day, meal=day_meal)
     assert updated_meal[0].meal_portions != meal.meal_portions
 
 
 
+
+
+@pytest.mark.django_db
+def test_recipe_with_nutrition(new_three_recipes):
+    """
+    Test RecipeQuerySet.with_nutrition() annotations.
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if annotated calories are equal to calories calculated per product.
+    """
+    for recipe in Recipe.objects.with_nutrition():
+        plain_recipe = Recipe.objects.get(pk=recipe.pk)
+        assert recipe.recipe_calories == plain_recipe.recipe_calories
+        assert recipe.portion_calories == plain_recipe.portion_calories
+        proteins = sum(quantity.product_id.proteins * quantity.product_quantity / 100
+                       for quantity in plain_recipe.productsquantities_set.all())
+        assert round(recipe.total_proteins, 2) == round(proteins, 2)
+        assert round(recipe.per_portion_proteins, 2) == round(proteins / recipe.portions, 2)
+
+
+@pytest.mark.django_db
+def test_recipe_stored_nutrition(new_three_recipes):
+    """
+    Test Recipe model stored nutrition refreshed by signals.
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if stored nutrition is equal to aggregated one after quantity, portions and product changes, also
+    when recipes of a product are cleared, which invalidates their cached rows.
+    """
+    def assert_stored_nutrition():
+        for recipe in Recipe.objects.with_nutrition():
+            assert recipe.calories == round_nutrition(recipe.total_calories)
+            assert recipe.portion_fats == round_nutrition(recipe.per_portion_fats)
+
+    assert_stored_nutrition()
+    recipe = Recipe.objects.last()
+    quantity = recipe.productsquantities_set.first()
+    quantity.product_quantity = 750
+    quantity.save()
+    assert_stored_nutrition()
+    recipe.portions = Decimal('2.5')
+    recipe.save()
+    assert_stored_nutrition()
+    product = quantity.product_id
+    product.fats = Decimal('42.5')
+    product.save()
+    assert_stored_nutrition()
+    recipe.products.remove(product)
+    assert_stored_nutrition()
+    product = recipe.products.first()
+    version = fragment_versions(RECIPE_ROW, [recipe.pk])[recipe.pk]
+    product.recipe_set.clear()
+    assert_stored_nutrition()
+    assert fragment_versions(RECIPE_ROW, [recipe.pk])[recipe.pk] != version
+
+
+@pytest.mark.django_db
+def test_nutrition_kernel(new_three_plans, new_three_recipes):
+    """
+    Test vectorized nutrition kernel.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if kernel results are equal to exact Decimal calculation and to PlanDaySummary model objects and
+    rebuild_nutrition --verify fails on a corrupted recipe.
+    """
+    result = recipes_nutrition()
+    for index, recipe_id in enumerate(result['recipe_ids']):
+        recipe = Recipe.objects.get(pk=recipe_id)
+        quantities = recipe.productsquantities_set.select_related('product_id')
+        proteins = sum(quantity.product_id.proteins * quantity.product_quantity / 100 for quantity in quantities)
+        calories = sum(quantity.product_id.calories * quantity.product_quantity / 100 for quantity in quantities)
+        assert to_decimal(result['proteins'][index]) == round_nutrition(proteins) == recipe.proteins
+        assert to_decimal(result['portion_proteins'][index]) == round_nutrition(proteins / recipe.portions)
+        assert to_decimal(result['calories'][index]) == round_nutrition(calories) == recipe.calories
+    plan = Plan.objects.last()
+    recipes = list(Recipe.objects.all())
+    for plan_day in range(1, plan.plan_length + 1):
+        Meal.objects.create(plan=plan, plan_day=plan_day, meal=1, user=plan.user,
+                            meal_portions=Decimal(randint(1, 50)) / 10, recipes=sample(recipes, 1)[0])
+    days = plan_days_nutrition(Meal.objects.filter(plan=plan))
+    for summary in PlanDaySummary.objects.filter(plan=plan):
+        assert days[(plan.pk, summary.plan_day)]['meals_count'] == summary.meals_count
+        assert days[(plan.pk, summary.plan_day)]['calories'] == summary.calories
+    out = StringIO()
+    call_command('rebuild_nutrition', '--verify', stdout=out)
+    assert 'Found 0 mismatches' in out.getvalue()
+    Recipe.objects.filter(pk=recipes[0].pk).update(fats=recipes[0].fats + 1)
+    out = StringIO()
+    with pytest.raises(CommandError, match='Found 1 mismatches'):
+        call_command('rebuild_nutrition', '--verify', stdout=out)
+    assert f'Recipe {recipes[0].pk} fats' in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_calculate_days_nutrition(new_three_plans, new_three_recipes):
+    """
+    Test calculate_days_nutrition function.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if days nutrition is calculated for every plan_day in one query.
+    """
+    plan = Plan.objects.last()
+    user = plan.user
+    recipes = Recipe.objects.all()
+    for day in range(1, plan.plan_length + 1):
+        meal = Meal.objects.create(plan=plan,
+                                   plan_day=day,
+                                   meal=randint(1, 5),
+                                   user=user,
+                                   meal_portions=randint(100, 1000) / 100,
+                                   recipes=sample(list(recipes), 1)[0])
+    with CaptureQueriesContext(connection) as queries:
+        days_nutrition = calculate_days_nutrition(plan)
+    assert len(queries) == 1
+    assert len(days_nutrition) == plan.plan_length
+    for day, day_nutrition in enumerate(days_nutrition, start=1):
+        meal = plan.meal_set.get(plan_day=day)
+        recipe = Recipe.objects.with_nutrition().get(pk=meal.recipes.pk)
+        assert abs(day_nutrition['calories'] - meal.meal_calories) <= meal.meal_portions / 100
+        assert abs(day_nutrition['fats'] - recipe.per_portion_fats * meal.meal_portions) <= meal.meal_portions / 100
+
+
+@pytest.mark.django_db
+def test_plan_day_summary(new_three_plans, new_three_recipes):
+    """
+    Test PlanDaySummary model objects refreshed by Meal model signals and MealQuerySet.update().
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if summaries are equal to calories calculated per meal after every kind of meal change.
+    """
+    plan = Plan.objects.last()
+    user = plan.user
+    recipes = list(Recipe.objects.all())
+
+    def assert_summaries():
+        expected = {}
+        for meal in plan.meal_set.select_related('recipes'):
+            expected.setdefault(meal.plan_day, []).append(meal.meal_calories)
+        summaries = {summary.plan_day: summary for summary in PlanDaySummary.objects.filter(plan=plan)}
+        assert set(summaries) == set(expected)
+        for plan_day, calories in expected.items():
+            assert summaries[plan_day].meals_count == len(calories)
+            assert abs(summaries[plan_day].calories - sum(calories)) <= Decimal('0.05')
+
+    for meal_number in range(1, 4):
+        meal = Meal.objects.create(plan=plan, plan_day=1, meal=meal_number, user=user,
+                                   meal_portions=Decimal('1.5'), recipes=recipes[meal_number - 1])
+    assert_summaries()
+    meal.plan_day = 2
+    meal.save()
+    assert_summaries()
+    Meal.objects.filter(plan=plan, plan_day=1).update(meal_portions=Decimal('2.5'))
+    assert_summaries()
+    recipe = recipes[0]
+    recipe.portions = Decimal('1.5')
+    recipe.save()
+    assert_summaries()
+    meal.delete()
+    assert_summaries()
+    assert not PlanDaySummary.objects.filter(plan=plan, plan_day=2).exists()
+
+
+@pytest.mark.django_db
+def test_meal_plan_queries(client, new_three_plans, new_three_recipes):
+    """
+    Test queries of plan details and shopping list paths with Meal model related to Plan by foreign key.
+    :param client: Django Client() object.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if meal is created with one INSERT and no query joins a plan-meal through table.
+    """
+    plan = Plan.objects.last()
+    client.force_login(user=plan.user)
+    with CaptureQueriesContext(connection) as queries:
+        Meal.objects.create(plan=plan, plan_day=1, meal=1, user=plan.user, meal_portions=2,
+                            recipes=Recipe.objects.last())
+    assert len([query for query in queries if 'INSERT INTO "main_app_meal"' in query['sql']]) == 1
+    for url in [reverse('plan-details', kwargs={'plan_id': plan.pk}),
+                reverse('shopping-list', kwargs={'plan_id': plan.pk})]:
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        assert response.status_code == 200
+        assert not [query for query in queries if 'main_app_meal_plan_name' in query['sql']]
+
+
+@pytest.mark.django_db
+def test_upsert_meal(new_three_plans, new_three_recipes):
+    """
+    Test upsert_meal function.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if Meal model object is created, updated and rejected over the calories limit, and if returned
+    days nutrition is equal to recalculated one.
+    """
+    plan = Plan.objects.last()
+    user = plan.user
+    recipe = Recipe.objects.last()
+    plan.persons.update(calories=int(recipe.portion_calories * 2) + 1)
+    portions = Decimal(1)
+    plan, days_nutrition, message = upsert_meal(plan.pk, user, 1, 1, recipe, portions)
+    assert message is None
+    assert Meal.objects.filter(plan=plan, plan_day=1, meal=1).count() == 1
+    assert abs(days_nutrition[0]['calories'] - calculate_days_nutrition(plan)[0]['calories']) <= Decimal('0.05')
+    plan, days_nutrition, message = upsert_meal(plan.pk, user, 1, 1, recipe, portions * 2)
+    assert message is None
+    assert Meal.objects.get(plan=plan, plan_day=1, meal=1).meal_portions == portions * 2
+    assert abs(days_nutrition[0]['calories'] - calculate_days_nutrition(plan)[0]['calories']) <= Decimal('0.05')
+    plan, days_nutrition, message = upsert_meal(plan.pk, user, 1, 2, recipe, portions * 3)
+    assert message == 'Przekroczono limit kalorii'
+    assert Meal.objects.filter(plan=plan, plan_day=1).count() == 1
+
+
+@pytest.mark.django_db
+def test_meal_upsert(new_three_plans, new_three_recipes):
+    """
+    Test MealQuerySet.upsert() and unique plan slot constraint.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if repeated upserts keep one meal per slot and duplicate slot meal can not be created.
+    """
+    plan = Plan.objects.last()
+    recipes = list(Recipe.objects.all())
+    with CaptureQueriesContext(connection) as queries:
+        Meal.objects.upsert(plan, 1, 1, recipes[0], Decimal('1.5'), plan.user)
+    assert len([query for query in queries if 'ON CONFLICT' in query['sql']]) == 1
+    Meal.objects.upsert(plan, 1, 1, recipes[1], Decimal('2.5'), plan.user)
+    meal = Meal.objects.get(plan=plan, plan_day=1, meal=1)
+    assert meal.recipes == recipes[1]
+    assert meal.meal_portions == Decimal('2.5')
+    summary = PlanDaySummary.objects.get(plan=plan, plan_day=1)
+    assert summary.meals_count == 1
+    assert abs(summary.calories - meal.meal_calories) <= Decimal('0.05')
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Meal.objects.create(plan=plan, plan_day=1, meal=1, user=plan.user, meal_portions=1, recipes=recipes[0])
+
+
+@pytest.mark.django_db
+def test_plan_auto_fill(client, new_three_plans):
+    """
+    Test fill_plan function and PlanAutoFill view.
+    :param client: Django Client() object.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :return: Assert if 30 days plan is filled quickly, within calories tolerance and without recipe repeated in a day.
+    """
+    plan = Plan.objects.last()
+    plan.plan_length = 30
+    plan.save()
+    for index, calories in enumerate(range(200, 1000, 100)):
+        recipe = Recipe.objects.create(recipe_name=f'Przepis {index}', description='Opis', preparation_time=10)
+        Recipe.objects.filter(pk=recipe.pk).update(portion_calories=calories)
+    Meal.objects.create(plan=plan, plan_day=1, meal=3, user=plan.user, meal_portions=1, recipes=recipe)
+    start = time.perf_counter()
+    meals, days_out_of_tolerance = fill_plan(plan.pk, plan.user, seed=1)
+    assert time.perf_counter() - start < 1
+    assert len(meals) == 30 * 5 - 1
+    assert days_out_of_tolerance == []
+    for day, day_nutrition in enumerate(calculate_days_nutrition(plan), start=1):
+        assert abs(day_nutrition['calories'] - plan.plan_calories) <= plan.plan_calories * Decimal('0.05')
+        day_recipes = list(plan.meal_set.filter(plan_day=day).values_list('recipes', flat=True))
+        assert len(day_recipes) == len(set(day_recipes)) == 5
+    client.force_login(user=plan.user)
+    response = client.post(reverse('plan-auto-fill', kwargs={'plan_id': plan.pk}))
+    assert response.status_code == 200
+    assert response.context['message'] == 'Dodano posiłków: 0'
+
+
+@pytest.mark.django_db
+def test_balance_plan(client, new_three_plans, new_three_recipes):
+    """
+    Test balance_plan function and PlanBalance view.
+    :param client: Django Client() object.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if every plan day is balanced with one bulk update, with both strategies.
+    """
+    plan = Plan.objects.last()
+    plan.plan_length = 14
+    plan.save()
+    recipes = list(Recipe.objects.all())
+    plan.persons.update(calories=int(max(recipe.portion_calories for recipe in recipes) * 3))
+    for plan_day in range(1, 15):
+        for meal, recipe in enumerate(recipes, start=1):
+            Meal.objects.create(plan=plan, plan_day=plan_day, meal=meal, user=plan.user, meal_portions=1,
+                                recipes=recipe)
+    for strategy in (BALANCE_EVEN, BALANCE_PROPORTIONAL):
+        with CaptureQueriesContext(connection) as queries:
+            balance_plan(plan.pk, strategy)
+        assert len([query for query in queries if query['sql'].startswith('UPDATE "main_app_meal"')]) <= 1
+        for day in calculate_days_nutrition(plan):
+            tolerance = sum(recipe.portion_calories for recipe in recipes) / 10
+            assert abs(day['calories'] - plan.plan_calories) <= tolerance
+    client.force_login(user=plan.user)
+    response = client.post(reverse('plan-balance', kwargs={'plan_id': plan.pk}), {'strategy': BALANCE_EVEN})
+    assert response.status_code == 200
+    assert response.context['message'].startswith('Zmieniono porcje posiłków')
+
+
+
+@pytest.mark.django_db
+def test_balance_plan_zero_portions(new_three_plans, new_three_recipes):
+    """
+    Test balance_plan function with plan day which meals have no portions.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if the day gap is split evenly with proportional strategy and its summary is refreshed.
+    """
+    plan = Plan.objects.last()
+    recipe = max(new_three_recipes, key=lambda instance: instance.portion_calories)
+    plan.persons.update(calories=int(recipe.portion_calories * 2))
+    Meal.objects.create(plan=plan, plan_day=1, meal=1, user=plan.user, meal_portions=0, recipes=recipe)
+    updated = balance_plan(plan.pk, BALANCE_PROPORTIONAL)
+    assert len(updated) == 1 and updated[0].meal_portions > 0
+    day = calculate_days_nutrition(plan)[0]
+    assert abs(day['calories'] - plan.plan_calories) <= recipe.portion_calories / 10
+
+
+@pytest.mark.django_db
+def test_create_shopping_list_queries(new_three_plans, new_three_recipes):
+    """
+    Test create_shopping_list function.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if shopping list is written with a constant number of queries and one row per product.
+    """
+    plan = Plan.objects.last()
+    recipes = list(Recipe.objects.all())
+    for day in range(1, plan.plan_length + 1):
+        for meal_number in range(1, 6):
+            meal = Meal.objects.create(plan=plan,
+                                       plan_day=day,
+                                       meal=meal_number,
+                                       user=plan.user,
+                                       meal_portions=randint(100, 1000) / 100,
+                                       recipes=sample(recipes, 1)[0])
+    with CaptureQueriesContext(connection) as queries:
+        shopping_list = create_shopping_list(plan)
+    assert len(queries) <= 10
+    products_count = ProductsQuantities.objects.filter(recipe_id__meal__plan=plan). \
+        values('product_id').distinct().count()
+    assert ShoppingListProducts.objects.filter(shopping_list=shopping_list).count() == products_count
+
+
+@pytest.mark.django_db
+def test_shopping_list_reused_until_plan_changes(client, new_three_plans, new_three_recipes):
+    """
+    Test ShoppingListCreate view fingerprint addressing.
+    :param client: Django Client() object.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if repeated requests reuse ShoppingList model object and plan change creates a new one, and a
+    reused list becomes the latest one.
+    """
+    plan = Plan.objects.last()
+    client.force_login(user=plan.user)
+    meal = Meal.objects.create(plan=plan, plan_day=1, meal=1, user=plan.user, meal_portions=2,
+                               recipes=Recipe.objects.last())
+    client.get(reverse('shopping-list', kwargs={'plan_id': plan.pk}))
+    client.get(reverse('shopping-list', kwargs={'plan_id': plan.pk}))
+    assert ShoppingList.objects.count() == 1
+    products_count = ShoppingListProducts.objects.count()
+    meal.meal_portions = 3
+    meal.save()
+    client.get(reverse('shopping-list', kwargs={'plan_id': plan.pk}))
+    assert ShoppingList.objects.count() == 2
+    assert ShoppingListProducts.objects.count() == products_count * 2
+    first_list = ShoppingList.objects.order_by('pk').first()
+    meal.meal_portions = 2
+    meal.save()
+    client.get(reverse('shopping-list', kwargs={'plan_id': plan.pk}))
+    assert ShoppingList.objects.count() == 2
+    assert ShoppingList.objects.order_by('-date_created').first() == first_list
+
+
+@pytest.mark.django_db
+def test_shopping_list_pdf_by_id(client, new_three_plans, new_three_products):
+    """
+    Test ShoppingListPdf view addressed by ShoppingList model object primary key.
+    :param client: Django Client() object.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_products: Fixture that creates 3 Product model objects
+    :return: Assert if long shopping list is paginated, repeated download is served from cache, checking only the
+    latest modification of its products, until a product is renamed and lists of other users are not found.
+    """
+    plan = Plan.objects.last()
+    client.force_login(user=plan.user)
+    category = ProductCategory.objects.first()
+    Product.objects.bulk_create([Product(product_name=f'Produkt {i}', proteins=1, carbohydrates=1, fats=1,
+                                         category=category) for i in range(120)])
+    products = Product.objects.all()
+    shopping_list = ShoppingList.objects.create(plan=plan, fingerprint='test')
+    ShoppingListProducts.objects.bulk_create([ShoppingListProducts(product_quantity=100, shopping_list=shopping_list,
+                                                                   product=product) for product in products])
+    cache.clear()
+    response = client.get(reverse('shopping-list-pdf-file', kwargs={'shopping_list_id': shopping_list.pk}))
+    assert response.status_code == 200
+    pdf_bytes = b''.join(response.streaming_content)
+    assert pdf_bytes.count(b'/Type /Page\n') > 1
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse('shopping-list-pdf-file', kwargs={'shopping_list_id': shopping_list.pk}))
+        assert b''.join(response.streaming_content) == pdf_bytes
+    list_queries = [query['sql'] for query in queries.captured_queries
+                    if 'main_app_shoppinglistproducts' in query['sql']]
+    assert len(list_queries) == 1 and 'MAX(' in list_queries[0]
+    product = products.first()
+    product.product_name = 'Nowa nazwa'
+    product.save()
+    response = client.get(reverse('shopping-list-pdf-file', kwargs={'shopping_list_id': shopping_list.pk}))
+    assert b''.join(response.streaming_content) != pdf_bytes
+    client.force_login(User.objects.create_user(username='other_user', password='12345'))
+    response = client.get(reverse('shopping-list-pdf-file', kwargs={'shopping_list_id': shopping_list.pk}))
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_background_jobs(client, settings, new_three_plans, new_three_recipes):
+    """
+    Test shopping list and .pdf file creation in background jobs.
+    :param client: Django Client() object.
+    :param settings: pytest-django settings fixture.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if views enqueue jobs, repeated requests reuse the job until the plan changes and job results are
+    available after worker runs them.
+    """
+    settings.BACKGROUND_JOBS = True
+    plan = Plan.objects.last()
+    client.force_login(user=plan.user)
+    meal = Meal.objects.create(plan=plan, plan_day=1, meal=1, user=plan.user, meal_portions=2,
+                               recipes=Recipe.objects.last())
+    response = client.get(reverse('shopping-list', kwargs={'plan_id': plan.pk}))
+    assert response.status_code == 302
+    job = Job.objects.get()
+    assert job.status == Job.QUEUED
+    assert client.get(reverse('shopping-list', kwargs={'plan_id': plan.pk})).url == response.url
+    assert Job.objects.count() == 1
+    assert ShoppingList.objects.count() == 0
+    assert run_next_job().status == Job.DONE
+    assert run_next_job() is None
+    status = client.get(reverse('job-status', kwargs={'job_id': job.pk}), HTTP_ACCEPT='application/json').json()
+    assert status['status'] == Job.DONE
+    shopping_list = ShoppingList.objects.get()
+    response = client.get(reverse('job-download', kwargs={'job_id': job.pk}))
+    assert response.url == reverse('shopping-list-details', kwargs={'shopping_list_id': shopping_list.pk})
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(response.url)
+    assert response.context['shopping_list_id'] == shopping_list.pk
+    assert not any(query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) for query in queries)
+    response = client.get(reverse('shopping-list-pdf-file', kwargs={'shopping_list_id': shopping_list.pk}))
+    pdf_job = Job.objects.get(kind=Job.SHOPPING_LIST_PDF)
+    assert response.url == reverse('job-status', kwargs={'job_id': pdf_job.pk})
+    assert client.get(reverse('job-download', kwargs={'job_id': pdf_job.pk})).status_code == 404
+    run_next_job()
+    response = client.get(reverse('job-download', kwargs={'job_id': pdf_job.pk}))
+    assert response.status_code == 200
+    assert b''.join(response.streaming_content).startswith(b'%PDF')
+    Job.objects.filter(pk=pdf_job.pk).update(status=Job.RUNNING, date_modified=timezone.now() - timedelta(hours=1))
+    work(once=True, stale_timeout=0)
+    assert Job.objects.get(pk=pdf_job.pk).status == Job.DONE
+    response = client.get(reverse('shopping-list', kwargs={'plan_id': plan.pk}))
+    assert response.url == reverse('job-status', kwargs={'job_id': job.pk})
+    meal.meal_portions = 3
+    meal.save()
+    assert client.get(reverse('shopping-list', kwargs={'plan_id': plan.pk})).status_code == 302
+    assert Job.objects.filter(kind=Job.SHOPPING_LIST).count() == 2
+
+
+@pytest.mark.django_db
+def test_products_view_keyset_pagination(client, new_three_products):
+    """
+    Test ProductsView view pagination and filters.
+    :param client: Django Client() object.
+    :param new_three_products: Fixture that creates 3 Product model objects
+    :return: Assert if pages follow each other without gaps and filters are applied.
+    """
+    response = client.get('/products', {'page_size': 2})
+    assert response.context['products'] == new_three_products[:2]
+    next_page_query = response.context['next_page_query']
+    response = client.get(f'/products?{next_page_query}')
+    assert response.context['products'] == new_three_products[2:]
+    assert response.context['next_page_query'] is None
+    response = client.get('/products', {'q': 'MIę'})
+    assert [product.product_name for product in response.context['products']] == ['Mięso mielone']
+    category = new_three_products[0].category
+    response = client.get('/products', {'category': category.pk})
+    assert response.context['products'] == list(Product.objects.filter(category=category).order_by('pk'))
+
+
+@pytest.mark.django_db
+def test_plans_view_owner_filter(client, new_three_plans, new_user_login):
+    """
+    Test PlansView view owner filter.
+    :param client: Django Client() object.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_user_login: Fixture that creates and logs in new user.
+    :return: Assert if logged-in user gets only own plans.
+    """
+    own_plan = Plan.objects.create(plan_name='Własny', user=new_user_login, plan_length=7)
+    response = client.get('/plans')
+    assert response.context['plans'] == [own_plan]
+
+
+@pytest.mark.django_db
+def test_product_search(client, new_three_products):
+    """
+    Test ProductSearchView view.
+    :param client: Django Client() object.
+    :param new_three_products: Fixture that creates 3 Product model objects
+    :return: Assert if products are found by accent folded prefix and, on PostgreSQL, substring, prefix matches first,
+    and pages follow each other.
+    """
+    category = ProductCategory.objects.first()
+    Product.objects.create(product_name='Mielone mięso wołowe', proteins=20, carbohydrates=0, fats=15,
+                           category=category)
+    substring = connection.vendor == 'postgresql'
+    response = client.get(reverse('product-search'), {'q': 'mieso'})
+    assert response.status_code == 200
+    names = [product['product_name'] for product in response.json()['results']]
+    assert names == ['Mięso mielone', *(['Mielone mięso wołowe'] if substring else [])]
+    response = client.get(reverse('product-search'), {'q': 'mielone'})
+    assert [product['product_name'] for product in response.json()['results']] == \
+           ['Mielone mięso wołowe', *(['Mięso mielone'] if substring else [])]
+    response = client.get(reverse('product-search'), {'q': 'ser', 'limit': 1})
+    assert [product['product_name'] for product in response.json()['results']] == ['Ser']
+    response = client.get(reverse('product-search'), {'q': 'mieso', 'limit': 1})
+    pages = [response.json()['results']]
+    while response.json()['next']:
+        response = client.get(response.json()['next'])
+        pages.append(response.json()['results'])
+    assert [[product['product_name'] for product in page] for page in pages] == [[name] for name in names]
+    assert client.get(reverse('product-search'), {'q': ' '}).json()['results'] == []
+
+
+@pytest.mark.django_db
+def test_remote_select_widgets(client, new_three_recipes, new_user_login):
+    """
+    Test RecipeForm and MealForm remote widgets and RecipeSearchView view.
+    :param client: Django Client() object.
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :param new_user_login: Fixture that creates and logs in new user.
+    :return: Assert if only selected options are rendered and recipes are fetched page by page.
+    """
+    response = client.get(reverse('add-recipe'))
+    assert 'data-remote-url="/products/search"' in response.content.decode()
+    assert '<option value="' not in response.content.decode()
+    recipe = Recipe.objects.first()
+    form = RecipeForm(instance=recipe)
+    rendered = str(form['products'])
+    for product in Product.objects.all():
+        assert (f'value="{product.pk}"' in rendered) == recipe.products.filter(pk=product.pk).exists()
+    response = client.get(reverse('recipe-search'), {'page_size': 2})
+    assert [result['id'] for result in response.json()['results']] == [recipe.pk for recipe in new_three_recipes[:2]]
+    response = client.get(response.json()['next'])
+    assert [result['id'] for result in response.json()['results']] == [new_three_recipes[2].pk]
+    assert response.json()['next'] is None
+
+
+@pytest.mark.django_db
+def test_request_instrumentation(client, new_three_recipes, caplog, settings):
+    """
+    Test RequestInstrumentationMiddleware.
+    :param client: Django Client() object.
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :param caplog: Pytest log capturing fixture.
+    :param settings: Pytest-django settings fixture.
+    :return: Assert if Server-Timing header and log line are added and exceeded query budget and repeated queries
+    are reported.
+    """
+    settings.QUERY_BUDGETS = {'recipes': 1}
+    settings.N_PLUS_ONE_THRESHOLD = 2
+    with caplog.at_level(logging.INFO, logger='main_app.middleware'):
+        response = client.get(reverse('recipes'))
+    assert response.status_code == 200
+    assert response['Server-Timing'].startswith('total;dur=')
+    assert 'render;dur=' in response['Server-Timing']
+    metrics = json.loads(caplog.records[0].getMessage())
+    assert metrics['view'] == 'recipes'
+    assert metrics['queries'] >= 2
+    assert 'Query budget of recipes exceeded' in caplog.records[-1].getMessage()
+    assert query_shape('SELECT * FROM t WHERE id IN (%s, %s, %s)') == query_shape('SELECT * FROM t WHERE id IN (%s)')
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('backend', ['django.core.cache.backends.locmem.LocMemCache',
+                                     'django.core.cache.backends.filebased.FileBasedCache'])
+def test_fragment_caching(client, settings, tmp_path, new_three_plans, new_three_recipes, backend):
+    """
+    Test cached recipe rows and plan day blocks.
+    :param client: Django Client() object.
+    :param settings: Pytest-django settings fixture.
+    :param tmp_path: Pytest temporary directory fixture.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :param backend: Cache backend.
+    :return: Assert if cached fragments are reused, product edit invalidates only rows of recipes using the product,
+    product added to recipe updates its row and meal change updates plan day block.
+    """
+    settings.CACHES = {'default': {'BACKEND': backend, 'LOCATION': str(tmp_path)}}
+    plan = Plan.objects.last()
+    client.force_login(user=plan.user)
+    recipes = new_three_recipes
+    product = Product.objects.create(product_name='Kiełbasa', proteins=10, carbohydrates=1, fats=20,
+                                     category=ProductCategory.objects.first())
+    ProductsQuantities.objects.create(recipe_id=recipes[0], product_id=product, product_quantity=100)
+    with CaptureQueriesContext(connection) as cold:
+        first = client.get(reverse('recipes')).content
+    cold_count = len(cold)
+    with CaptureQueriesContext(connection) as warm:
+        second = client.get(reverse('recipes')).content
+    assert len(warm) < cold_count
+    assert first == second
+    recipe_ids = [recipe.pk for recipe in recipes]
+    versions = fragment_versions(RECIPE_ROW, recipe_ids)
+    product.fats = 40
+    product.save()
+    changed = fragment_versions(RECIPE_ROW, recipe_ids)
+    assert changed[recipes[0].pk] != versions[recipes[0].pk]
+    assert {pk: changed[pk] for pk in recipe_ids[1:]} == {pk: versions[pk] for pk in recipe_ids[1:]}
+    recipes[0].refresh_from_db()
+    assert f'{localize(recipes[0].recipe_calories)}kcal' in client.get(reverse('recipes')).content.decode()
+    recipes[1].products.add(product)
+    assert client.get(reverse('recipes')).content.decode().count(product.product_name) == 2
+
+    meal = Meal.objects.create(plan=plan, plan_day=1, meal=1, user=plan.user, meal_portions=1, recipes=recipes[0])
+    assert recipes[0].recipe_name in client.get(reverse('plan-details', args=[plan.pk])).content.decode()
+    Meal.objects.filter(pk=meal.pk).update(recipes=recipes[1])
+    content = client.get(reverse('plan-details', args=[plan.pk])).content.decode()
+    assert f'{meal.get_meal_display()}: {recipes[1].recipe_name}' in content
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get(reverse('plan-details', args=[plan.pk])).status_code == 200
+    assert not any('"main_app_meal"."meal_portions"' in query['sql'] for query in queries)
+
+
+@pytest.mark.django_db
+def test_conditional_get(client, new_three_plans, new_three_recipes):
+    """
+    Test conditional GET of plan, recipe and listing pages.
+    :param client: Django Client() object.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if unchanged pages are answered with 304 with one validator query and one user version query,
+    listing pages validators read only their page, and changes of meals, persons, products and recipes change the
+    validators.
+    """
+    plan = Plan.objects.last()
+    client.force_login(user=plan.user)
+    recipe = new_three_recipes[0]
+    Meal.objects.create(plan=plan, plan_day=1, meal=1, user=plan.user, meal_portions=1, recipes=recipe)
+    urls = {
+        'plan': reverse('plan-details', args=[plan.pk]),
+        'recipe': reverse('recipe-details', args=[recipe.pk]),
+        'recipes': reverse('recipes'),
+        'products': reverse('products'),
+        'persons': reverse('persons'),
+    }
+
+    def etags():
+        responses = {name: client.get(url) for name, url in urls.items()}
+        assert all(response.status_code == 200 for response in responses.values())
+        return {name: response['ETag'] for name, response in responses.items()}
+
+    response = client.get(urls['plan'])
+    assert 'private' in response['Cache-Control'] and 'no-cache' in response['Cache-Control']
+    with CaptureQueriesContext(connection) as queries:
+        not_modified = client.get(urls['plan'], HTTP_IF_NONE_MATCH=response['ETag'])
+    assert not_modified.status_code == 304
+    assert len(queries) == 4
+    assert client.get(urls['plan'], HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code == 304
+    assert client.get(urls['persons'], HTTP_IF_NONE_MATCH=client.get(urls['persons'])['ETag']).status_code == 304
+
+    before = etags()
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get(urls['products'], HTTP_IF_NONE_MATCH=before['products']).status_code == 304
+        assert client.get(urls['recipes'], HTTP_IF_NONE_MATCH=before['recipes']).status_code == 304
+    listing_queries = [query['sql'] for query in queries
+                       if '"main_app_product"' in query['sql'] or '"main_app_recipe"' in query['sql']]
+    assert len(listing_queries) == 2 and all('LIMIT' in sql and 'COUNT' not in sql for sql in listing_queries)
+    assert ConditionalGetMixin().get_validator(None) is None
+    upsert_meal(plan.pk, plan.user, 1, 1, recipe, Decimal('0.5'))
+    after = etags()
+    assert after['plan'] != before['plan']
+    assert after['recipe'] == before['recipe'] and after['recipes'] == before['recipes']
+    person = plan.persons.first()
+    person.calories += 100
+    person.save()
+    before, after = after, etags()
+    assert after['plan'] != before['plan'] and after['persons'] == before['persons']
+    Persons.objects.create(name='Ala', calories=2000, user=plan.user)
+    before, after = after, etags()
+    assert after['persons'] != before['persons']
+    product = recipe.products.first()
+    product.product_name = 'Nowa nazwa'
+    product.save()
+    before, after = after, etags()
+    assert after['plan'] != before['plan'] and after['recipe'] != before['recipe']
+    assert after['recipes'] != before['recipes'] and after['products'] != before['products']
+    new_three_recipes[2].delete()
+    before, after = after, etags()
+    assert after['recipes'] != before['recipes']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_views(new_three_plans, new_three_recipes):
+    """
+    Test async variants of read views.
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :return: Assert if concurrent requests of async views are answered like sync views, conditional requests are
+    supported and queries run in pool threads are recorded by the middleware.
+    """
+    plan = Plan.objects.last()
+    recipe = new_three_recipes[0]
+    Meal.objects.create(plan=plan, plan_day=1, meal=1, user=plan.user, meal_portions=1, recipes=recipe)
+    factory = AsyncRequestFactory()
+
+    def request(url, **headers):
+        view_request = factory.get(url, **headers)
+        view_request.user = plan.user
+        return view_request
+
+    views = [(async_views.products, reverse('products'), {}), (async_views.recipes, reverse('recipes'), {}),
+             (async_views.plans, reverse('plans'), {}), (async_views.persons, reverse('persons'), {}),
+             (async_views.plan_details, reverse('plan-details', args=[plan.pk]), {'plan_id': plan.pk}),
+             (async_views.recipe_details, reverse('recipe-details', args=[recipe.pk]), {'recipe_id': recipe.pk})]
+
+    async def requests():
+        return await asyncio.gather(*[view(request(url), **kwargs) for view, url, kwargs in views])
+
+    # First reads create fragment versions, concurrent writes would lock the in-memory SQLite test database.
+    for view, url, kwargs in views:
+        async_to_sync(view)(request(url), **kwargs)
+    responses = async_to_sync(requests)()
+    assert [response.status_code for response in responses] == [200] * len(views)
+    assert recipe.recipe_name in responses[1].content.decode()
+    assert recipe.recipe_name in responses[4].content.decode()
+    not_modified = async_to_sync(async_views.plan_details)(
+        request(views[4][1], **{'If-None-Match': responses[4]['ETag']}), plan_id=plan.pk)
+    assert not_modified.status_code == 304
+
+    middleware = RequestInstrumentationMiddleware(async_views.recipes)
+    instrumented = request(reverse('recipes'))
+    response = async_to_sync(middleware)(instrumented)
+    assert response.status_code == 200
+    assert instrumented.metrics.queries >= 1
+    assert instrumented.metrics.render_time > 0
+
+
+
+@pytest.mark.django_db(transaction=True)
+def test_replica_router(client, new_three_recipes, new_three_plans, replica_database, settings):
+    """
+    Test routing of reads to the replica database.
+    :param client: Django Client() object.
+    :param new_three_recipes: Fixture that creates 3 Recipes model objects
+    :param new_three_plans: Fixture that creates 3 Plans model objects
+    :param replica_database: Fixture that adds SQLite replica database.
+    :return: Assert if read-only views read from the replica, sessions which wrote read from primary until
+    stickiness window ends, writes and migrations go to primary and background .pdf files are rendered from the
+    replica only when their shopping list is replicated.
+    """
+    settings.REPLICA_STICKINESS = 60
+    cache.clear()
+    recipe = new_three_recipes[0]
+    plan = new_three_plans[0]
+    client.force_login(plan.user)
+    replica_database()
+    Recipe.objects.filter(pk=recipe.pk).update(recipe_name='Nowa nazwa')
+    content = client.get(reverse('recipes')).content.decode()
+    assert recipe.recipe_name in content and 'Nowa nazwa' not in content
+
+    client.post(reverse('add-person'), {'name': 'Osoba', 'calories': 2000})
+    assert 'Nowa nazwa' in client.get(reverse('recipes')).content.decode()
+    session = client.session
+    session['primary_reads_until'] = 0
+    session.save()
+    # Row fragments rendered from primary are fresher than the replica and are reused.
+    cache.clear()
+    assert 'Nowa nazwa' not in client.get(reverse('recipes')).content.decode()
+
+    router = ReplicaRouter()
+    with replica_reads():
+        assert reading_replica()
+        assert router.db_for_read(Recipe) == 'replica'
+        assert router.db_for_write(Recipe) == 'default'
+    assert router.db_for_read(Recipe) == 'default'
+    assert not router.allow_migrate('replica', 'main_app')
+    shopping_list = ShoppingList.objects.create(plan=plan)
+    with replica_reads(shopping_list):
+        assert not reading_replica()
+    replica_database()
+    with replica_reads(shopping_list):
+        assert reading_replica()
+
+
+@pytest.mark.django_db
+def test_generate_dataset():
+    """
+    Test generate_dataset management command.
+    :return: Assert if requested numbers of objects are created, the same seed gives the same data and derived
+    nutrition and plan day summaries are consistent.
+    """
+    options = {'categories': 3, 'products': 30, 'recipes': 20, 'users': 2, 'persons': 2, 'plans': 2,
+               'plan_length': 3, 'seed': 7, 'batch_size': 7, 'stdout': StringIO()}
+    call_command('generate_dataset', prefix='a', **options)
+    call_command('generate_dataset', prefix='b', **options)
+    assert Product.objects.filter(category__category_name__startswith='a ').count() == 30
+    assert Recipe.objects.filter(recipe_name__startswith='b ').count() == 20
+    assert Plan.objects.filter(user__username__startswith='a_user_').count() == 4
+
+    def content(prefix):
+        recipes = Recipe.objects.filter(recipe_name__startswith=f'{prefix} ').order_by('pk')
+        meals = Meal.objects.filter(user__username__startswith=f'{prefix}_').order_by('pk')
+        return (list(recipes.values_list('portions', 'calories', 'portion_fats')),
+                list(meals.values_list('plan_day', 'meal', 'meal_portions', 'recipes__calories')))
+    assert content('a') == content('b')
+    assert content('a')[1]
+    out = StringIO()
+    call_command('rebuild_nutrition', '--verify', stdout=out)
+    assert 'Found 0 mismatches' in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_benchmarks(settings):
+    """
+    Test benchmarks run and regression check.
+    :param settings: Pytest-django settings fixture.
+    :return: Assert if every benchmark is measured and grown query count or wall time is reported as regression.
+    """
+    settings.BACKGROUND_JOBS = False
+    call_command('generate_dataset', prefix='bench', categories=2, products=20, recipes=10, users=1, plans=1,
+                 plan_length=2, fill=1, stdout=StringIO())
+    results = run_benchmarks('bench', repeat=1)
+    assert len(results) == 7
+    assert all(result['queries'] > 0 and result['peak_kb'] > 0 for result in results.values())
+    assert compare_results(results, results, 0.25) == []
+    baseline = {'recipes_view': {**results['recipes_view'], 'queries': results['recipes_view']['queries'] - 1},
+                'plan_details_get': {**results['plan_details_get'], 'wall_ms': -10}}
+    regressions = compare_results(results, baseline, 0.25)
+    assert len(regressions) == 2
+    assert 'recipes_view' in regressions[0] and 'plan_details_get' in regressions[1]
+
+
+QUERY_BUDGET_DATASETS = {
+    'small': {'categories': 2, 'products': 10, 'recipes': 10, 'users': 1, 'persons': 2, 'plans': 1,
+              'plan_length': 2},
+    'large': {'categories': 10, 'products': 200, 'recipes': 1000, 'users': 2, 'persons': 5, 'plans': 2,
+              'plan_length': 14, 'fill': 1},
+}
+QUERY_BUDGET_REQUESTS = [
+    ('home', 'get'), ('login', 'get'), ('logout', 'get'), ('add-user', 'get'), ('products', 'get'),
+    ('product-search', 'get'), ('recipes', 'get'), ('recipe-search', 'get'), ('plans', 'get'), ('persons', 'get'),
+    ('add-recipe', 'get'), ('add-product', 'get'), ('add-person', 'get'), ('add-plan', 'get'),
+    ('delete-product', 'post'), ('delete-recipe', 'post'), ('delete-meal', 'post'), ('delete-plan', 'post'),
+    ('delete-person', 'post'), ('edit-product', 'get'), ('edit-recipe', 'get'), ('edit-person', 'get'),
+    ('edit-plan', 'get'), ('plan-details', 'get'), ('plan-details', 'post'), ('plan-auto-fill', 'post'),
+    ('plan-balance', 'post'), ('recipe-details', 'get'), ('shopping-list', 'get'), ('shopping-list-pdf', 'get'),
+    ('shopping-list-pdf-file', 'get'), ('fill-calories', 'get'), ('job-status', 'get'), ('job-download', 'get'),
+    ('shopping-list-details', 'get'),
+]
+
+
+def query_budget_request(prefix, url_name):
+    """
+    Create url and POST data of url_name request for objects generated by generate_dataset with prefix: the plan
+    with the most meals, its user, meal, recipe, recipe's product and plan's person.
+    :param prefix: Prefix of generate_dataset command run.
+    :param url_name: Url name from cookee/urls.py.
+    :return: Tuple of logged-in User model object, url and POST data.
+    """
+    subjects = benchmark_subjects(prefix)
+    plan, user, meal = subjects['plan'], subjects['user'], subjects['meal']
+    product = meal.recipes.products.first()
+    person = plan.persons.first()
+    args = {
+        'delete-product': [product.pk], 'edit-product': [product.pk],
+        'delete-recipe': [meal.recipes_id], 'edit-recipe': [meal.recipes_id], 'recipe-details': [meal.recipes_id],
+        'delete-meal': [meal.pk],
+        'delete-plan': [plan.pk], 'edit-plan': [plan.pk], 'plan-details': [plan.pk], 'plan-auto-fill': [plan.pk],
+        'plan-balance': [plan.pk], 'shopping-list': [plan.pk],
+        'delete-person': [person.pk], 'edit-person': [person.pk],
+        'fill-calories': [plan.pk, meal.plan_day, meal.meal],
+    }.get(url_name, [])
+    if url_name == 'shopping-list-pdf':
+        create_shopping_list(plan)
+    elif url_name in ('shopping-list-pdf-file', 'shopping-list-details'):
+        args = [create_shopping_list(plan).pk]
+    elif url_name in ('job-status', 'job-download'):
+        args = [enqueue_job(Job.SHOPPING_LIST_PDF, user, plan=plan).pk]
+        run_next_job()
+    data = {
+        'plan-details': {'plan_day': meal.plan_day, 'meal': meal.meal, 'recipes': meal.recipes_id,
+                         'meal_portions': '1.0'},
+        'plan-balance': {'strategy': BALANCE_EVEN},
+        'product-search': {'q': 'a'},
+        'recipe-search': {'q': 'a'},
+    }.get(url_name, {})
+    return user, reverse(url_name, args=args), data
+
+
+def request_queries(client, method, url, data):
+    """
+    Send request and capture its SQL queries. Fragment versions bumped while preparing data in the test transaction
+    are written first, as they would be at its commit.
+    :param client: Django Client() object.
+    :param method: 'get' or 'post'.
+    :param url: Requested url.
+    :param data: GET or POST data.
+    :return: List of executed SQL queries.
+    """
+    flush_versions()
+    with CaptureQueriesContext(connection) as queries:
+        response = getattr(client, method)(url, data)
+    assert response.status_code < 400, f'{method.upper()} {url} returned {response.status_code}'
+    return [query['sql'] for query in queries]
+
+
+def test_query_budget_requests_cover_all_urls():
+    """
+    Test if query budget tests cover every url of cookee/urls.py except the admin site.
+    :return: Assert if every url name has a query budget request.
+    """
+    assert {getattr(pattern, 'name', None) for pattern in urlpatterns} - {None} == \
+           {url_name for url_name, _ in QUERY_BUDGET_REQUESTS}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url_name, method', QUERY_BUDGET_REQUESTS)
+def test_query_budget(client, settings, url_name, method):
+    """
+    Test if number of queries of url request does not grow with data size and fits the url query budget. The same
+    request is sent for objects of small dataset and then, after adding large dataset, for its objects.
+    :param client: Django Client() object.
+    :param settings: Pytest-django settings fixture.
+    :param url_name: Url name from cookee/urls.py.
+    :param method: 'get' or 'post'.
+    :return: Assert if large dataset request runs no more queries than small dataset request and no more than query
+    budget, listing the queries otherwise, and if stored nutrition and plan day summaries stay consistent.
+    """
+    settings.BACKGROUND_JOBS = False
+    budget = settings.QUERY_BUDGETS.get(url_name, settings.QUERY_BUDGET)
+    counts = {}
+    for size, options in QUERY_BUDGET_DATASETS.items():
+        call_command('generate_dataset', prefix=size, stdout=StringIO(), **options)
+        user, url, data = query_budget_request(size, url_name)
+        client.force_login(user)
+        queries = request_queries(client, method, url, data)
+        counts[size] = len(queries)
+        listing = '\n'.join(queries)
+        assert len(queries) <= budget, \
+            f'{method.upper()} {url_name} ran {len(queries)} queries on {size} dataset, budget {budget}:\n{listing}'
+    assert counts['large'] <= counts['small'], \
+        f'{method.upper()} {url_name} queries grew from {counts["small"]} to {counts["large"]} with data ' \
+        f'size:\n{listing}'
+    out = StringIO()
+    call_command('rebuild_nutrition', '--verify', stdout=out)
+    assert 'Found 0 mismatches' in out.getvalue()
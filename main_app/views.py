@@ -1,25 +1,29 @@
-from django.shortcuts import redirect
+from django.shortcuts import redirect, get_object_or_404
 from django.template.response import TemplateResponse
 from django.views import View
-from main_app.models import Product, Recipe, Persons, Plan, Meal, ProductsQuantities, ShoppingList, \
-    ShoppingListProducts
+from main_app.models import ProductCategory, Product, Recipe, Persons, Plan, Meal, ProductsQuantities, ShoppingList, \
+    ShoppingListProducts, Job
 from main_app.forms import LoginForm, AddUserForm, ProductForm, RecipeForm, PlanForm, MealForm, \
-    QuantitiesForm, PersonsForm
+    QuantitiesForm, PersonsForm, PlanBalanceForm
 from django.views.generic import DeleteView, UpdateView
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import F
 import io
-from django.http import FileResponse
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from main_app.functions import calculate_days_calories
-
-pdfmetrics.registerFont(TTFont('Arial', 'arial.ttf'))
+from django.http import FileResponse, Http404, JsonResponse
+from django.conf import settings
+from django.db.models import prefetch_related_objects, F, Max, Count, OuterRef, Subquery
+from main_app.functions import calculate_days_nutrition, upsert_meal, create_shopping_list, balance_plan
+from main_app.pdf import shopping_list_pdf
+from main_app.jobs import enqueue_job, enqueue_plan_job
+from main_app.pagination import keyset_paginate
+from main_app.search import search_products, filter_prefix, normalize_search_text
+from main_app.planner import fill_plan
+from main_app.fragments import cached_fragments, RECIPE_ROW, PRODUCT_ROW, PLAN_DAY
+from main_app.routers import primary_reads
+from main_app.conditional import ConditionalGetMixin, queryset_validator, plan_validator, categories_version, \
+    page_validator
 
 
 class HomeView(View):
@@ -142,76 +146,271 @@ class AddUserView(View):
             return TemplateResponse(request, 'main_app/add_user_form.html', ctx)
 
 
-class ProductsView(View):
+class ProductsView(ConditionalGetMixin, View):
     """
-    Show all Product model objects.
+    Show Product model objects page by page, filtered by category and name prefix.
     """
+    replica_reads = True
 
-    def get(self, request):
+    @staticmethod
+    def get_queryset(request):
         """
-        Get all Product model object and send them to products.html in context
+        Get Product model objects filtered by 'category' and 'q' (name prefix) GET parameters.
         :param request: django request object
-        :return: redirects to products.html with context data
+        :return: Product model QuerySet
         """
         products = Product.objects.all()
-        ctx = {
-            'products': products
+        category = request.GET.get('category', '')
+        if category.isdigit():
+            products = products.filter(category_id=int(category))
+        if request.GET.get('q'):
+            # Normalized search_name prefix is served by its index, product_name__istartswith is not on PostgreSQL.
+            products = filter_prefix(products, 'search_name', normalize_search_text(request.GET['q']))
+        return products
+
+    @staticmethod
+    def get_context(request):
+        """
+        Get page of Product model objects filtered by 'category' and 'q' (name prefix) GET parameters.
+        :param request: django request object
+        :return: Context data for products.html
+        """
+        page = keyset_paginate(ProductsView.get_queryset(request), request)
+        return {
+            'products': page['objects'],
+            'product_rows': cached_fragments(PRODUCT_ROW, page['objects'], 'main_app/product_row.html', 'product'),
+            'next_page_query': page['next_page_query'],
+            'categories': ProductCategory.objects.order_by('category_name'),
+            'filters': request.GET
         }
-        return TemplateResponse(request, 'main_app/products.html', ctx)
 
+    def get(self, request):
+        """
+        Get page of Product model objects and send them to products.html in context
+        :param request: django request object
+        :return: redirects to products.html with context data
+        """
+        return TemplateResponse(request, 'main_app/products.html', self.get_context(request))
 
-class RecipesView(View):
+    def get_validator(self, request):
+        """
+        Get primary keys and modification datetimes of products of the requested page and categories version.
+        :param request: django request object
+        :return: Page validator
+        """
+        return page_validator(self.get_queryset(request), request, categories_version())
+
+
+class ProductSearchView(View):
     """
-    Show all Recipe model objects.
+    Autocomplete Product model objects by name.
     """
+    replica_reads = True
 
     def get(self, request):
         """
-        Get all Recipe model object and send them to recipes.html in context
+        Search Product model objects matching 'q' GET parameter with search_products, optionally only products of
+        recipe from 'recipe' GET parameter. Next page starts after cursor from 'stage', 'after_name' and 'after'
+        GET parameters.
         :param request: django request object
-        :return: redirect to recipes.html with context data
+        :return: JSON response with list of found products and url of next page
+        """
+        limit = request.GET.get('limit', '')
+        recipe = request.GET.get('recipe', '')
+        after = request.GET.get('after', '')
+        cursor = (request.GET.get('stage', ''), request.GET.get('after_name', ''), int(after)) if after.isdigit() \
+            else None
+        results, next_cursor = search_products(request.GET.get('q', ''), int(limit) if limit.isdigit() else None,
+                                               int(recipe) if recipe.isdigit() else None, cursor)
+        next_url = None
+        if next_cursor is not None:
+            query = request.GET.copy()
+            query['stage'], query['after_name'], query['after'] = next_cursor
+            next_url = f"{reverse('product-search')}?{query.urlencode()}"
+        return JsonResponse({'results': results, 'next': next_url})
+
+
+class RecipeSearchView(View):
+    """
+    Autocomplete Recipe model objects by name, page by page.
+    """
+    replica_reads = True
+
+    def get(self, request):
+        """
+        Get page of Recipe model objects with name starting with 'q' GET parameter.
+        :param request: django request object
+        :return: JSON response with list of found recipes and url of next page
+        """
+        recipes = Recipe.objects.only('id', 'recipe_name')
+        if request.GET.get('q'):
+            recipes = recipes.filter(recipe_name__istartswith=request.GET['q'])
+        page = keyset_paginate(recipes, request)
+        next_url = f"{reverse('recipe-search')}?{page['next_page_query']}" if page['next_page_query'] else None
+        return JsonResponse({
+            'results': [{'id': recipe.pk, 'recipe_name': recipe.recipe_name} for recipe in page['objects']],
+            'next': next_url
+        })
+
+
+class RecipesView(ConditionalGetMixin, View):
+    """
+    Show Recipe model objects page by page, filtered by name prefix.
+    """
+    replica_reads = True
+
+    @staticmethod
+    def get_queryset(request):
+        """
+        Get Recipe model objects filtered by 'q' (name prefix) GET parameter.
+        :param request: django request object
+        :return: Recipe model QuerySet
         """
         recipes = Recipe.objects.all()
-        ctx = {
-            'recipes': recipes
+        if request.GET.get('q'):
+            recipes = recipes.filter(recipe_name__istartswith=request.GET['q'])
+        return recipes
+
+    @staticmethod
+    def get_context(request):
+        """
+        Get page of Recipe model objects filtered by 'q' (name prefix) GET parameter.
+        :param request: django request object
+        :return: Context data for recipes.html
+        """
+        page = keyset_paginate(RecipesView.get_queryset(request), request)
+        return {
+            'recipes': page['objects'],
+            # Products are loaded only for recipes which rows are not cached.
+            'recipe_rows': cached_fragments(RECIPE_ROW, page['objects'], 'main_app/recipe_row.html', 'recipe',
+                                            prepare=lambda recipes: prefetch_related_objects(recipes, 'products')),
+            'next_page_query': page['next_page_query'],
+            'filters': request.GET
         }
-        return TemplateResponse(request, 'main_app/recipes.html', ctx)
+
+    def get(self, request):
+        """
+        Get page of Recipe model objects and send them to recipes.html in context
+        :param request: django request object
+        :return: redirect to recipes.html with context data
+        """
+        return TemplateResponse(request, 'main_app/recipes.html', self.get_context(request))
+
+    def get_validator(self, request):
+        """
+        Get primary keys and modification datetimes of recipes of the requested page. Recipe date_modified is set when
+        its ingredients or products, which recipe rows show, change.
+        :param request: django request object
+        :return: Page validator
+        """
+        return page_validator(self.get_queryset(request), request)
 
 
-class PlansView(View):
+class PlansView(ConditionalGetMixin, View):
     """
-    Show all Plan model objects
+    Show Plan model objects of logged-in user page by page, filtered by name prefix.
     """
+    replica_reads = True
+
+    @staticmethod
+    def get_queryset(request):
+        """
+        Get Plan model objects owned by logged-in user, filtered by 'q' (name prefix) GET parameter.
+        :param request: django request object
+        :return: Plan model QuerySet
+        """
+        if not request.user.is_authenticated:
+            return Plan.objects.none()
+        plans = Plan.objects.filter(user=request.user)
+        if request.GET.get('q'):
+            plans = plans.filter(plan_name__istartswith=request.GET['q'])
+        return plans
+
+    @staticmethod
+    def get_context(request):
+        """
+        Get page of Plan model objects owned by logged-in user, filtered by 'q' (name prefix) GET parameter.
+        :param request: django request object
+        :return: Context data for plans.html
+        """
+        page = keyset_paginate(PlansView.get_queryset(request), request)
+        return {
+            'plans': page['objects'],
+            'next_page_query': page['next_page_query'],
+            'filters': request.GET
+        }
 
     def get(self, request):
         """
-        Get all Plan model object and send them to plans.html in context
+        Get page of Plan model objects and send them to plans.html in context
         :param request: django request object
         :return: redirect to plans.html with context data
         """
-        plans = Plan.objects.all()
-        ctx = {
-            'plans': plans
-        }
-        return TemplateResponse(request, 'main_app/plans.html', ctx)
+        return TemplateResponse(request, 'main_app/plans.html', self.get_context(request))
+
+    def get_validator(self, request):
+        """
+        Get the latest modification and count of filtered Plan model objects.
+        :param request: django request object
+        :return: Page validator
+        """
+        return queryset_validator(self.get_queryset(request))
 
 
-class PersonsView(View):
+class PersonsView(ConditionalGetMixin, View):
     """
-    Show all Persons model objects
+    Show Persons model objects of logged-in user page by page, filtered by name prefix.
     """
+    replica_reads = True
+
+    @staticmethod
+    def get_queryset(request):
+        """
+        Get Persons model objects owned by logged-in user, filtered by 'q' (name prefix) GET parameter.
+        :param request: django request object
+        :return: Persons model QuerySet
+        """
+        if not request.user.is_authenticated:
+            return Persons.objects.none()
+        persons = Persons.objects.filter(user=request.user)
+        if request.GET.get('q'):
+            persons = persons.filter(name__istartswith=request.GET['q'])
+        return persons
+
+    @staticmethod
+    def get_context(request):
+        """
+        Get page of Persons model objects owned by logged-in user, filtered by 'q' (name prefix) GET parameter.
+        :param request: django request object
+        :return: Context data for persons.html
+        """
+        page = keyset_paginate(PersonsView.get_queryset(request), request)
+        return {
+            'persons': page['objects'],
+            'next_page_query': page['next_page_query'],
+            'filters': request.GET
+        }
 
     def get(self, request):
         """
-        Get all Persons model object and send them to persons.html in context
+        Get page of Persons model objects and send them to persons.html in context
         :param request: django request object
         :return: redirect to persons.html with context data
         """
-        persons = Persons.objects.all()
-        ctx = {
-            'persons': persons
-        }
-        return TemplateResponse(request, 'main_app/persons.html', ctx)
+        return TemplateResponse(request, 'main_app/persons.html', self.get_context(request))
+
+    def get_validator(self, request):
+        """
+        Get count and the latest primary key of filtered Persons model objects. Persons model has no modification
+        timestamp, edits change the user version instead. Anonymous users get an empty page, which is not
+        conditional.
+        :param request: django request object
+        :return: Page validator or None
+        """
+        if not request.user.is_authenticated:
+            return None
+        result = self.get_queryset(request).order_by().aggregate(count=Count('pk'), last=Max('pk'))
+        return None, [result['count'], result['last']]
 
 
 class PersonCreate(LoginRequiredMixin, View):
@@ -250,8 +449,7 @@ class PersonCreate(LoginRequiredMixin, View):
             calories = form.cleaned_data['calories']
             user = request.user
             Persons.objects.create(name=name, calories=calories, user=user)
-            persons = Persons.objects.all()
-            ctx['persons'] = persons
+            ctx.update(PersonsView.get_context(request))
             return TemplateResponse(request, 'main_app/persons.html', ctx)
         else:
             return TemplateResponse(request, 'main_app/add_person_form.html', ctx)
@@ -415,8 +613,7 @@ class ProductCreate(LoginRequiredMixin, View):
             category = form.cleaned_data['category']
             Product.objects.create(product_name=product_name, proteins=proteins, carbohydrates=carbohydrates,
                                    fats=fats, category=category)
-            products = Product.objects.all()
-            ctx['products'] = products
+            ctx.update(ProductsView.get_context(request))
             return TemplateResponse(request, 'main_app/products.html', ctx)
         else:
             return TemplateResponse(request, 'main_app/add_product_form.html', ctx)
@@ -496,8 +693,7 @@ class PlanCreate(LoginRequiredMixin, View):
             user = request.user
             instance = Plan.objects.create(plan_name=plan_name, plan_length=plan_length, user=user)
             instance.persons.set(persons)
-            plans = Plan.objects.all()
-            ctx['plans'] = plans
+            ctx.update(PlansView.get_context(request))
             return TemplateResponse(request, 'main_app/plans.html', ctx)
         else:
             return TemplateResponse(request, 'main_app/add_plan_form.html', ctx)
@@ -539,13 +735,51 @@ class PlanUpdate(LoginRequiredMixin, UpdateView):
         return reverse("plans")
 
 
-class PlanDetailsView(LoginRequiredMixin, View):
+class PlanDetailsView(LoginRequiredMixin, ConditionalGetMixin, View):
     """
     Add and update Meal model object related to chosen Plan model object. Require logged-in user.
     """
+    replica_reads = True
     login_url = '/login'
     success_url = '/add_plan'
 
+    @staticmethod
+    def get_context(form, plan, days_nutrition):
+        """
+        Create context data for plan_details.html.
+        :param form: MealForm object.
+        :param plan: Plan model object.
+        :param days_nutrition: Plan days nutrients amount list.
+        :return: Context data with MealForm and plan and meal objects data.
+        """
+        # Persons are listed and summed by plan_calories in the template, prefetching loads them once.
+        prefetch_related_objects([plan], 'persons')
+        days = [{'day': day, 'calories': float(nutrition['calories']), 'meals': []}
+                for day, nutrition in enumerate(days_nutrition, start=1)]
+
+        def load_meals(missing_days):
+            # Meals are loaded only for days which blocks are not cached.
+            blocks = {day['day']: day for day in missing_days}
+            for meal in plan.meal_set.filter(plan_day__in=blocks).select_related('recipes'). \
+                    order_by(F('meal').asc(nulls_first=True)):
+                blocks[meal.plan_day]['meals'].append(meal)
+
+        return {
+            'form': form,
+            'plan': plan,
+            'persons': plan.persons.all(),
+            # Lazy queryset, not used by plan_details.html and not queried unless read.
+            'meals': plan.meal_set.all(),
+            'days': days,
+            'day_blocks': cached_fragments(PLAN_DAY, days, 'main_app/plan_day.html', 'day',
+                                           key=lambda day: f'{plan.pk}:{day["day"]}', prepare=load_meals,
+                                           context={'plan': plan}),
+            'balance_form': PlanBalanceForm(),
+            'plan_days': [day for day in range(1, plan.plan_length + 1)],
+            'days_calories': [day['calories'] for day in days],
+            'days_nutrition': days_nutrition
+        }
+
     def get(self, request, plan_id):
         """
         Create context data for plan_details.html. Redirect to plan_details.html.
@@ -555,77 +789,42 @@ class PlanDetailsView(LoginRequiredMixin, View):
         """
         form = MealForm()
         plan = Plan.objects.get(pk=plan_id)
-        meals = plan.meal_set.all()
-        persons = plan.persons.all()
-        plan_days = [day for day in range(1, plan.plan_length + 1)]
-        days_calories_list = calculate_days_calories(plan)
-        ctx = {
-            'form': form,
-            'plan': plan,
-            'persons': persons,
-            'meals': meals,
-            'plan_days': plan_days,
-            'days_calories': days_calories_list
-        }
+        ctx = self.get_context(form, plan, calculate_days_nutrition(plan))
         return TemplateResponse(request, 'main_app/plan_details.html', ctx)
 
+    def get_validator(self, request, plan_id):
+        """
+        Get plan validator.
+        :param request: Django request object.
+        :param plan_id: Plan model object primary key.
+        :return: Page validator or None if plan does not exist.
+        """
+        return plan_validator(plan_id)
+
     def post(self, request, plan_id):
         """
-        Create context data for plan_details.html. Validate MealForm. If MealForm is valid create or update requested
-        Meal model object. If MealForm is not valid redirect to plan_details.html.
-        If Meal model object update check for calories amount. If new Meal model object calories amount exceed
-        the calories left for use for plan_day add error message to context. If opposite update requested Meal model
-        object.
-        If Meal model object create check for calories amount. If new Meal model object calories amount exceed
-        the calories left for use for plan_day add error message to context. If opposite create requested Meal model
-        object.
+        Validate MealForm. If MealForm is valid create or update requested Meal model object with upsert_meal.
+        If new Meal model object calories amount exceed the calories left for use for plan_day add error message
+        to context. If MealForm is not valid redirect to plan_details.html.
         :param request: Django request object
         :param plan_id: Plan model object primary key to which updated and created Meal objects are related.
         :return: Redirect to plan_details.html with MealForm and plan and meal objects data and optionally error message
         in context.
         """
         form = MealForm(request.POST)
-        plan = Plan.objects.get(pk=plan_id)
-        persons = plan.persons.all()
-        meals = plan.meal_set.all()
-        plan_days = [day for day in range(1, plan.plan_length + 1)]
-        days_calories_list = calculate_days_calories(plan)
-        ctx = {
-            'form': form,
-            'plan': plan,
-            'persons': persons,
-            'meals': meals,
-            'plan_days': plan_days,
-            'days_calories': days_calories_list
-        }
         if form.is_valid():
-            plan_day = form.cleaned_data['plan_day']
-            meal = form.cleaned_data['meal']
-            recipes = form.cleaned_data['recipes']
-            portions = form.cleaned_data['meal_portions']
-            user = request.user
-            meal_object = Meal.objects.filter(user=user, plan_name=plan, plan_day=plan_day, meal=meal)
-            meal_calories = recipes.portion_calories * portions
-            if meal_object and ((plan.plan_calories - calculate_days_calories(plan)[plan_day - 1] > meal_calories) or
-                                (plan.plan_calories - calculate_days_calories(plan)[plan_day - 1] < meal_calories <
-                                 meal_object[0].meal_calories)):
-                meal_object.update(user=user, plan_day=plan_day, meal=meal, recipes=recipes, meal_portions=portions)
-                days_calories_list = calculate_days_calories(plan)
-                ctx['days_calories'] = days_calories_list
-            elif meal_object and plan.plan_calories - calculate_days_calories(plan)[
-                plan_day - 1] < meal_calories and meal_calories > meal_object[0].meal_calories:
-                ctx['message'] = 'Przekroczono limit kalorii'
-            elif not meal_object and plan.plan_calories - calculate_days_calories(plan)[plan_day - 1] > meal_calories:
-                instance = Meal.objects.create(user=user, plan_day=plan_day, meal=meal, recipes=recipes,
-                                               meal_portions=portions)
-                instance.plan_name.add(plan_id)
-                days_calories_list = calculate_days_calories(plan)
-                ctx['days_calories'] = days_calories_list
-            elif not meal_object and plan.plan_calories - calculate_days_calories(plan)[plan_day - 1] < meal_calories:
-                ctx['message'] = 'Przekroczono limit kalorii'
-            return TemplateResponse(request, 'main_app/plan_details.html', ctx)
+            plan, days_nutrition, message = upsert_meal(plan_id, request.user,
+                                                        plan_day=form.cleaned_data['plan_day'],
+                                                        meal=form.cleaned_data['meal'],
+                                                        recipe=form.cleaned_data['recipes'],
+                                                        meal_portions=form.cleaned_data['meal_portions'])
+            ctx = self.get_context(form, plan, days_nutrition)
+            if message:
+                ctx['message'] = message
         else:
-            return TemplateResponse(request, 'main_app/plan_details.html', ctx)
+            plan = Plan.objects.get(pk=plan_id)
+            ctx = self.get_context(form, plan, calculate_days_nutrition(plan))
+        return TemplateResponse(request, 'main_app/plan_details.html', ctx)
 
 
 class MealDelete(LoginRequiredMixin, DeleteView):
@@ -641,9 +840,7 @@ class MealDelete(LoginRequiredMixin, DeleteView):
         Define Url to redirect after Meal model object deletion
         :return: Url to redirect after update
         """
-        meal = Meal.objects.get(pk=self.kwargs['pk']).pk
-        plan = Plan.objects.get(meal=meal)
-        return f'/plan_details/{plan.pk}'
+        return f'/plan_details/{self.object.plan_id}'
 
     def get_context_data(self, **kwargs):
         """
@@ -651,8 +848,7 @@ class MealDelete(LoginRequiredMixin, DeleteView):
         :param kwargs: Built-in parameter
         :return: Context data with Plan model object
         """
-        meal = Meal.objects.get(pk=self.kwargs['pk']).pk
-        return {'plan': Plan.objects.get(meal=meal)}
+        return {'plan': self.object.plan}
 
     def get_object(self, queryset=None):
         """
@@ -660,14 +856,15 @@ class MealDelete(LoginRequiredMixin, DeleteView):
         :param queryset: Built-in parameter
         :return: Meal model object to delete
         """
-        return Meal.objects.get(pk=self.kwargs['pk'])
+        return Meal.objects.select_related('plan').get(pk=self.kwargs['pk'])
 
 
-class RecipeDetailsView(LoginRequiredMixin, View):
+class RecipeDetailsView(LoginRequiredMixin, ConditionalGetMixin, View):
     """
     Set products quantities in ProductQuantities model object related to chosen Recipe model object.
     Require logged-in user.
     """
+    replica_reads = True
     login_url = '/login'
     success_url = '/recipes'
 
@@ -682,8 +879,9 @@ class RecipeDetailsView(LoginRequiredMixin, View):
         form = QuantitiesForm()
         recipe = Recipe.objects.get(pk=recipe_id)
         recipe_products = recipe.products.all()
-        recipe_products_quantities = recipe.productsquantities_set.all()
+        recipe_products_quantities = recipe.productsquantities_set.select_related('product_id')
         form.fields['product_id'].queryset = recipe_products
+        form.fields['product_id'].widget.attrs['data-remote-url'] = f"{reverse('product-search')}?recipe={recipe_id}"
         if recipe_products_quantities:
             form.initial = {'product_id': recipe_products_quantities[0]}
         ctx = {
@@ -693,6 +891,22 @@ class RecipeDetailsView(LoginRequiredMixin, View):
         }
         return TemplateResponse(request, 'main_app/recipe_details.html', ctx)
 
+    def get_validator(self, request, recipe_id):
+        """
+        Get recipe date_modified, set whenever its ingredients change, and the latest modification of its products
+        with one query.
+        :param request: Django request object.
+        :param recipe_id: Recipe model object primary key.
+        :return: Page validator or None if recipe does not exist.
+        """
+        products_modified = ProductsQuantities.objects.filter(recipe_id=OuterRef('pk')).order_by(). \
+            values('recipe_id').annotate(modified=Max('product_id__date_modified')).values('modified')
+        row = Recipe.objects.filter(pk=recipe_id).annotate(products_modified=Subquery(products_modified)). \
+            values_list('date_modified', 'products_modified').first()
+        if row is None:
+            return None
+        return max(filter(None, row)), []
+
     def post(self, request, recipe_id):
         """
         Create context data for recipe_details.html. Validate QuantitiesForm. If MealForm is valid update requested
@@ -705,8 +919,9 @@ class RecipeDetailsView(LoginRequiredMixin, View):
         form = QuantitiesForm(request.POST)
         recipe = Recipe.objects.get(pk=recipe_id)
         recipe_products = recipe.products.all()
-        recipe_products_quantities = recipe.productsquantities_set.all()
+        recipe_products_quantities = recipe.productsquantities_set.select_related('product_id')
         form.fields['product_id'].queryset = recipe_products
+        form.fields['product_id'].widget.attrs['data-remote-url'] = f"{reverse('product-search')}?recipe={recipe_id}"
         if recipe_products:
             form.initial = {'product_id': recipe_products[0]}
         ctx = {
@@ -715,102 +930,228 @@ class RecipeDetailsView(LoginRequiredMixin, View):
             'products': recipe_products_quantities
         }
         if form.is_valid():
-            recipe = Recipe.objects.get(pk=recipe_id)
             product = form.cleaned_data['product_id']
             product_quantity = form.cleaned_data['product_quantity']
             ProductsQuantities.objects.filter(recipe_id=recipe, product_id=product). \
                 update(product_quantity=product_quantity)
-            return TemplateResponse(request, 'main_app/recipe_details.html', ctx)
-        else:
-            return TemplateResponse(request, 'main_app/recipe_details.html', ctx)
+            Recipe.objects.filter(pk=recipe_id).refresh_nutrition()
+        ctx['recipe'] = Recipe.objects.get(pk=recipe_id)
+        return TemplateResponse(request, 'main_app/recipe_details.html', ctx)
 
 
-class ShoppingListCreate(LoginRequiredMixin, View):
+class ShoppingListCreate(LoginRequiredMixin, ConditionalGetMixin, View):
     """
-    Create ShoppingList model object related to chosen Plan model object. Create and update ShoppingListProducts model
-    objects related to created ShoppingList model object. Require logged-in user.
+    Create ShoppingList model object related to chosen Plan model object with ShoppingListProducts model objects
+    aggregated per product. Require logged-in user.
     """
     login_url = '/login'
     success_url = '/plans'
 
     def get(self, request, plan_id):
         """
-        Create ShoppingList model object for related Plan model object. Set (create/update) ShoppingListProducts model
-        object for created ShoppingList model object. Create context data for shopping_list.html. Redirect to
-        shopping_list.html.
+        Create ShoppingList model object for related Plan model object with create_shopping_list. Create context data
+        for shopping_list.html. Redirect to shopping_list.html. If BACKGROUND_JOBS setting is on, enqueue the list
+        creation, unless a job of the user for the plan is queued, running or done since the plan last changed, and
+        redirect to its job status instead.
         :param request: Django request object.
         :param plan_id: Plan model object primary key to which created ShoppingList model objects are related.
         :return: Redirect to shopping_list.html with QuantitiesForm with shopping list products and products categories
         in context data.
         """
         plan = Plan.objects.get(pk=plan_id)
-        meals = plan.meal_set.all()
-        ShoppingList.objects.create(name=f'Lista zakupów plan {plan.plan_name}', plan=plan)
-        shopping_list = ShoppingList.objects.latest('date_created')
-        for meal in meals:
-            for product in meal.recipes.productsquantities_set.all():
-                if not ShoppingListProducts.objects.filter(shopping_list=shopping_list.id,
-                                                           product=product.product_id):
-                    ShoppingListProducts.objects.create(shopping_list=shopping_list,
-                                                        product_quantity=
-                                                        product.one_portion_product_quantity * meal.meal_portions,
-                                                        product=product.product_id)
-                else:
-                    ShoppingListProducts.objects.filter(shopping_list=shopping_list.id,
-                                                        product=product.product_id). \
-                        update(product_quantity=F('product_quantity') + product.
-                               one_portion_product_quantity * meal.meal_portions)
-        shopping_list_products = ShoppingListProducts.objects.filter(shopping_list=shopping_list)
+        if settings.BACKGROUND_JOBS:
+            validator = plan_validator(plan.pk)
+            job = enqueue_plan_job(Job.SHOPPING_LIST, request.user, plan, done_after=validator and validator[0])
+            return redirect('job-status', job_id=job.pk)
+        shopping_list = create_shopping_list(plan)
+        return TemplateResponse(request, 'main_app/shopping_list.html', self.get_context(shopping_list))
+
+    @staticmethod
+    def get_context(shopping_list):
+        """
+        Create context data for shopping_list.html.
+        :param shopping_list: ShoppingList model object.
+        :return: Context data with shopping list products ordered by category and product name and their categories.
+        """
+        shopping_list_products = ShoppingListProducts.objects.filter(shopping_list=shopping_list). \
+            select_related('product__category').order_by('product__category__category_name', 'product__product_name')
         product_categories = []
         for product in shopping_list_products:
             if product.product.category.category_name not in product_categories:
                 product_categories.append(product.product.category.category_name)
-        ctx = {
+        return {
             'shopping_list': shopping_list_products,
+            'shopping_list_id': shopping_list.pk,
             'categories': product_categories
         }
-        return TemplateResponse(request, 'main_app/shopping_list.html', ctx)
+
+    def get_validator(self, request, plan_id):
+        """
+        Get plan validator and categories version. Shopping list is reused until its plan changes, so a not modified
+        page still links an existing list. Requests redirected to a background job are not conditional.
+        :param request: Django request object.
+        :param plan_id: Plan model object primary key.
+        :return: Page validator or None.
+        """
+        if settings.BACKGROUND_JOBS:
+            return None
+        validator = plan_validator(plan_id)
+        if validator is None:
+            return None
+        modified, versions = validator
+        return modified, [*versions, categories_version()]
+
+
+class ShoppingListDetails(LoginRequiredMixin, View):
+    """
+    Show existing ShoppingList model object of logged-in user plan, e.g. created by a background job.
+    """
+    login_url = '/login'
+
+    def get(self, request, shopping_list_id):
+        """
+        Create context data for shopping_list.html without creating the list again.
+        :param request: Django request object.
+        :param shopping_list_id: ShoppingList model object primary key.
+        :return: Redirect to shopping_list.html with shopping list products and products categories in context data.
+        """
+        shopping_list = get_object_or_404(ShoppingList, pk=shopping_list_id, plan__user=request.user)
+        return TemplateResponse(request, 'main_app/shopping_list.html', ShoppingListCreate.get_context(shopping_list))
 
 
 class ShoppingListPdf(LoginRequiredMixin, View):
     """
-    Generate .pdf file with ShoppingListProducts related to last created ShoppingList model object and download it.
+    Download .pdf file with ShoppingListProducts related to chosen ShoppingList model object, or to last created
+    ShoppingList model object of logged-in user plans if none is chosen.
     """
+    replica_reads = True
     login_url = '/login'
     success_url = '/plans'
 
-    def get(self, request):
+    def get(self, request, shopping_list_id=None):
         """
-        Create string with ShoppingListProducts model object data related to last created ShoppingList model object.
-        Create .pdf file and save created string to it.
+        Get .pdf file of ShoppingList model object with shopping_list_pdf. Rendered files are cached by shopping
+        list fingerprint. If BACKGROUND_JOBS setting is on, enqueue the rendering and redirect to its job status
+        instead. The shopping list is read from the replica, if it is configured and the session did not write
+        recently.
         :param request: Django request object
+        :param shopping_list_id: ShoppingList model object primary key.
         :return: Download 'Lista zakupów.pdf'.
         """
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer)
-        p.setFont('Arial', 14)
-        textobject = p.beginText(2 * cm, 29.7 * cm - 2 * cm)
-        shopping_list = ShoppingList.objects.latest('date_created')
-        shopping_list_products = ShoppingListProducts.objects.filter(shopping_list=shopping_list)
-        product_categories = []
-        for product in shopping_list_products:
-            if product.product.category.category_name not in product_categories:
-                product_categories.append(product.product.category.category_name)
-        pdf_string = ''
-        for category in product_categories:
-            pdf_string += f'{category}\n'
-            for product in shopping_list_products:
-                if product.product.category.category_name == category:
-                    pdf_string += f'{product.product.product_name}, {product.product_quantity}g\n'
-        for line in pdf_string.splitlines(False):
-            textobject.textLine(line.rstrip())
-        p.drawText(textobject)
-        p.showPage()
-        p.save()
-        buffer.seek(0)
+        if shopping_list_id is None:
+            shopping_list = ShoppingList.objects.filter(plan__user=request.user).order_by('-date_created').first()
+            if shopping_list is None:
+                raise Http404('Brak listy zakupów')
+        else:
+            shopping_list = get_object_or_404(ShoppingList, pk=shopping_list_id, plan__user=request.user)
+        if settings.BACKGROUND_JOBS:
+            # Job just enqueued by a concurrent request may not be replicated yet.
+            with primary_reads():
+                job = Job.objects.filter(kind=Job.SHOPPING_LIST_PDF, shopping_list=shopping_list, user=request.user). \
+                    exclude(status=Job.FAILED).order_by('-date_created').first()
+                if job is None:
+                    job = enqueue_job(Job.SHOPPING_LIST_PDF, request.user, shopping_list=shopping_list)
+            return redirect('job-status', job_id=job.pk)
+        buffer = io.BytesIO(shopping_list_pdf(shopping_list))
+        return FileResponse(buffer, as_attachment=True, filename='Lista zakupów.pdf')
+
+
+class JobStatusView(LoginRequiredMixin, View):
+    """
+    Show status of Job model object requested by logged-in user.
+    """
+    login_url = '/login'
+
+    def get(self, request, job_id):
+        """
+        Create context data for job_status.html, or JSON data if requested.
+        :param request: Django request object.
+        :param job_id: Job model object primary key.
+        :return: Redirect to job_status.html with job in context or JSON response with job status.
+        """
+        job = get_object_or_404(Job.objects.defer('result'), pk=job_id, user=request.user)
+        if 'application/json' in request.headers.get('Accept', ''):
+            return JsonResponse({
+                'id': job.pk,
+                'kind': job.kind,
+                'status': job.status,
+                'error': job.error,
+                'download_url': reverse('job-download', kwargs={'job_id': job.pk}) if job.status == Job.DONE else None
+            })
+        return TemplateResponse(request, 'main_app/job_status.html', {'job': job})
+
+
+class JobDownloadView(LoginRequiredMixin, View):
+    """
+    Download result of finished Job model object requested by logged-in user.
+    """
+    login_url = '/login'
+
+    def get(self, request, job_id):
+        """
+        Download .pdf file created by the job, or redirect to created shopping list.
+        :param request: Django request object.
+        :param job_id: Job model object primary key.
+        :return: Download 'Lista zakupów.pdf' or redirect to shopping list created by the job.
+        """
+        job = get_object_or_404(Job, pk=job_id, user=request.user, status=Job.DONE)
+        if job.kind == Job.SHOPPING_LIST:
+            return redirect('shopping-list-details', shopping_list_id=job.shopping_list_id)
+        buffer = io.BytesIO(job.result)
         return FileResponse(buffer, as_attachment=True, filename='Lista zakupów.pdf')
 
 
+class PlanAutoFill(LoginRequiredMixin, View):
+    """
+    Fill every empty slot of chosen Plan model object with a recipe and portions hitting plan day calories.
+    Require logged-in user.
+    """
+    login_url = '/login'
+
+    def post(self, request, plan_id):
+        """
+        Fill empty plan slots with fill_plan. Add message with number of created meals or plan days which calories
+        could not be matched to context.
+        :param request: Django request object.
+        :param plan_id: Plan model object primary key.
+        :return: Redirect to plan_details.html with MealForm, plan and meal objects data and message in context.
+        """
+        meals, days_out_of_tolerance = fill_plan(plan_id, request.user)
+        plan = Plan.objects.get(pk=plan_id)
+        ctx = PlanDetailsView.get_context(MealForm(), plan, calculate_days_nutrition(plan))
+        if days_out_of_tolerance:
+            ctx['message'] = f'Dodano posiłków: {len(meals)}. Nie udało się dopasować kalorii w dniach: ' \
+                             f'{", ".join(str(day) for day in days_out_of_tolerance)}'
+        else:
+            ctx['message'] = f'Dodano posiłków: {len(meals)}'
+        return TemplateResponse(request, 'main_app/plan_details.html', ctx)
+
+
+class PlanBalance(LoginRequiredMixin, View):
+    """
+    Change portions of all chosen Plan model object meals to hit plan day calories in every plan day.
+    Require logged-in user.
+    """
+    login_url = '/login'
+
+    def post(self, request, plan_id):
+        """
+        Validate PlanBalanceForm and balance plan days calories with balance_plan in one batch.
+        :param request: Django request object.
+        :param plan_id: Plan model object primary key.
+        :return: Redirect to plan_details.html with MealForm, plan and meal objects data and message in context.
+        """
+        form = PlanBalanceForm(request.POST)
+        message = 'Nieprawidłowy sposób rozłożenia kalorii'
+        if form.is_valid():
+            updated = balance_plan(plan_id, form.cleaned_data['strategy'])
+            message = f'Zmieniono porcje posiłków: {len(updated)}'
+        plan = Plan.objects.get(pk=plan_id)
+        ctx = PlanDetailsView.get_context(MealForm(), plan, calculate_days_nutrition(plan))
+        ctx['message'] = message
+        return TemplateResponse(request, 'main_app/plan_details.html', ctx)
+
+
 class PlanDayCaloriesCompletion(LoginRequiredMixin, View):
     """
     Update Meal object portions parameter to fulfill plan day calories.
@@ -828,13 +1169,11 @@ class PlanDayCaloriesCompletion(LoginRequiredMixin, View):
         :param day_meal: Updated Meal model meal parameter
         :return: Redirect to plan_details/<plan_id>.
         """
-        plan_calories = Plan.objects.get(pk=plan_id).plan_calories
-        plan_meals = Plan.objects.get(pk=plan_id).meal_set.filter(plan_day=plan_day)
-        day_calories = 0
-        for meal in plan_meals:
-            day_calories += meal.meal_calories
-        calories_to_fill = plan_calories - day_calories
-        meal_to_fill = Meal.objects.get(plan_name=plan_id, plan_day=plan_day, meal=day_meal)
+        plan = Plan.objects.get(pk=plan_id)
+        day_calories = calculate_days_nutrition(plan)[plan_day - 1]['calories']
+        calories_to_fill = plan.plan_calories - day_calories
+        meal_to_fill = Meal.objects.select_related('recipes'). \
+            get(plan=plan_id, plan_day=plan_day, meal=day_meal)
         meal_portion_calories = meal_to_fill.recipes.portion_calories
         portions_to_fill_quantity = round(calories_to_fill / meal_portion_calories, 1)
         meal_to_fill.meal_portions += portions_to_fill_quantity
@@ -0,0 +1,54 @@
+from django import forms
+from django.urls import reverse
+
+
+class RemoteSelect(forms.Select):
+    """
+    Select widget rendering only selected options. Other options are fetched by remote_select.js from JSON search
+    endpoint, so rendering does not depend on the size of field queryset.
+    """
+
+    class Media:
+        js = ('js/remote_select.js',)
+
+    def __init__(self, url_name, label_field, attrs=None):
+        """
+        :param url_name: Name of url returning JSON with 'results' list of found objects.
+        :param label_field: Key of found object label in JSON results.
+        :param attrs: Widget HTML attributes.
+        """
+        super().__init__(attrs)
+        self.url_name = url_name
+        self.label_field = label_field
+
+    def get_context(self, name, value, attrs):
+        """
+        Add search endpoint url and label key to widget HTML attributes.
+        """
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs'].setdefault('data-remote-url', reverse(self.url_name))
+        context['widget']['attrs']['data-remote-label'] = self.label_field
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        """
+        Create options only for selected values, loaded with one primary key lookup.
+        """
+        selected_values = [str(option_value) for option_value in value if str(option_value).isdigit()]
+        groups = []
+        if not self.allow_multiple_selected:
+            groups.append((None, [self.create_option(name, '', '---------', not selected_values, 0, attrs=attrs)], 0))
+        if selected_values:
+            field = self.choices.field
+            for index, obj in enumerate(self.choices.queryset.filter(pk__in=selected_values), start=len(groups)):
+                option = self.create_option(name, field.prepare_value(obj), field.label_from_instance(obj), True,
+                                            index, attrs=attrs)
+                groups.append((None, [option], index))
+        return groups
+
+
+class RemoteSelectMultiple(RemoteSelect, forms.SelectMultiple):
+    """
+    Multiple select widget rendering only selected options, fetching other options from JSON search endpoint.
+    """
+    allow_multiple_selected = True